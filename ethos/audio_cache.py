@@ -0,0 +1,238 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Set
+
+import httpx
+
+EXTENSIONS = {"audio/mp4": ".m4a", "audio/webm": ".webm", "audio/mpeg": ".mp3", "audio/ogg": ".ogg"}
+
+
+class AudioCache:
+    """
+    Size-capped on-disk cache of the audio of frequently played tracks.
+
+    Every play is counted; once a streamed track reaches `min_plays` its stream is
+    downloaded in the background. Downloads go to a temporary file that is checked
+    against the announced length, fsynced and atomically renamed into place, and
+    the file's size, mtime and SHA-256 are recorded. Every use checks the size and
+    mtime; the first use in a session also re-hashes the file on the background
+    thread, and a corrupt file is dropped.
+
+    When the cache grows past `max_bytes`, files are evicted least frequently
+    used first (`policy="lfu"`, ties broken by recency) or least recently used
+    first (`policy="lru"`).
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        max_bytes: int = 1024 * 1024 * 1024,
+        min_plays: int = 3,
+        policy: str = "lfu",
+        transport: Optional[httpx.BaseTransport] = None,
+        timeout: float = 60.0,
+    ):
+        if policy not in ("lfu", "lru"):
+            raise ValueError("policy must be 'lfu' or 'lru'")
+        self.cache_dir = cache_dir or Path.home() / ".ethos" / "cache" / "audio"
+        self.max_bytes = max_bytes
+        self.min_plays = min_plays
+        self.policy = policy
+        self.transport = transport
+        self.timeout = timeout
+        self.stats = {"hits": 0, "downloads": 0, "failed": 0, "evictions": 0, "corrupt": 0}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ethos-audio-cache")
+        self._pending: Set[str] = set()
+        self._verified: Set[str] = set()
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+
+    @staticmethod
+    def normalize(track: str) -> str:
+        return re.sub(r"\s+", " ", track).strip().lower()
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._db is None:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                self._db = sqlite3.connect(self.cache_dir / "index.db", check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS audio_cache ("
+                    "key TEXT PRIMARY KEY, url TEXT, file TEXT, size INTEGER, mtime INTEGER, sha256 TEXT, "
+                    "plays INTEGER NOT NULL DEFAULT 0, last_used REAL NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS audio_cache_url ON audio_cache (url)")
+            return self._db
+
+    def record_play(self, track: str, source: str, headers: Optional[dict] = None) -> Optional[Future]:
+        """
+        Count a play, and start caching the track once it is played often enough.
+
+        Args:
+        - track (str): The track name, e.g. "Blinding Lights by The Weeknd".
+        - source (str): What is being played, a stream URL or a local path.
+        - headers (dict): HTTP headers the stream has to be requested with (User-Agent etc.).
+
+        Returns:
+        - Future: The background download if one was started, else None.
+        """
+        key = self.normalize(track)
+        streamed = source.startswith(("http://", "https://"))
+        with self._lock, self.db as db:
+            db.execute(
+                "INSERT INTO audio_cache (key, url, plays, last_used) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT (key) DO UPDATE SET plays = plays + 1, last_used = excluded.last_used, "
+                "url = COALESCE(excluded.url, url)",
+                (key, source if streamed else None, time.time()),
+            )
+            plays, cached = db.execute("SELECT plays, file FROM audio_cache WHERE key = ?", (key,)).fetchone()
+            if cached or not streamed or plays < self.min_plays or key in self._pending:
+                return None
+            self._pending.add(key)
+        return self._executor.submit(self._download, key, source, headers)
+
+    def path_for(self, track: str) -> Optional[str]:
+        """The cached file of a track, or None"""
+        return self._lookup("key = ?", self.normalize(track))
+
+    def local_copy(self, source: str) -> Optional[str]:
+        """The cached file of a stream URL that was played before, or None"""
+        if not source.startswith(("http://", "https://")):
+            return None
+        return self._lookup("url = ?", source)
+
+    def _lookup(self, where: str, value: str) -> Optional[str]:
+        with self._lock:
+            row = self.db.execute(
+                f"SELECT key, file, size, mtime, sha256 FROM audio_cache WHERE {where} AND file IS NOT NULL", (value,)
+            ).fetchone()
+        if row is None:
+            return None
+        key, file, size, mtime, sha256 = row
+        path = self.cache_dir / file
+        try:
+            stat = path.stat()
+            intact = (stat.st_size, stat.st_mtime_ns) == (size, mtime)
+        except OSError:
+            intact = False
+        if not intact:
+            self._count("corrupt")
+            self._drop(key, file)
+            return None
+        with self._lock:
+            if str(path) not in self._verified:
+                # Hashing a whole track would stall the caller, the check runs behind the downloads
+                self._verified.add(str(path))
+                self._executor.submit(self._verify, key, file, sha256)
+        self._count("hits")
+        return str(path)
+
+    def _verify(self, key: str, file: str, sha256: str):
+        """Full hash of a cached file, once per session"""
+        try:
+            intact = self._hash(self.cache_dir / file) == sha256
+        except OSError:
+            intact = False
+        if not intact:
+            self._count("corrupt")
+            self._drop(key, file)
+
+    @staticmethod
+    def _hash(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _download(self, key: str, url: str, headers: Optional[dict] = None):
+        name = hashlib.sha1(key.encode()).hexdigest()
+        part = self.cache_dir / f".{name}.part"
+        try:
+            digest, size = hashlib.sha256(), 0
+            with httpx.Client(transport=self.transport, timeout=self.timeout, follow_redirects=True) as client:
+                with client.stream("GET", url, headers=headers) as response:
+                    response.raise_for_status()
+                    expected = int(response.headers.get("content-length", 0))
+                    if expected > self.max_bytes:
+                        raise ValueError("track is larger than the whole cache")
+                    content_type = response.headers.get("content-type", "").split(";")[0].strip()
+                    with open(part, "wb") as f:
+                        for chunk in response.iter_bytes(64 * 1024):
+                            if self._stop.is_set():
+                                raise InterruptedError("shutting down")
+                            f.write(chunk)
+                            digest.update(chunk)
+                            size += len(chunk)
+                        f.flush()
+                        os.fsync(f.fileno())
+            if expected and size != expected:
+                raise IOError(f"download truncated at {size} of {expected} bytes")
+
+            file = name + EXTENSIONS.get(content_type, ".audio")
+            os.replace(part, self.cache_dir / file)
+            mtime = (self.cache_dir / file).stat().st_mtime_ns
+            with self._lock, self.db as db:
+                db.execute(
+                    "UPDATE audio_cache SET file = ?, size = ?, mtime = ?, sha256 = ? WHERE key = ?",
+                    (file, size, mtime, digest.hexdigest(), key),
+                )
+                self._verified.add(str(self.cache_dir / file))
+            self._count("downloads")
+            self._evict(keep=key)
+        except Exception as e:
+            part.unlink(missing_ok=True)
+            if self._stop.is_set():
+                return
+            self._count("failed")
+            print(f"Error caching audio for {key}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM audio_cache WHERE file IS NOT NULL").fetchone()[0]
+
+    def _evict(self, keep: Optional[str] = None):
+        order = "plays ASC, last_used ASC" if self.policy == "lfu" else "last_used ASC"
+        with self._lock:
+            total = self.total_bytes()
+            victims = self.db.execute(
+                f"SELECT key, file, size FROM audio_cache WHERE file IS NOT NULL AND key IS NOT ? ORDER BY {order}",
+                (keep,),
+            ).fetchall()
+        for key, file, size in victims:
+            if total <= self.max_bytes:
+                break
+            self._drop(key, file)
+            self._count("evictions")
+            total -= size
+
+    def _drop(self, key: str, file: str):
+        """Forget a cached file, the play count is kept"""
+        path = self.cache_dir / file
+        path.unlink(missing_ok=True)
+        with self._lock, self.db as db:
+            self._verified.discard(str(path))
+            db.execute(
+                "UPDATE audio_cache SET file = NULL, size = NULL, mtime = NULL, sha256 = NULL WHERE key = ?", (key,)
+            )
+
+    def _count(self, outcome: str):
+        # Counted from the caller's thread and the download threads
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def shutdown(self):
+        """Stop the background downloader, an unfinished download is discarded"""
+        self._stop.set()  # A running download stops at its next chunk
+        self._executor.shutdown(wait=False, cancel_futures=True)
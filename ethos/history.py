@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+from ethos.store import STATS_PERIODS, UserStore
+
+
+class HistoryLog:
+    """
+    Append-only log of plays, one JSON object per line.
+
+    The active segment is rotated to `plays.log.1`, `plays.log.2`, ... once it
+    grows past `max_bytes`, only the newest `max_segments` rotated segments are
+    kept (see `ListeningHistory.rebuild` for what that means for the stats). Segments are never rewritten, so a crash can at worst leave one
+    truncated line at the end, which readers skip and the next append starts
+    a new line after.
+    """
+
+    def __init__(self, log_dir: Optional[Path] = None, max_bytes: int = 1024 * 1024, max_segments: int = 20):
+        self.log_dir = log_dir or Path.home() / ".ethos" / "history"
+        self.log_file = self.log_dir / "plays.log"
+        self.max_bytes = max_bytes
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+
+    def append(self, entry: dict):
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+            if self.log_file.exists() and self.log_file.stat().st_size + len(line) > self.max_bytes:
+                self._rotate()
+            if self._ends_mid_line():
+                line = "\n" + line
+            with open(self.log_file, "a") as file:
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+
+    def _ends_mid_line(self) -> bool:
+        """Whether the active segment ends in a truncated line, e.g. after a crash"""
+        try:
+            with open(self.log_file, "rb") as file:
+                file.seek(0, os.SEEK_END)
+                if file.tell() == 0:
+                    return False
+                file.seek(-1, os.SEEK_END)
+                return file.read(1) != b"\n"
+        except FileNotFoundError:
+            return False
+
+    def segments(self) -> List[Path]:
+        """All log segments, oldest first"""
+        rotated = sorted(
+            (path for path in self.log_dir.glob("plays.log.*") if path.suffix[1:].isdigit()),
+            key=lambda path: int(path.suffix[1:]),
+        )
+        return rotated + ([self.log_file] if self.log_file.exists() else [])
+
+    def complete(self) -> bool:
+        """Whether the log still holds every play, i.e. no rotated segment was dropped"""
+        rotated = [path for path in self.log_dir.glob("plays.log.*") if path.suffix[1:].isdigit()]
+        return min((int(path.suffix[1:]) for path in rotated), default=1) == 1
+
+    def entries(self) -> Iterator[dict]:
+        """Every logged play in order, corrupt lines are skipped"""
+        for segment in self.segments():
+            with open(segment, "r", errors="replace") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(entry, dict) and "track" in entry and "played_at" in entry:
+                        yield entry
+
+    def _rotate(self):
+        rotated = [path for path in self.log_dir.glob("plays.log.*") if path.suffix[1:].isdigit()]
+        rotated.sort(key=lambda path: int(path.suffix[1:]))
+        next_index = int(rotated[-1].suffix[1:]) + 1 if rotated else 1
+        os.replace(self.log_file, self.log_dir / f"plays.log.{next_index}")
+        for path in rotated[:max(0, len(rotated) + 1 - self.max_segments)]:
+            path.unlink(missing_ok=True)
+
+
+class ListeningHistory:
+    """
+    Records every play (timestamp, source, listened duration) in the history log
+    and keeps incrementally updated aggregates in the user store: play counts and
+    listening time per track, artist and overall, for each day, week, month and
+    all time. Reading the top tracks or totals is an indexed lookup, the log is
+    only replayed by `rebuild`.
+    """
+
+    def __init__(self, store: UserStore, log: Optional[HistoryLog] = None):
+        self.store = store
+        self.log = log or HistoryLog(store.data_dir / "history")
+
+    def record(self, track: str, source: str, listened_seconds: float, played_at: Optional[float] = None,
+               tier: Optional[str] = None, resolve_seconds: Optional[float] = None):
+        """
+        Record a finished (or skipped) play.
+
+        Args:
+        - track (str): "<song> by <artist>".
+        - source (str): Where the play came from, e.g. "search", "queue" or "playlist".
+        - listened_seconds (float): How long the track was actually listened to.
+        - played_at (float): Unix timestamp of the start of the play, defaults to now.
+        - tier (str): Resolver tier that served the track, e.g. "local" or "yt-dlp".
+        - resolve_seconds (float): How long resolving the track took.
+        """
+        played_at = time.time() if played_at is None else played_at
+        listened_seconds = max(0.0, round(listened_seconds, 1))
+        entry = {"track": track, "source": source, "played_at": played_at, "listened": listened_seconds}
+        if tier is not None:
+            entry["tier"] = tier
+            entry["resolve_ms"] = round((resolve_seconds or 0.0) * 1000)
+        self.log.append(entry)
+        self.store.add_listen(track, played_at, listened_seconds)
+
+    def top_tracks(self, period: str = "week", limit: int = 10, at: Optional[float] = None) -> List[Tuple[str, int]]:
+        """Most played tracks of the current (or `at`'s) day, week, month or of all time"""
+        bucket = self.store.stats_bucket(period, time.time() if at is None else at)
+        return self.store.top_listens("track", period, bucket, limit)
+
+    def top_artists(self, period: str = "week", limit: int = 10, at: Optional[float] = None) -> List[Tuple[str, int]]:
+        """Most played artists, see `top_tracks`"""
+        bucket = self.store.stats_bucket(period, time.time() if at is None else at)
+        return self.store.top_listens("artist", period, bucket, limit)
+
+    def total_listening(self, period: str = "all", at: Optional[float] = None) -> Tuple[int, float]:
+        """(plays, seconds listened) of the current day, week, month or of all time"""
+        bucket = self.store.stats_bucket(period, time.time() if at is None else at)
+        return self.store.listening_total(period, bucket)
+
+    def rebuild(self) -> int:
+        """
+        Recompute the aggregates from the log, e.g. after the database was lost
+        or corrupted. The log is aggregated in memory and written in a single
+        transaction. Returns the number of plays replayed.
+
+        Once the log has dropped its oldest segments it no longer covers every
+        play, so only the buckets that start after the first surviving play
+        are replaced; earlier buckets, including all time, keep their stored
+        aggregates.
+        """
+        stats = {}
+        count = 0
+        first_logged = None  # When the first surviving play was logged, older plays were logged before
+        for entry in self.log.entries():
+            if first_logged is None:
+                first_logged = entry["played_at"] + entry.get("listened", 0.0)
+            for key in self.store.listen_keys(entry["track"], entry["played_at"]):
+                totals = stats.setdefault(key, [0, 0.0])
+                totals[0] += 1
+                totals[1] += entry.get("listened", 0.0)
+            count += 1
+        after = None
+        if not self.log.complete():
+            after = {period: self.store.stats_bucket(period, first_logged or time.time()) for period in STATS_PERIODS}
+        self.store.replace_listening_stats(stats, after)
+        return count
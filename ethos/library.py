@@ -0,0 +1,429 @@
+import multiprocessing
+import os
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from ethos.tools.metadata import read_metadata
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.m4a')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS library_dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS library_dirs_parent ON library_dirs (parent);
+CREATE TABLE IF NOT EXISTS library_files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    duration_ms INTEGER,
+    bitrate INTEGER,
+    sample_rate INTEGER,
+    title TEXT,
+    artist TEXT,
+    album TEXT
+);
+CREATE INDEX IF NOT EXISTS library_files_dir ON library_files (dir);
+"""
+
+# Bumped whenever the columns change, the index is a cache so it is simply rebuilt
+SCHEMA_VERSION = 2
+
+METADATA_COLUMNS = ('duration_ms', 'bitrate', 'sample_rate', 'title', 'artist', 'album')
+
+
+class LibraryIndex:
+    """
+    Persistent index of the local music library (path, size, mtime, format,
+    duration and tags of every audio file), kept in `~/.ethos/library.db`.
+
+    Rescans are incremental: a directory whose mtime did not change has had no
+    files added, removed or renamed, so it is not listed again, only its known
+    files are stat'ed (a file rewritten in place leaves the directory's mtime
+    alone) and its known subdirectories visited. Files are re-examined only when
+    their size or mtime changed. Pass `full=True` to `scan` to list every
+    directory anyway.
+    """
+
+    def __init__(self, db_file: Optional[Path] = None,
+                 extract: Optional[Callable[[str], Optional[dict]]] = read_metadata,
+                 workers: int = 8, processes: bool = False, batch_size: int = 1000):
+        self.db_file = db_file or Path.home() / ".ethos" / "library.db"
+        self.extract = extract
+        self.workers = workers
+        self.processes = processes
+        self.batch_size = batch_size
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._scan_lock = threading.Lock()
+        self._cancel = threading.Event()
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._db is None:
+                self.db_file.parent.mkdir(parents=True, exist_ok=True)
+                db = sqlite3.connect(self.db_file, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                    db.executescript("DROP TABLE IF EXISTS library_dirs; DROP TABLE IF EXISTS library_files;")
+                    db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                db.executescript(SCHEMA)
+                self._db = db
+            return self._db
+
+    @staticmethod
+    def _subtree(root: str) -> tuple:
+        """Range of paths below `root`, usable with the primary key index"""
+        prefix = root.rstrip(os.sep) + os.sep
+        return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+    def songs(self, root: Path) -> List[str]:
+        """Paths of all indexed audio files below `root`, sorted"""
+        low, high = self._subtree(str(root))
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT path FROM library_files WHERE path >= ? AND path < ? ORDER BY path", (low, high)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def tracks(self, root: Path) -> List[tuple]:
+        """(path, title, artist) of all indexed audio files below `root`"""
+        low, high = self._subtree(str(root))
+        with self._lock:
+            return self.db.execute(
+                "SELECT path, title, artist FROM library_files WHERE path >= ? AND path < ?", (low, high)
+            ).fetchall()
+
+    def tracks_at(self, paths: List[str]) -> List[tuple]:
+        """(path, title, artist) of the given files that are indexed"""
+        rows = []
+        with self._lock:
+            for start in range(0, len(paths), 500):
+                chunk = paths[start:start + 500]
+                rows += self.db.execute(
+                    f"SELECT path, title, artist FROM library_files WHERE path IN ({', '.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+        return rows
+
+    def get(self, path: str) -> Optional[dict]:
+        """The indexed entry of a file, or None"""
+        with self._lock:
+            cursor = self.db.execute("SELECT * FROM library_files WHERE path = ?", (path,))
+            row = cursor.fetchone()
+            return dict(zip([column[0] for column in cursor.description], row)) if row else None
+
+    def scan(self, root: Path, progress: Optional[Callable[[int, int], None]] = None, full: bool = False) -> dict:
+        """
+        Bring the index of `root` up to date.
+
+        Args:
+        - root (Path): The library folder.
+        - progress: Optional callback receiving (directories visited, files (re)indexed).
+        - full (bool): List every directory, even the ones whose mtime is unchanged.
+
+        Returns:
+        - dict: Counts of 'dirs_scanned', 'dirs_skipped', 'added', 'updated' and 'removed'
+                files, and whether the scan was 'cancelled'.
+        """
+        with self._scan_lock:
+            self._cancel.clear()
+            return _Scan(self, str(root).rstrip(os.sep) or os.sep, progress, full).run()
+
+    def update(self, root: Path, dirs, progress: Optional[Callable[[int, int], None]] = None) -> dict:
+        """
+        Bring only some directories of `root` up to date, e.g. the ones a watcher reported.
+
+        The directories are listed again whatever their mtime; their known
+        subdirectories are not visited, new ones are indexed with their whole
+        subtree and vanished ones are dropped with theirs.
+
+        Args:
+        - root (Path): The library folder.
+        - dirs: The changed directories, paths outside `root` are ignored.
+        - progress: Optional callback receiving (directories visited, files (re)indexed).
+
+        Returns:
+        - dict: The same counts as `scan`, plus the 'changed_paths' (added or
+                re-indexed) and 'removed_paths' files, e.g. for `LocalSearch.apply`.
+        """
+        root = str(root).rstrip(os.sep) or os.sep
+        low, high = self._subtree(root)
+        dirs = sorted({d for d in map(str, dirs) if d == root or low <= d < high})
+        with self._scan_lock:
+            self._cancel.clear()
+            return _Scan(self, root, progress, full=True, dirs=dirs).run()
+
+    def invalidate(self, dirs):
+        """Make the next scan list these directories again, even if their mtime looks unchanged"""
+        with self._lock, self.db as db:
+            db.executemany("UPDATE library_dirs SET mtime_ns = -1 WHERE path = ?", [(d,) for d in dirs])
+
+    def cancel(self):
+        """Stop a running scan, whatever was written so far is kept for the next one"""
+        self._cancel.set()
+
+    def _executor(self) -> Executor:
+        if self.processes:
+            return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ethos-library")
+
+
+def _extract_many(extract: Callable[[str], Optional[dict]], paths: List[str]) -> List[dict]:
+    """Extract the metadata of a group of files in a pool worker"""
+    results = []
+    for path in paths:
+        try:
+            results.append(extract(path) or {})
+        except Exception:
+            results.append({})
+    return results
+
+
+class _Scan:
+    """
+    A single run of `LibraryIndex.scan`.
+
+    Every change is queued as a write operation, in walk order. File rows wait on
+    their extraction future, everything after them waits too, which keeps a
+    directory's own row behind its files.
+    """
+
+    # Files of one directory sent to a worker at once
+    CHUNK_SIZE = 64
+
+    def __init__(self, index: LibraryIndex, root: str, progress: Optional[Callable[[int, int], None]], full: bool,
+                 dirs: Optional[List[str]] = None):
+        self.index = index
+        self.root = root
+        self.progress = progress
+        self.full = full
+        self.dirs = dirs  # Only list these directories (and new subdirectories), instead of walking `root`
+        self.stats = {'dirs_scanned': 0, 'dirs_skipped': 0, 'added': 0, 'updated': 0, 'removed': 0, 'cancelled': False}
+        if dirs is not None:
+            # A partial update is small, its files are listed for the callers that mirror the index
+            self.stats['changed_paths'] = []
+            self.stats['removed_paths'] = []
+        self.pending = deque()
+        self.batch = []
+        self.executor: Optional[Executor] = None
+        self.max_pending = max(1, index.workers) * 4
+
+    def _known_dirs(self):
+        """mtimes of the indexed directories this scan may visit, and their known children"""
+        known_dirs: Dict[str, int] = {}
+        children: Dict[str, List[str]] = {}
+        with self.index._lock:
+            db = self.index.db
+            if self.dirs is None:
+                low, high = LibraryIndex._subtree(self.root)
+                rows = db.execute(
+                    "SELECT path, parent, mtime_ns FROM library_dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                    (self.root, low, high),
+                ).fetchall()
+            else:
+                # The listed directories and their direct children, deeper ones are left alone
+                rows = []
+                for directory in self.dirs:
+                    rows += db.execute(
+                        "SELECT path, parent, mtime_ns FROM library_dirs WHERE path = ? OR parent = ?",
+                        (directory, directory),
+                    ).fetchall()
+        for path, parent, mtime_ns in rows:
+            known_dirs[path] = mtime_ns
+            if self.dirs is None and path != self.root:
+                children.setdefault(parent, []).append(path)
+        return known_dirs, children
+
+    def run(self) -> dict:
+        known_dirs, children = self._known_dirs()
+        targets = set(self.dirs or [])
+
+        seen_dirs = set()
+        stack = list(reversed(self.dirs)) if self.dirs is not None else [self.root]
+        try:
+            while stack:
+                if self.index._cancel.is_set():
+                    self.stats['cancelled'] = True
+                    break
+
+                directory = stack.pop()
+                if directory in seen_dirs:
+                    continue
+                try:
+                    mtime_ns = os.stat(directory).st_mtime_ns
+                except OSError:
+                    continue
+                seen_dirs.add(directory)
+
+                if directory in known_dirs and directory not in targets and (
+                        self.dirs is not None or (not self.full and known_dirs[directory] == mtime_ns)):
+                    self.stats['dirs_skipped'] += 1
+                    if self.dirs is None:
+                        self._check_files(directory)
+                    stack.extend(children.get(directory, []))
+                    continue
+
+                self.stats['dirs_scanned'] += 1
+                self._scan_directory(directory, stack)
+                self._queue('dir', (directory, None if directory == self.root else os.path.dirname(directory), mtime_ns))
+                if self.progress:
+                    self.progress(self.stats['dirs_scanned'], self.stats['added'] + self.stats['updated'])
+
+            if not self.stats['cancelled']:
+                for directory in set(known_dirs) - seen_dirs:
+                    self._queue('rmtree', directory)
+        finally:
+            self._drain(wait=not self.stats['cancelled'])
+            if self.executor:
+                self.executor.shutdown(wait=True, cancel_futures=True)
+            self._flush()
+        return self.stats
+
+    def _known_files(self, directory: str) -> Dict[str, tuple]:
+        with self.index._lock:
+            return {
+                path: (size, mtime_ns)
+                for path, size, mtime_ns in self.index.db.execute(
+                    "SELECT path, size, mtime_ns FROM library_files WHERE dir = ?", (directory,)
+                )
+            }
+
+    def _check_files(self, directory: str):
+        """Stat the indexed files of an unchanged directory, queue the ones rewritten in place"""
+        changed = []
+        for path, previous in self._known_files(directory).items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self._remove(path)
+                continue
+            if previous != (stat.st_size, stat.st_mtime_ns):
+                self.stats['updated'] += 1
+                changed.append((path, directory, stat.st_size, stat.st_mtime_ns,
+                                os.path.splitext(path)[1][1:].lower()))
+        self._queue_files(changed)
+
+    def _scan_directory(self, directory: str, stack: List[str]):
+        """List a changed directory and queue the reconciliation of its files with the index"""
+        known = self._known_files(directory)
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            entries = []
+
+        changed = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    # Known to the index before the parent is marked scanned, so a resumed scan visits it
+                    self._queue('subdir', (entry.path, directory))
+                    continue
+                extension = os.path.splitext(entry.name)[1].lower()
+                if extension not in AUDIO_EXTENSIONS:
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+
+            previous = known.pop(entry.path, None)
+            if previous == (stat.st_size, stat.st_mtime_ns):
+                continue
+            self.stats['updated' if previous else 'added'] += 1
+            changed.append((entry.path, directory, stat.st_size, stat.st_mtime_ns, extension[1:]))
+
+        self._queue_files(changed)
+        for path in known:  # Files that are gone
+            self._remove(path)
+
+    def _remove(self, path: str):
+        self._queue('delete', path)
+        self.stats['removed'] += 1
+        if 'removed_paths' in self.stats:
+            self.stats['removed_paths'].append(path)
+
+    def _queue_files(self, changed: List[tuple]):
+        """Queue new or changed file rows, their tags are extracted in chunks on the pool"""
+        if 'changed_paths' in self.stats:
+            self.stats['changed_paths'] += [row[0] for row in changed]
+        for start in range(0, len(changed), self.CHUNK_SIZE):
+            rows = changed[start:start + self.CHUNK_SIZE]
+            future = None
+            if self.index.extract:
+                if self.executor is None:
+                    self.executor = self.index._executor()
+                future = self.executor.submit(_extract_many, self.index.extract, [row[0] for row in rows])
+            self._queue('files', (rows, future))
+
+    def _queue(self, op: str, payload):
+        self.pending.append((op, payload))
+        # Backpressure: wait for the oldest extraction rather than letting work pile up
+        self._drain(wait=len(self.pending) > self.max_pending)
+
+    def _drain(self, wait: bool):
+        """Move finished operations, in order, to the write batch"""
+        while self.pending:
+            op, payload = self.pending[0]
+            if op == 'files' and payload[1] is not None:
+                future: Future = payload[1]
+                if not future.done() and not (wait or len(self.pending) > self.max_pending):
+                    break
+                try:
+                    metadata = future.result()
+                except Exception:
+                    if self.stats['cancelled']:
+                        break
+                    metadata = [{}] * len(payload[0])
+                payload = [(*row, *(info.get(column) for column in METADATA_COLUMNS))
+                           for row, info in zip(payload[0], metadata)]
+            elif op == 'files':
+                payload = [(*row, *([None] * len(METADATA_COLUMNS))) for row in payload[0]]
+            self.pending.popleft()
+            self.batch.append((op, payload))
+            if len(self.batch) >= self.index.batch_size:
+                self._flush()
+
+    def _flush(self):
+        """Write the batch in one transaction"""
+        if not self.batch:
+            return
+        with self.index._lock, self.index.db as db:
+            for op, payload in self.batch:
+                if op == 'files':
+                    db.executemany(
+                        "INSERT OR REPLACE INTO library_files "
+                        f"(path, dir, size, mtime_ns, format, {', '.join(METADATA_COLUMNS)}) "
+                        f"VALUES (?, ?, ?, ?, ?{', ?' * len(METADATA_COLUMNS)})",
+                        payload,
+                    )
+                elif op == 'delete':
+                    db.execute("DELETE FROM library_files WHERE path = ?", (payload,))
+                elif op == 'subdir':
+                    db.execute(
+                        "INSERT OR IGNORE INTO library_dirs (path, parent, mtime_ns) VALUES (?, ?, -1)", payload
+                    )
+                elif op == 'dir':
+                    db.execute("INSERT OR REPLACE INTO library_dirs (path, parent, mtime_ns) VALUES (?, ?, ?)", payload)
+                elif op == 'rmtree':
+                    low, high = LibraryIndex._subtree(payload)
+                    if 'removed_paths' in self.stats:
+                        self.stats['removed_paths'] += [row[0] for row in db.execute(
+                            "SELECT path FROM library_files WHERE path >= ? AND path < ?", (low, high)
+                        )]
+                    self.stats['removed'] += db.execute(
+                        "DELETE FROM library_files WHERE path >= ? AND path < ?", (low, high)
+                    ).rowcount
+                    db.execute("DELETE FROM library_dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                               (payload, low, high))
+        self.batch = []
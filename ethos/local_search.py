@@ -0,0 +1,238 @@
+import os
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+# Rarest trigrams are counted first, common ones are skipped once this many postings were read
+CANDIDATE_BUDGET = 10000
+
+
+@dataclass
+class LocalHit:
+    path: str
+    display: str
+    score: float  # Share of the query's trigrams found in the track
+    similarity: float  # Jaccard similarity of the query and the track, penalizes extra words
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and punctuation"""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.lower()
+    return " ".join(re.sub(r"[\W_]+", " ", text).split())
+
+
+def trigrams(text: str) -> Set[str]:
+    """Trigrams of every word, padded so short words and word boundaries count"""
+    return _word_trigrams(normalize(text))
+
+
+def _word_trigrams(normalized: str) -> Set[str]:
+    return {padded[i:i + 3] for padded in [f" {word} " for word in normalized.split()] for i in range(len(padded) - 2)}
+
+
+class _Snapshot(NamedTuple):
+    docs: List[Optional[Tuple[str, str, str]]]  # (path, display name, normalized text), None once removed
+    postings: Dict[str, array]  # Trigram -> ids of the docs containing it, removed ones included
+    ids: Dict[str, int]  # Path of every live doc to its id
+
+
+class LocalSearch:
+    """
+    In-memory trigram index over the local library for fuzzy track lookup.
+
+    Each track is indexed on its title, artist and file name. A query is scored
+    by the share of its trigrams found in a track, so typos and partial names
+    still match; ties go to the track with the fewest extra trigrams.
+    `rebuild` indexes a whole library, `update` only indexes the tracks that
+    were added, removed or retagged since.
+
+    Searches never wait for writers: `rebuild` and `update` build a new
+    snapshot of the index and swap it in with one assignment, `apply` changes
+    a few tracks in place (appended docs and postings, tombstones) so its cost
+    does not grow with the library. Removed tracks are only tombstoned in the
+    postings, the index is compacted once they make up half of it.
+    """
+
+    def __init__(self):
+        self._index = _Snapshot([], {}, {})
+        self._lock = threading.Lock()  # Serializes writers only
+
+    def __len__(self) -> int:
+        return len(self._index.ids)
+
+    @staticmethod
+    def display_name(path: str, title: Optional[str], artist: Optional[str]) -> str:
+        """'<title> by <artist>' like the online results, or the file name without tags"""
+        if title and artist:
+            return f"{title} by {artist}"
+        return title or os.path.splitext(os.path.basename(path))[0]
+
+    @staticmethod
+    def _document(path: str, title: Optional[str], artist: Optional[str]) -> Tuple[str, str, str]:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return path, LocalSearch.display_name(path, title, artist), normalize(f"{title or ''} {artist or ''} {stem}")
+
+    @staticmethod
+    def _build(docs: Iterable[Tuple[str, str, str]]) -> _Snapshot:
+        index = _Snapshot([], {}, {})
+        for doc in docs:
+            LocalSearch._add(index, doc, index.postings)
+        return index
+
+    @staticmethod
+    def _add(index: _Snapshot, doc: Tuple[str, str, str], postings: Dict[str, array]):
+        doc_id = len(index.docs)
+        index.docs.append(doc)
+        index.ids[doc[0]] = doc_id
+        for gram in _word_trigrams(doc[2]):
+            posting = postings.get(gram)
+            if posting is None:
+                posting = postings[gram] = array("I")
+            posting.append(doc_id)
+
+    def rebuild(self, tracks: Iterable[Tuple[str, Optional[str], Optional[str]]]):
+        """
+        Index a new set of tracks.
+
+        Args:
+        - tracks: (path, title, artist) of every local track, tags may be None.
+        """
+        index = self._build(self._document(path, title, artist) for path, title, artist in tracks)
+        with self._lock:
+            self._index = index
+
+    def update(self, tracks: Iterable[Tuple[str, Optional[str], Optional[str]]]):
+        """
+        Bring the index in line with the current set of tracks, re-indexing only
+        the ones that were added, removed or retagged.
+
+        Args:
+        - tracks: (path, title, artist) of every local track, tags may be None.
+        """
+        wanted = {path: self._document(path, title, artist) for path, title, artist in tracks}
+        with self._lock:
+            current = self._index
+            ids = dict(current.ids)
+            removed = [doc_id for path, doc_id in ids.items() if wanted.get(path) != current.docs[doc_id]]
+            for doc_id in removed:
+                del ids[current.docs[doc_id][0]]
+            added = [doc for path, doc in wanted.items() if path not in ids]
+            if not removed and not added:
+                return
+
+            live = len(ids) + len(added)
+            if len(current.docs) + len(added) > 2 * live + 1000:
+                # Mostly tombstones after many removals, renumber what is left
+                index = self._build([current.docs[doc_id] for doc_id in ids.values()] + added)
+            else:
+                # Searches may still be reading the current docs, so the new docs are
+                # appended to a copy and only the postings that gain ids are copied
+                index = _Snapshot(list(current.docs), current.postings, ids)
+                for doc_id in removed:
+                    index.docs[doc_id] = None
+                grown = {}
+                for doc in added:
+                    self._add(index, doc, grown)
+                postings = dict(current.postings)
+                for gram, new_ids in grown.items():
+                    old = postings.get(gram)
+                    postings[gram] = old + new_ids if old is not None else new_ids
+                index = index._replace(postings=postings)
+            self._index = index
+
+    def apply(self, changed: Iterable[Tuple[str, Optional[str], Optional[str]]], removed: Iterable[str] = ()):
+        """
+        Apply the changes of a library update, without looking at the rest of the library.
+
+        Args:
+        - changed: (path, title, artist) of the added or re-indexed tracks.
+        - removed: Paths of the removed tracks.
+        """
+        changed = [self._document(path, title, artist) for path, title, artist in changed]
+        with self._lock:
+            index = self._index
+            for path in removed:
+                self._tombstone(index, path)
+            for doc in changed:
+                doc_id = index.ids.get(doc[0])
+                if doc_id is not None:
+                    if index.docs[doc_id] == doc:
+                        continue
+                    self._tombstone(index, doc[0])
+                self._add(index, doc, index.postings)
+            if len(index.docs) > 2 * len(index.ids) + 1000:
+                self._index = self._build([index.docs[doc_id] for doc_id in index.ids.values()])
+
+    @staticmethod
+    def _tombstone(index: _Snapshot, path: str):
+        doc_id = index.ids.pop(path, None)
+        if doc_id is not None:
+            index.docs[doc_id] = None
+
+    def search(self, query: str, k: int = 10, min_score: float = 0.0) -> List[LocalHit]:
+        """
+        Rank local tracks against a query.
+
+        Args:
+        - query (str): Free text, e.g. "blinding lights weeknd".
+        - k (int): Maximum number of hits.
+        - min_score (float): Minimum share (0 to 1) of the query's trigrams a hit must contain.
+
+        Returns:
+        - List[LocalHit]: Best hits first.
+        """
+        grams = trigrams(query)
+        docs, postings, ids = self._index
+        if not grams or not ids:
+            return []
+
+        counts = Counter()
+        budget = CANDIDATE_BUDGET
+        for posting in sorted((postings[g] for g in grams if g in postings), key=len):
+            if budget <= 0:
+                break
+            counts.update(posting)
+            budget -= len(posting)
+        # A concurrent `apply` may tombstone a candidate meanwhile
+        candidates = [doc for doc in map(docs.__getitem__, self._most_common(counts, docs, k * 5)) if doc]
+
+        hits = []
+        for path, display, text in candidates:
+            # Rescore exactly, the counts miss the common trigrams that were skipped
+            doc_grams = _word_trigrams(text)
+            shared = len(grams & doc_grams)
+            score = shared / len(grams)
+            if score >= min_score:
+                similarity = shared / len(grams | doc_grams)
+                hits.append((score, shared - len(doc_grams), LocalHit(path, display, round(score, 3), round(similarity, 3))))
+        hits.sort(key=lambda hit: hit[:2], reverse=True)
+        return [hit for _, _, hit in hits[:k]]
+
+    @staticmethod
+    def _most_common(counts: Counter, docs: list, n: int) -> List[int]:
+        """
+        Ids of the `n` live docs with the highest counts. Cheaper than
+        `Counter.most_common` on large counts: the histogram of the counts
+        gives the lowest count that makes the cut, only docs reaching it are sorted.
+        """
+        if not counts:
+            return []
+        histogram = sorted(Counter(counts.values()).items(), reverse=True)
+        wanted = n
+        for cut, docs_with_count in histogram:
+            wanted -= docs_with_count
+            if wanted <= 0:
+                break
+        top = [doc_id for doc_id, count in counts.items() if count >= cut and docs[doc_id] is not None]
+        if len(top) < n and cut > 1:
+            # Tombstones took some of the places
+            top = [doc_id for doc_id in counts if docs[doc_id] is not None]
+        top.sort(key=counts.__getitem__, reverse=True)
+        return top[:n]
@@ -1,7 +1,15 @@
 import vlc
+import threading
+import time
+import os
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Dict, Callable
 from ethos.config import get_music_folder
+from ethos.library import LibraryIndex
+from ethos.watcher import LibraryWatcher
+from ethos.tools.metadata import read_metadata
 
 class MusicPlayer:
     """
@@ -18,28 +26,124 @@ class MusicPlayer:
         self.is_playing = False
         self.library_path: Optional[Path] = get_music_folder()
         self.queue = None
+        self.library_index = LibraryIndex()
+        self.library_watcher: Optional[LibraryWatcher] = None
+        self.audio_cache = None  # Optional AudioCache, cached copies are played instead of streams
+        self._library_update: Optional[Callable[[List[str], List[str]], None]] = None
+        self.probe = MediaProbe.shared(self.vlc_instance)
+        self.playback_state = PlaybackState()
+        self._end_callbacks: List[Callable[[str], None]] = []
+        self._error_callbacks: List[Callable[[str], None]] = []
+        self._standby: Optional[tuple] = None  # (track_path, pre-buffered vlc.MediaPlayer)
+        self._standby_lock = threading.Lock()
+        self._attach_events(self.player)
+
+    def on_end_reached(self, callback: Callable[[str], None]):
+        """
+        Register a callback fired when the current track finishes playing.
+
+        The callback receives the finished track path/URL. It runs on a libvlc
+        event thread, so it must not call back into the player directly; hand the
+        work over to the caller's own thread/event loop instead.
+        """
+        self._end_callbacks.append(callback)
+
+    def on_error(self, callback: Callable[[str], None]):
+        """Register a callback fired when VLC fails to play the current track (see `on_end_reached`)."""
+        self._error_callbacks.append(callback)
+
+    def _track_finished(self, callbacks: List[Callable[[str], None]]):
+        track = self.current_track
+        self.is_playing = False
+        self.playback_state.set_playing(False)
+        for callback in callbacks:
+            try:
+                callback(track)
+            except Exception as e:
+                print(f"Error in playback callback: {e}")
+
+    def _attach_events(self, player: vlc.MediaPlayer):
+        """
+        Feed the playback state from VLC events instead of polling libvlc.
+
+        Events from a standby player are ignored until it becomes the active player.
+        """
+        state = self.playback_state
+        events = player.event_manager()
+
+        def attach(event_type, handler):
+            events.event_attach(event_type, lambda e: handler(e) if player is self.player else None)
+
+        attach(vlc.EventType.MediaPlayerTimeChanged, lambda e: state.update_time(e.u.new_time))
+        attach(vlc.EventType.MediaPlayerPositionChanged, lambda e: state.update_position(e.u.new_position))
+        attach(vlc.EventType.MediaPlayerLengthChanged, lambda e: state.set_duration(e.u.new_length))
+        attach(vlc.EventType.MediaPlayerPlaying, lambda e: state.set_playing(True))
+        attach(vlc.EventType.MediaPlayerPaused, lambda e: state.set_playing(False))
+        attach(vlc.EventType.MediaPlayerStopped, lambda e: state.set_playing(False))
+        attach(vlc.EventType.MediaPlayerEndReached, lambda e: self._track_finished(self._end_callbacks))
+        attach(vlc.EventType.MediaPlayerEncounteredError, lambda e: self._track_finished(self._error_callbacks))
         
     def set_library(self, path: str) -> bool:
         """Set and validate the music library path"""
         library = Path(path)
         if library.exists() and library.is_dir():
             self.library_path = library
+            if self.library_watcher:
+                self.watch_library(self._library_update)
             return True
         return False
-    
-    def get_library_songs(self) -> List[str]:
-        """Get all audio files from the library"""
+
+    def watch_library(self, on_update: Optional[Callable[[List[str], List[str]], None]] = None) -> bool:
+        """
+        Keep the library index current in the background.
+
+        Changes on disk are picked up by a `LibraryWatcher` and applied to the
+        index within a few seconds, `get_library_songs` then no longer rescans.
+
+        Args:
+        - on_update: Optional callback receiving the files (re)indexed and the files
+                     removed by each update, it runs on the watcher thread.
+        """
+        self.stop_watching_library()
+        if not self.library_path:
+            return False
+
+        root = self.library_path
+        self._library_update = on_update
+        # Watch first, so nothing landing during the initial scan is missed
+        self.library_watcher = LibraryWatcher(root, lambda dirs: self._on_library_change(root, dirs))
+        self.library_watcher.start()
+        self.library_index.scan(root)
+        return True
+
+    def stop_watching_library(self):
+        if self.library_watcher:
+            self.library_watcher.stop()
+            self.library_watcher = None
+
+    def _on_library_change(self, root: Path, dirs):
+        stats = self.library_index.update(root, dirs)
+        if self._library_update and (stats['changed_paths'] or stats['removed_paths']):
+            self._library_update(stats['changed_paths'], stats['removed_paths'])
+
+    def get_library_songs(self, progress: Optional[Callable[[int, int], None]] = None) -> List[str]:
+        """
+        Get all audio files from the library.
+
+        Unless the library is being watched, the index is rescanned incrementally
+        first, only directories and files that changed since the last scan are examined.
+
+        Args:
+        - progress: Optional callback receiving (directories visited, files indexed),
+                    useful for the first (cold) scan of a large library.
+        """
         if not self.library_path:
             print("Local music folder is not set.")
             return []
-            
-        audio_extensions = ('.mp3', '.wav', '.flac', '.m4a')
-        songs = []
-        
-        for file in self.library_path.rglob("*"):
-            if file.suffix.lower() in audio_extensions:
-                songs.append(str(file))
-        return songs
+
+        if not self.library_watcher:
+            self.library_index.scan(self.library_path, progress)
+        return self.library_index.songs(self.library_path)
 
     def play(self, track_path: str) -> bool:
         """
@@ -55,15 +159,93 @@ class MusicPlayer:
                 False otherwise (e.g., invalid file path or VLC initialization error).
         """
         try:
-            media = self.vlc_instance.media_new(track_path)
-            self.player.set_media(media)
-            self.player.play()
+            standby = self._take_standby(track_path)
+            if standby:
+                # Pre-buffered by `preload`, switch players instead of opening the stream again
+                volume = self.player.audio_get_volume()
+                previous, self.player = self.player, standby
+                self._release_player(previous)
+                self.playback_state.reset(track_path)
+                self.playback_state.set_duration(standby.get_length())
+                if volume >= 0:
+                    self.player.audio_set_volume(volume)
+                self.player.play()
+            else:
+                media = self.vlc_instance.media_new(self._local_copy(track_path))
+                self.playback_state.reset(track_path)
+                self.playback_state.set_duration(0)  # Known once libvlc has opened the media
+                self.player.set_media(media)
+                self.player.play()
             self.current_track = track_path
             self.is_playing = True
             return True
         except Exception:
             return False
 
+    def preload(self, track_path: str) -> bool:
+        """
+        Pre-buffer a track on a standby player so that a later `play` of the same
+        track starts almost instantly.
+
+        The standby player opens the media paused on its first frame, so it
+        buffers without producing any audio. Only one track is kept on standby,
+        preloading another one discards the previous standby player.
+
+        Args:
+        - track_path (str): The full path or URL to the audio track.
+
+        Returns:
+        - bool: True if the standby player was set up, False otherwise.
+        """
+        with self._standby_lock:
+            if self._standby and self._standby[0] == track_path:
+                return True
+        try:
+            player = self.vlc_instance.media_player_new()
+            media = self.vlc_instance.media_new(self._local_copy(track_path))
+            media.add_option(":start-paused")
+            player.set_media(media)
+            self._attach_events(player)
+            player.play()
+        except Exception:
+            return False
+
+        with self._standby_lock:
+            previous, self._standby = self._standby, (track_path, player)
+        if previous:
+            self._release_player(previous[1])
+        return True
+
+    def standby_track(self) -> Optional[str]:
+        """The track pre-buffered on the standby player, if any"""
+        with self._standby_lock:
+            return self._standby[0] if self._standby else None
+
+    def _local_copy(self, track_path: str) -> str:
+        """The offline cache's copy of a stream if there is one, else the track itself"""
+        if self.audio_cache:
+            try:
+                return self.audio_cache.local_copy(track_path) or track_path
+            except Exception:
+                pass
+        return track_path
+
+    def _take_standby(self, track_path: str) -> Optional[vlc.MediaPlayer]:
+        """Return the standby player if it holds `track_path`, discarding it otherwise."""
+        with self._standby_lock:
+            standby, self._standby = self._standby, None
+        if not standby:
+            return None
+        if standby[0] == track_path:
+            return standby[1]
+        self._release_player(standby[1])
+        return None
+
+    @staticmethod
+    def _release_player(player: vlc.MediaPlayer):
+        player.stop()
+        player.release()
+
     def pause(self):
         """Pause the current playback"""
         if self.is_playing:
@@ -86,6 +268,7 @@ class MusicPlayer:
         self.player.stop()
         self.is_playing = False
         self.current_track = None
+        self.playback_state.reset(None)
 
     def set_volume(self, volume: int):
         """Set volume (0-100)"""
@@ -143,37 +326,273 @@ class MusicPlayer:
         self.player.set_time(new_time) 
 
 
+class PlaybackState:
+    """
+    Snapshot of the current playback, kept up to date from VLC events.
+
+    The duration is captured once per track and the position is updated from
+    `TimeChanged`/`PositionChanged` events. Between events the position is
+    interpolated with a monotonic clock, so reads never call into libvlc.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset(None)
+
+    def reset(self, track: Optional[str]):
+        """Start tracking a new track (or nothing, if `track` is None)."""
+        with self._lock:
+            self.track = track
+            self.duration_ms = 0
+            self._position_ms = 0
+            self._anchor = time.monotonic()
+            self.playing = False
+
+    def set_duration(self, duration_ms: int):
+        """Record the track duration, only the first valid value is kept."""
+        with self._lock:
+            if duration_ms > 0 and self.duration_ms <= 0:
+                self.duration_ms = duration_ms
+
+    def update_time(self, time_ms: int):
+        if time_ms < 0:
+            return
+        with self._lock:
+            self._position_ms = time_ms
+            self._anchor = time.monotonic()
+
+    def update_position(self, position: float):
+        """Update from a `PositionChanged` event (fraction 0.0 - 1.0 of the track)."""
+        with self._lock:
+            duration_ms = self.duration_ms
+        if duration_ms > 0 and position >= 0:
+            self.update_time(int(position * duration_ms))
+
+    def set_playing(self, playing: bool):
+        with self._lock:
+            self._position_ms = self._interpolate()
+            self._anchor = time.monotonic()
+            self.playing = playing
+
+    def _interpolate(self) -> int:
+        position = self._position_ms
+        if self.playing:
+            position += int((time.monotonic() - self._anchor) * 1000)
+        if self.duration_ms > 0:
+            position = min(position, self.duration_ms)
+        return position
+
+    @property
+    def position_ms(self) -> int:
+        """Current playback position in milliseconds."""
+        with self._lock:
+            return self._interpolate()
+
+    @property
+    def progress(self) -> float:
+        """Playback progress as a percentage (0.0 to 100.0)."""
+        with self._lock:
+            if self.duration_ms <= 0:
+                return 0.0
+            return (self._interpolate() / self.duration_ms) * 100
+
+
+class MediaProbe:
+    """
+    Asynchronous duration probe built on VLC's `MediaParsedChanged` event.
+
+    A single probe (and a single VLC instance) is shared by the whole application.
+    Probes never spin: parsing is handed to libvlc with a hard timeout and the
+    result is delivered through a `Future` once libvlc reports the parse status.
+    Durations are cached per path/URL (the `cache_size` most recently used ones)
+    so the same media is only ever parsed once. A probe abandoned by a timed out
+    caller is dropped, so the next call starts a fresh parse; a late parse event
+    of the abandoned media is ignored.
+    """
+
+    _shared: Optional["MediaProbe"] = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, vlc_instance: Optional[vlc.Instance] = None, timeout: float = 5.0, cache_size: int = 2048):
+        self._vlc_instance = vlc_instance
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, int] = OrderedDict()
+        self._pending: Dict[str, Future] = {}
+        self._media: Dict[str, vlc.Media] = {}  # Media of the pending probes, kept alive until parsed
+        self._finished: List[vlc.Media] = []  # Parsed media, released outside of their own event callback
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, vlc_instance: Optional[vlc.Instance] = None) -> "MediaProbe":
+        """
+        Return the application-wide probe, creating it on first use.
+
+        The first caller may hand over its VLC instance so that playback and
+        probing share one libvlc instance.
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(vlc_instance)
+            return cls._shared
+
+    @property
+    def vlc_instance(self) -> vlc.Instance:
+        if self._vlc_instance is None:
+            self._vlc_instance = vlc.Instance()
+        return self._vlc_instance
+
+    def cached(self, audio_path: str) -> Optional[int]:
+        """Return the cached duration (ms) of a path/URL, or None if it was never probed."""
+        with self._lock:
+            duration = self._cache.get(audio_path)
+            if duration is not None:
+                self._cache.move_to_end(audio_path)
+            return duration
+
+    def probe(self, audio_path: str) -> Future:
+        """
+        Start probing the duration of a file or URL without blocking.
+
+        Args:
+        - audio_path (str): The full path or URL to the audio track.
+
+        Returns:
+        - Future: Resolves to the duration in milliseconds, or -1 if the media
+                  could not be parsed within the timeout.
+        """
+        with self._lock:
+            if audio_path in self._cache:
+                self._cache.move_to_end(audio_path)
+                future = Future()
+                future.set_result(self._cache[audio_path])
+                return future
+            if audio_path in self._pending:
+                return self._pending[audio_path]
+            future = Future()
+            self._pending[audio_path] = future
+            finished, self._finished = self._finished, []
+        for media in finished:
+            self._release(media)
+
+        media = None
+        try:
+            media = self.vlc_instance.media_new(audio_path)
+            with self._lock:
+                self._media[audio_path] = media
+            media.event_manager().event_attach(
+                vlc.EventType.MediaParsedChanged, self._on_parsed, audio_path, media
+            )
+            if media.parse_with_options(vlc.MediaParseFlag.network, int(self.timeout * 1000)) == -1:
+                self._finish(audio_path, media, -1)
+        except Exception as e:
+            print(f"Error probing media: {e}")
+            self._finish(audio_path, media, -1)
+        return future
+
+    def get_duration(self, audio_path: str, timeout: Optional[float] = None) -> int:
+        """
+        Get the duration (ms) of a file or URL, waiting at most `timeout` seconds.
+
+        Returns -1 if the duration is not available in time.
+        """
+        cached = self.cached(audio_path)
+        if cached is not None:
+            return cached
+        future = self.probe(audio_path)
+        try:
+            return future.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            self._abandon(audio_path, future)
+            return -1
+        except Exception:
+            return -1
+
+    def _on_parsed(self, event, audio_path: str, media: vlc.Media):
+        """Callback for `MediaParsedChanged`, runs on a libvlc thread."""
+        duration = -1
+        if media.get_parsed_status() == vlc.MediaParsedStatus.done:
+            duration = media.get_duration()
+        self._finish(audio_path, media, duration)
+
+    def _finish(self, audio_path: str, media: Optional[vlc.Media], duration: int):
+        """Complete the pending probe of `audio_path` if `media` is still the one it parses"""
+        with self._lock:
+            if self._media.get(audio_path) is not media:
+                return  # A late event of an abandoned probe
+            future = self._pending.pop(audio_path, None)
+            self._media.pop(audio_path, None)
+            if media is not None:
+                # This may run in the media's own event callback, it is released by the next probe
+                self._finished.append(media)
+            if duration >= 0:
+                self._cache[audio_path] = duration
+                self._cache.move_to_end(audio_path)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        if future is not None and not future.done():
+            future.set_result(duration)
+
+    def _abandon(self, audio_path: str, future: Future):
+        """Drop a probe nobody waits for anymore and release its media"""
+        with self._lock:
+            if self._pending.get(audio_path) is not future:
+                return  # Finished meanwhile, or already replaced by a new probe
+            del self._pending[audio_path]
+            media = self._media.pop(audio_path, None)
+        if not future.done():
+            future.set_result(-1)
+        if media is not None:
+            try:
+                media.parse_stop()
+            except Exception:
+                pass
+            self._release(media)
+
+    @staticmethod
+    def _release(media: vlc.Media):
+        try:
+            media.release()
+        except Exception:
+            pass
+
+
 class TrackInfo:
     """
     A class for managing audio track metadata and playback progress.
     """
 
+    @staticmethod
+    def get_duration_ms(audio_path: str) -> int:
+        """
+        Get the duration of an audio file in milliseconds, -1 if unknown.
+
+        Local files are read with the lightweight header parsers, libvlc is
+        only used for streams and files the parsers cannot handle.
+        """
+        metadata = read_metadata(audio_path) if os.path.isfile(audio_path) else None
+        if metadata and metadata['duration_ms']:
+            return metadata['duration_ms']
+        return MediaProbe.shared().get_duration(audio_path)
+
     @staticmethod
     def get_audio_duration(audio_path: str) -> str:
         """Get the duration of an audio file in minutes and seconds."""
-        try:
-            media = vlc.Media(audio_path)
-            media_player = vlc.MediaPlayer()
-            media_player.set_media(media)
-
-            media.parse_with_options(1, 0)
-            while media.get_duration() < 0:
-                continue
+        duration = TrackInfo.get_duration_ms(audio_path)
+        if duration < 0:
+            return "0:00"
 
-            total_seconds = media.get_duration() // 1000 
-            minutes = total_seconds // 60
-            seconds = total_seconds % 60
+        total_seconds = duration // 1000
+        minutes = total_seconds // 60
+        seconds = total_seconds % 60
 
-            return f"{minutes}:{seconds:02}"
-        except Exception as e:
-            print(f"Error retrieving duration: {e}")
-            return "0:00"
+        return f"{minutes}:{seconds:02}"
 
 
     @staticmethod
     def get_current_time(music_player: "MusicPlayer") -> str:
         """Get the current playback time in minutes and seconds."""
-        total_seconds = music_player.player.get_time() // 1000
+        total_seconds = music_player.playback_state.position_ms // 1000
         minutes = total_seconds // 60
         seconds = total_seconds % 60
         return f"{minutes}:{seconds:02}"
@@ -181,31 +600,18 @@ class TrackInfo:
 
     @staticmethod
     def get_audio_duration_int(audio_path: str) -> int:
-            """Get the duration of an audio file in seconds."""
-            try:
-                media = vlc.Media(audio_path)
-                media_player = vlc.MediaPlayer()
-                media_player.set_media(media)
-
-                media.parse_with_options(1, 0)
-                while media.get_duration() < 0:
-                    continue
+        """Get the duration of an audio file in seconds."""
+        duration = TrackInfo.get_duration_ms(audio_path)
+        if duration < 0:
+            return 0
 
-                # Return the duration in seconds
-                return media.get_duration() // 1000
-            except Exception as e:
-                print(f"Error retrieving duration: {e}")
-                return 0
+        # Return the duration in seconds
+        return duration // 1000
     
     @staticmethod
     def get_current_time_int(music_player: "MusicPlayer") -> int:
         """Get the current playback time in seconds."""
-        try:
-            # Return the current playback time in seconds
-            return music_player.player.get_time() // 1000
-        except Exception as e:
-            print(f"Error retrieving current playback time: {e}")
-            return 0
+        return music_player.playback_state.position_ms // 1000
         
     @staticmethod
     def get_progress(music_player: "MusicPlayer") -> float:
@@ -221,9 +627,4 @@ class TrackInfo:
         if not music_player.current_track:
             return 0.0
 
-        duration = TrackInfo.get_audio_duration_int(music_player.current_track)
-        current_time = TrackInfo.get_current_time_int(music_player)
-
-        if duration > 0:
-            return (current_time / duration) * 100
-        return 0.0
\ No newline at end of file
+        return music_player.playback_state.progress
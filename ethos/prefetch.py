@@ -0,0 +1,94 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, List, Optional
+from ethos.player import MusicPlayer
+from ethos.stream_cache import StreamCache
+from ethos.track_resolver import Resolution
+
+
+class Prefetcher:
+    """
+    Resolves upcoming queue entries in the background while the current track plays.
+
+    The first `depth` queue entries are resolved to playable URLs on a small thread
+    pool, and the next entry is pre-buffered on the player's standby player, so a
+    track change only has to switch players instead of resolving and buffering.
+    """
+
+    def __init__(self, player: MusicPlayer, resolve: Callable[[str], Resolution], depth: int = 2):
+        self.player = player
+        self.resolve = resolve
+        self.depth = depth
+        self.executor = ThreadPoolExecutor(max_workers=depth, thread_name_prefix="ethos-prefetch")
+        self._futures: Dict[str, Future] = {}
+        self._next_track: Optional[str] = None
+        self._preloading: Optional[Future] = None  # The future whose result will be preloaded
+        self._lock = threading.Lock()
+
+    def update(self, tracks: List[str]):
+        """
+        Prefetch the head of the queue.
+
+        Args:
+        - tracks (list[str]): The queued track names, in play order.
+        """
+        window = tracks[:self.depth]
+        with self._lock:
+            for track in list(self._futures):
+                if track not in window:
+                    self._futures.pop(track).cancel()
+
+            for track in window:
+                if track not in self._futures:
+                    self._futures[track] = self.executor.submit(self.resolve, track)
+
+            self._next_track = window[0] if window else None
+            future = self._futures[self._next_track] if self._next_track else None
+            if future is None or (future is self._preloading and not self._standby_lost(future)):
+                return
+            # A queue that did not change must not preload the same track again, unless
+            # the standby player was discarded meanwhile, e.g. by playing another track
+            self._preloading = future
+            next_track = self._next_track
+        future.add_done_callback(lambda future: self._preload(next_track, future))
+
+    def take(self, track: str) -> Optional[Resolution]:
+        """
+        Return the prefetched resolution of a track, or None if it was never
+        prefetched or its URL expired while it sat in the queue.
+
+        If the track is still being resolved this waits for it rather than
+        starting a second resolve.
+        """
+        with self._lock:
+            future = self._futures.pop(track, None)
+        if future is None or future.cancelled():
+            return None
+        try:
+            resolution = future.result()
+        except Exception:
+            return None
+        if StreamCache.url_expiry(resolution.source) <= time.time():
+            return None
+        return resolution
+
+    def shutdown(self):
+        """Cancel pending work and stop the worker threads."""
+        with self._lock:
+            self._futures.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _standby_lost(self, future: Future) -> bool:
+        """Whether the resolved track of `future` was preloaded and is no longer on standby"""
+        if not future.done() or future.cancelled() or future.exception():
+            return False
+        return self.player.standby_track() != future.result().source
+
+    def _preload(self, track: str, future: Future):
+        with self._lock:
+            if track != self._next_track:
+                return
+        if future.cancelled() or future.exception():
+            return
+        self.player.preload(future.result().source)
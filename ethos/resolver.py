@@ -0,0 +1,159 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import (CancelledError, Executor, FIRST_COMPLETED, Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor, TimeoutError, wait)
+from typing import Optional
+from yt_dlp import YoutubeDL
+
+YDL_OPTS = {
+    'format': 'bestaudio/best',
+    'noplaylist': True,
+    'quiet': True,
+    'default_search': 'ytsearch1',
+    'socket_timeout': 15,
+}
+
+_local = threading.local()
+
+
+class PoolBusy(RuntimeError):
+    """A background extraction was refused because it would have to wait for a worker"""
+
+
+def _get_ydl() -> YoutubeDL:
+    """Return this worker's YoutubeDL, creating (and warming up) it on first use"""
+    ydl = getattr(_local, "ydl", None)
+    if ydl is None:
+        ydl = _local.ydl = YoutubeDL(YDL_OPTS)
+    return ydl
+
+
+def _extract(target: str) -> dict:
+    """Extract a stream in a pool worker, returns `{"id", "url", "headers"}`"""
+    result = _get_ydl().extract_info(target, download=False)
+    if 'entries' in result:
+        result = result['entries'][0]
+    # The stream host may refuse requests without the headers yt-dlp resolved it with
+    return {"id": result['id'], "url": result['url'], "headers": result.get('http_headers') or {}}
+
+
+class ResolverPool:
+    """
+    Long-lived pool of warm yt-dlp extractors.
+
+    Extraction runs in a small pool of worker processes (so it does not fight the
+    Textual UI for the GIL), each keeping one `YoutubeDL` instance alive between
+    calls. Concurrency is bounded by the number of workers; every request returns
+    a future and can be awaited, timed out or cancelled.
+
+    Background requests (speculation) never queue: they are refused with
+    `PoolBusy` unless a worker is idle, and leave at least one worker to the
+    requests the user is waiting for, so they cannot push those past their timeout.
+    """
+
+    def __init__(self, workers: int = 2, timeout: float = 30.0, processes: bool = True):
+        self.workers = workers
+        self.timeout = timeout
+        self.processes = processes
+        self._executor: Optional[Executor] = None
+        self._closed = Future()  # Completed by `shutdown`, wakes up callers blocked in `extract`
+        self._pending = 0  # Submitted requests that are not done yet
+        self._background = 0  # The background ones among them
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self._closed.done():
+                    self._closed = Future()
+                if self.processes:
+                    # Spawn: forking a process that runs libvlc and Textual threads is not safe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_get_ydl,
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix="ethos-resolver",
+                        initializer=_get_ydl,
+                    )
+            return self._executor
+
+    def submit(self, target: str, background: bool = False) -> Future:
+        """
+        Queue an extraction.
+
+        Args:
+        - target (str): A search query or a video URL.
+        - background (bool): Only run it on an idle worker, see the class docstring.
+
+        Returns:
+        - Future: Resolves to `{"id": <video id>, "url": <stream url>, "headers": <HTTP
+                  headers to fetch it with>}`. Cancelling
+                  it drops the request if it has not started yet.
+
+        Raises:
+        - PoolBusy: If a background request would have to wait for a worker.
+        """
+        executor = self.executor
+        with self._lock:
+            if background and (self._pending >= self.workers or self._background >= max(1, self.workers - 1)):
+                raise PoolBusy(f"No idle resolver worker for {target!r}")
+            future = executor.submit(_extract, target)
+            self._pending += 1
+            self._background += background
+        future.add_done_callback(lambda future: self._release(background))
+        return future
+
+    def extract(self, target: str, timeout: Optional[float] = None, background: bool = False) -> dict:
+        """
+        Extract a stream, blocking for at most `timeout` seconds.
+
+        Raises:
+        - PoolBusy: If a background request would have to wait for a worker.
+        - TimeoutError: If the extraction did not finish in time. The request is
+                        cancelled, or its result discarded if it already started.
+        - CancelledError: If the pool was shut down while waiting.
+        """
+        future = self.submit(target, background)
+        closed = self._closed
+        done, _ = wait([future, closed], self.timeout if timeout is None else timeout, FIRST_COMPLETED)
+        if future in done:
+            return future.result()
+        future.cancel()
+        if closed in done:
+            raise CancelledError("resolver pool shut down")
+        raise TimeoutError()
+
+    async def extract_async(self, target: str, timeout: Optional[float] = None) -> dict:
+        """Awaitable version of `extract`"""
+        future = self.submit(target)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout if timeout is None else timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            future.cancel()
+            raise
+
+    def _release(self, background: bool):
+        with self._lock:
+            self._pending -= 1
+            self._background -= background
+
+    def shutdown(self):
+        """Cancel queued requests and stop the workers, an extraction in progress is abandoned"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            closed = self._closed
+        if not closed.done():
+            closed.set_result(None)
+        if executor is None:
+            return
+        # A running extraction cannot be cancelled, its process is stopped so that exit does not wait for it
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
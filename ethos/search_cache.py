@@ -0,0 +1,140 @@
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class SearchCache:
+    """
+    Tiered cache for search results: an in-memory LRU in front of a persistent
+    SQLite store, both with a TTL and a size cap.
+
+    Identical queries that are already in flight are coalesced so that only one
+    request goes out, and hit/miss counters are kept in `stats` for tuning.
+    """
+
+    def __init__(
+        self,
+        db_file: Optional[Path] = None,
+        ttl: float = 24 * 3600,
+        memory_entries: int = 256,
+        disk_entries: int = 5000,
+    ):
+        self.db_file = db_file or Path.home() / ".ethos" / "cache" / "search.db"
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0}
+        self._memory: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return re.sub(r"\s+", " ", query).strip().lower()
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.db_file.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.db_file, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "query TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS search_cache_expires ON search_cache (expires)")
+        return self._db
+
+    def get(self, query: str) -> Optional[Any]:
+        """Return the cached value of a query, or None on a miss"""
+        key = self.normalize(query)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] > now:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry[1]
+
+            try:
+                row = self.db.execute(
+                    "SELECT value, expires FROM search_cache WHERE query = ? AND expires > ?", (key, now)
+                ).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row:
+                value = json.loads(row[0])
+                self._remember(key, row[1], value)
+                self.stats["disk_hits"] += 1
+                return value
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, query: str, value: Any):
+        """Store a value in both tiers"""
+        key = self.normalize(query)
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires, value)
+            try:
+                with self.db:
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO search_cache (query, value, expires) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), expires),
+                    )
+                    self.db.execute("DELETE FROM search_cache WHERE expires <= ?", (time.time(),))
+                    self.db.execute(
+                        "DELETE FROM search_cache WHERE query NOT IN "
+                        "(SELECT query FROM search_cache ORDER BY expires DESC LIMIT ?)",
+                        (self.disk_entries,),
+                    )
+            except sqlite3.Error as e:
+                print(f"Error writing search cache: {e}")
+
+    async def get_or_fetch(self, query: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value of a query, calling `fetch` on a miss.
+
+        Concurrent calls for the same query wait on the first one's fetch. Empty
+        results are returned but not cached.
+        """
+        value = self.get(query)
+        if value is not None:
+            return value
+
+        key = self.normalize(query)
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(in_flight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await fetch()
+            if value:
+                self.put(query, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark as retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def _remember(self, key: str, expires: float, value: Any):
+        self._memory[key] = (expires, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
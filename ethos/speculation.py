@@ -0,0 +1,89 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from ethos.track_resolver import Resolution
+
+
+class SpeculativeResolver:
+    """
+    Resolves the top search results in the background while the user is choosing.
+
+    `speculate` starts resolving the first `depth` results as soon as they are
+    displayed; the resolve function goes through the stream cache, so even an
+    unused result makes a later pick of it instant. Picking a result with `take`
+    hands over its (possibly still running) resolve and drops the others, any
+    other command should call `cancel`.
+
+    `stats` counts speculative resolves that were used, wasted (ran but were not
+    picked) or cancelled before they started; `wasted_ratio` helps tuning `depth`.
+    """
+
+    def __init__(self, resolve: Callable[[str], Resolution], depth: int = 2):
+        self.resolve = resolve
+        self.depth = depth
+        self.executor = ThreadPoolExecutor(max_workers=max(1, depth), thread_name_prefix="ethos-speculate")
+        self.stats = {"started": 0, "used": 0, "wasted": 0, "cancelled": 0}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def speculate(self, tracks: List[str]):
+        """
+        Start resolving the first results of a new search, dropping the previous ones.
+
+        Args:
+        - tracks (list[str]): The displayed results, in order.
+        """
+        self.cancel()
+        with self._lock:
+            for track in tracks[:self.depth]:
+                self._futures[track] = self.executor.submit(self.resolve, track)
+                self.stats["started"] += 1
+
+    def take(self, track: str) -> Optional[Resolution]:
+        """
+        Return the speculative resolution of the picked track, waiting for it if
+        it is still in flight, or None if it was not speculated on.
+        """
+        with self._lock:
+            future = self._futures.pop(track, None)
+        self.cancel()
+        if future is None:
+            return None
+        if future.cancel():
+            # Had not started yet, resolving it on the caller's thread is just as fast
+            self._count("cancelled")
+            return None
+        try:
+            resolution = future.result()
+        except Exception:
+            self._count("wasted")
+            return None
+        self._count("used")
+        return resolution
+
+    def cancel(self):
+        """Drop all outstanding speculation, e.g. when the user issues another command"""
+        with self._lock:
+            futures, self._futures = self._futures, {}
+        for future in futures.values():
+            # A running resolve cannot be interrupted, its work is wasted
+            self._count("cancelled" if future.cancel() else "wasted")
+
+    @property
+    def wasted_ratio(self) -> float:
+        """Share of the speculative resolves that ran without being used"""
+        with self._lock:
+            ran = self.stats["used"] + self.stats["wasted"]
+            return self.stats["wasted"] / ran if ran else 0.0
+
+    def summary(self) -> str:
+        return (f"speculation: {self.stats['used']} used, {self.stats['wasted']} wasted "
+                f"({self.wasted_ratio:.0%}), {self.stats['cancelled']} cancelled before starting")
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self.stats[outcome] += 1
@@ -0,0 +1,329 @@
+import asyncio
+import base64
+import importlib.util
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional
+import httpx
+
+
+class SpotifyError(Exception):
+    """Raised when the Spotify API answers with an error"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TokenCache:
+    """
+    Caches a client-credentials access token until shortly before it expires.
+
+    A token close to its deadline is still handed out while a refresh runs in the
+    background; an expired one is refreshed before returning. Concurrent callers
+    share a single in-flight refresh. Optionally the token is also kept on disk
+    so that it survives restarts.
+    """
+
+    REFRESH_MARGIN = 60  # Never hand out a token that expires within a minute
+    BACKGROUND_WINDOW = 300  # Start refreshing in the background 5 minutes before expiry
+
+    def __init__(self, fetch: Callable[[], Awaitable[dict]], key: str, cache_file: Optional[Path] = None):
+        self.fetch = fetch
+        self.key = key
+        self.cache_file = cache_file
+        self.token: Optional[str] = None
+        self.expires_at = 0.0
+        self._refresh: Optional[asyncio.Task] = None
+        self._load()
+
+    async def get(self) -> str:
+        """Return a valid access token, refreshing it if needed"""
+        remaining = self.expires_at - time.time()
+        if self.token and remaining > self.REFRESH_MARGIN:
+            if remaining < self.BACKGROUND_WINDOW:
+                self._start_refresh()
+            return self.token
+        return await asyncio.shield(self._start_refresh())
+
+    def invalidate(self):
+        """Forget the current token, e.g. after the API rejected it"""
+        self.token = None
+        self.expires_at = 0.0
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh is None or self._refresh.done() or self._refresh.get_loop() is not asyncio.get_running_loop():
+            self._refresh = asyncio.ensure_future(self._do_refresh())
+        return self._refresh
+
+    async def _do_refresh(self) -> str:
+        try:
+            data = await self.fetch()
+        except Exception as e:
+            if self.token and self.expires_at - time.time() > self.REFRESH_MARGIN:
+                return self.token  # Background refresh failed, keep using the current token
+            raise e
+        self.token = data["access_token"]
+        self.expires_at = time.time() + data.get("expires_in", 3600)
+        self._save()
+        return self.token
+
+    def _load(self):
+        if not self.cache_file:
+            return
+        try:
+            with open(self.cache_file, "r") as file:
+                data = json.load(file)
+            if data.get("key") == self.key:
+                self.token = data["access_token"]
+                self.expires_at = data["expires_at"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _save(self):
+        if not self.cache_file:
+            return
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.cache_file.with_suffix(".tmp")
+            fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as file:
+                json.dump({"key": self.key, "access_token": self.token, "expires_at": self.expires_at}, file)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            print(f"Error writing token cache: {e}")
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the request rate to `rate` requests per second with
+    bursts of up to `burst` requests. A `Retry-After` from the server pauses the
+    whole bucket, not only the request that received it.
+
+    The bucket can be shared between coroutines (`acquire`) and threads (`wait`).
+    """
+
+    def __init__(self, rate: float = 10.0, burst: int = 10):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        while True:
+            delay = self._take()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def wait(self):
+        """Block the calling thread until a request may be sent"""
+        while True:
+            delay = self._take()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Hold back all requests for `seconds`"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _take(self) -> float:
+        """Take a token if one is available, otherwise return how long to wait for one"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+
+class SpotifyClient:
+    """
+    Shared HTTP client for all Spotify Web API calls.
+
+    Owns a single keep-alive connection pool (HTTP/2 when the `h2` package is
+    installed), so consecutive requests reuse the same TCP+TLS connection
+    instead of paying a fresh handshake each time. Close it with `aclose` on exit.
+
+    Requests go through a token-bucket rate limiter and a concurrency cap.
+    429 and transient 5xx responses (and connection errors) are retried with
+    jittered exponential backoff, honouring `Retry-After` when the server sends it.
+    A 401 on a token handed out by `access_token` (revoked early, or the clock
+    is off) drops that token and retries once with a fresh one.
+    The API and token URLs can be pointed at a local fake server for testing.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    API_URL = "https://api.spotify.com/v1"
+    TOKEN_URL = "https://accounts.spotify.com/api/token"
+
+    def __init__(
+        self,
+        max_connections: int = 10,
+        max_keepalive_connections: int = 5,
+        keepalive_expiry: float = 60.0,
+        timeout: float = 10.0,
+        http2: Optional[bool] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        token_file: Optional[Path] = None,
+        rate: float = 10.0,
+        burst: int = 10,
+        max_concurrency: int = 5,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 30.0,
+        api_url: Optional[str] = None,
+        token_url: Optional[str] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout)
+        self.http2 = importlib.util.find_spec("h2") is not None if http2 is None else http2
+        self.transport = transport
+        self.token_file = token_file
+        self.limiter = RateLimiter(rate, burst)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.api_url = api_url or self.API_URL
+        self.token_url = token_url or self.TOKEN_URL
+        self._tokens: Dict[str, TokenCache] = {}
+        self._issuers: Dict[str, TokenCache] = {}  # Token handed out -> the cache it came from
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        The pooled client, (re)created if it is used from a different event loop.
+
+        The client of the previous loop is closed on that loop if it still runs.
+        A closed loop cannot run its `aclose` any more, so that client is only
+        dropped and its sockets are closed when it is garbage collected.
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            stale, stale_loop = self._client, self._loop
+            if stale is not None and not stale.is_closed and stale_loop.is_running():
+                asyncio.run_coroutine_threadsafe(stale.aclose(), stale_loop)
+            self._client = httpx.AsyncClient(
+                limits=self.limits, timeout=self.timeout, http2=self.http2, transport=self.transport
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff delay for a retry attempt"""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    @staticmethod
+    def retry_after(response: httpx.Response) -> Optional[float]:
+        """Seconds to wait according to the `Retry-After` header, if any"""
+        try:
+            return max(0.0, float(response.headers["Retry-After"]))
+        except (KeyError, ValueError):
+            return None
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request through the rate limiter, retrying throttled and transient failures.
+
+        Returns the last response once retries are exhausted, connection errors
+        are re-raised.
+        """
+        client = self.client
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            try:
+                async with self._semaphore:
+                    response = await client.request(method, url, **kwargs)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+
+            if response.status_code not in self.RETRY_STATUSES or attempt == self.max_retries:
+                return response
+            delay = self.retry_after(response)
+            if delay is None:
+                delay = self.backoff(attempt)
+            if response.status_code == 429:
+                self.limiter.pause(delay)
+            await asyncio.sleep(delay)
+        return response
+
+    async def request_token(self, client_id: str, client_secret: str) -> httpx.Response:
+        """Request an access token with the client credentials flow"""
+        headers = {
+            "Authorization": "Basic " + base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+        }
+        data = {"grant_type": "client_credentials"}
+        return await self.request("POST", self.token_url, headers=headers, data=data)
+
+    async def access_token(self, client_id: str, client_secret: str) -> str:
+        """
+        Return a cached client-credentials token, requesting a new one only when
+        the cached token is about to expire.
+        """
+        if client_id not in self._tokens:
+
+            async def fetch() -> dict:
+                response = await self.request_token(client_id, client_secret)
+                response_data = response.json()
+                if response.status_code != 200:
+                    raise SpotifyError(f"Failed to get token: {response_data}", response.status_code)
+                return response_data
+
+            self._tokens[client_id] = TokenCache(fetch, client_id, self.token_file)
+        cache = self._tokens[client_id]
+        token = await cache.get()
+        self._issuers[token] = cache
+        return token
+
+    async def get(self, path: str, token: str, params: Optional[dict] = None) -> httpx.Response:
+        """
+        Send a GET request to the Web API.
+
+        Args:
+        - path (str): An API path such as `/search`, or a full URL.
+        - token (str): The bearer token.
+        - params (dict): Optional query parameters.
+        """
+        url = path if "://" in path else f"{self.api_url}{path}"
+        response = await self.request("GET", url, headers={"Authorization": f"Bearer {token}"}, params=params)
+        cache = self._issuers.get(token)
+        if response.status_code != 401 or cache is None:
+            return response
+
+        if cache.token == token:  # Not already replaced by a concurrent request
+            cache.invalidate()
+        fresh = await cache.get()
+        self._issuers[fresh] = cache
+        return await self.request("GET", url, headers={"Authorization": f"Bearer {fresh}"}, params=params)
+
+    async def aclose(self):
+        """Close the pooled connections"""
+        client, self._client = self._client, None
+        if client is not None and not client.is_closed:
+            await client.aclose()
@@ -1,96 +1,277 @@
 import os
-import json
-from pathlib import Path
-from spotipy import Spotify
+import random
+import threading
+import time
+import warnings
+from difflib import SequenceMatcher
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Optional
+from spotipy import Spotify, SpotifyException
 from spotipy.oauth2 import SpotifyOAuth
+from ethos.spotify_client import RateLimiter
+from ethos.store import UserStore
 
 class SpotifyImporter:
     """
     Class for interacting with Spotify's API to fetch and manage playlist data locally.
 
-    This class authenticates a user, fetches playlists, saves their tracks as JSON files,
-    and provides methods to refresh playlist data.
+    This class authenticates a user, fetches playlists, saves their tracks in the
+    user store, and provides methods to refresh playlist data.
+
+    Every API call goes through a token-bucket rate limiter and a cap on the
+    number of requests in flight, shared by all threads of the importer.
+    Rate limiting (429, honouring Retry-After) and transient 5xx errors are
+    retried with jittered exponential backoff instead of failing the import
+    halfway through; a 429 pauses the whole bucket.
     """
-    def __init__(self, client_id: str, client_secret: str, redirect_uri: str):
+
+    RETRIES = 10
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    BACKOFF_BASE = 0.5
+    BACKOFF_CAP = 30.0
+    RATE = 10.0  # Requests per second
+    BURST = 10
+    MAX_CONCURRENCY = 8  # Requests in flight, below the 10 connections of the requests session
+    REQUESTS_TIMEOUT = 10
+    TRACKS_PAGE_SIZE = 100  # Maximum page size of the playlist tracks endpoint
+    PLAYLISTS_PAGE_SIZE = 50  # Maximum page size of the user playlists endpoint
+    MAX_PAGE_WORKERS = 8
+    MAX_REFRESH_WORKERS = 4
+    TRACK_FIELDS = "items(track(id,uri,name,artists(name))),total"  # Only download what is stored
+    def __init__(self, client_id: str, client_secret: str, redirect_uri: str, store: Optional[UserStore] = None):
         self.client_id = client_id
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri
         self.spotify = self._authenticate()
-        self.config_dir = Path.home() / ".ethos"
+        self.store = store or UserStore()
+        self.limiter = RateLimiter(self.RATE, self.BURST)
+        self._in_flight = threading.BoundedSemaphore(self.MAX_CONCURRENCY)
+        # One pool for the pages of every playlist, so concurrent refreshes don't multiply the threads
+        self._page_pool = ThreadPoolExecutor(max_workers=self.MAX_PAGE_WORKERS, thread_name_prefix="ethos-spotify")
 
     def _authenticate(self) -> Spotify:
         scope = "user-library-read playlist-read-private"
         auth_manager = SpotifyOAuth(client_id=self.client_id, client_secret=self.client_secret, redirect_uri=self.redirect_uri, scope=scope)
-        return Spotify(auth_manager=auth_manager)
+        # Throttled and failed responses are retried by `_call`, spotipy only retries connection errors
+        return Spotify(
+            auth_manager=auth_manager,
+            retries=self.RETRIES,
+            status_retries=0,
+            requests_timeout=self.REQUESTS_TIMEOUT,
+        )
 
-    def fetch_playlists(self):
-        # Retrieve the playlists for the authenticated Spotify user
-        playlists = self.spotify.current_user_playlists()
-        return playlists['items']
+    def _call(self, request: Callable, *args, **kwargs):
+        """Send a spotipy request through the rate limiter and the concurrency cap, retrying throttled and transient failures"""
+        for attempt in range(self.RETRIES + 1):
+            self.limiter.wait()
+            try:
+                with self._in_flight:
+                    return request(*args, **kwargs)
+            except SpotifyException as e:
+                if e.http_status not in self.RETRY_STATUSES or attempt == self.RETRIES:
+                    raise
+                delay = self.retry_after(e)
+                if delay is None:
+                    delay = self.backoff(attempt)
+                if e.http_status == 429:
+                    self.limiter.pause(delay)
+                time.sleep(delay)
 
-    def save_playlist_to_json(self, playlist_id: str, playlist_name: str):
-        # Fetch all tracks from the playlist
-        results = self.spotify.playlist_tracks(playlist_id)
-        tracks = results['items']
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff delay for a retry attempt"""
+        return random.uniform(0, min(self.BACKOFF_CAP, self.BACKOFF_BASE * 2 ** attempt))
+
+    @staticmethod
+    def retry_after(error: SpotifyException) -> Optional[float]:
+        """Seconds to wait according to the `Retry-After` header, if any"""
+        try:
+            return max(0.0, float(error.headers["Retry-After"]))
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def _fetch_all_pages(self, fetch_page: Callable[[int, int], dict], page_size: int,
+                         progress: Optional[Callable[[int, int], None]] = None) -> list:
+        """
+        Fetch every item of a paginated endpoint.
+
+        The first page tells the total, the remaining pages are then fetched
+        concurrently on the shared page pool and returned in order.
+
+        Args:
+            fetch_page: Called with (limit, offset), returns a Spotify paging object.
+            page_size (int): Items per page.
+            progress: Optional callback receiving (items fetched, total items).
+        """
+        first_page = self._call(fetch_page, page_size, 0)
+        items = list(first_page['items'])
+        total = first_page['total']
+        if progress:
+            progress(len(items), total)
+
+        offsets = range(page_size, total, page_size)
+        for page in self._page_pool.map(lambda offset: self._call(fetch_page, page_size, offset), offsets):
+            items.extend(page['items'])
+            if progress:
+                progress(len(items), total)
+        return items
+
+    def fetch_playlists(self, progress: Optional[Callable[[int, int], None]] = None):
+        # Retrieve all the playlists for the authenticated Spotify user
+        return self._fetch_all_pages(
+            lambda limit, offset: self.spotify.current_user_playlists(limit=limit, offset=offset),
+            self.PLAYLISTS_PAGE_SIZE,
+            progress,
+        )
 
+    def fetch_playlist_tracks(self, playlist_id: str, progress: Optional[Callable[[int, int], None]] = None) -> list:
+        """Fetch all tracks of a playlist as a list of {'id', 'name', 'artist'} dicts"""
+        items = self._fetch_all_pages(
+            lambda limit, offset: self.spotify.playlist_tracks(
+                playlist_id, fields=self.TRACK_FIELDS, limit=limit, offset=offset
+            ),
+            self.TRACKS_PAGE_SIZE,
+            progress,
+        )
         songs = []  # Create a list of songs with their name and artist's name
-        for item in tracks:
+        for item in items:
             track = item['track']
-            song_info = {
+            if not track:  # Tracks that are no longer available
+                continue
+            songs.append({
+                'id': track.get('id') or track.get('uri'),  # Local files have no ID, only a URI
                 'name': track['name'],
                 'artist': track['artists'][0]['name']
-            }
-            songs.append(song_info)
+            })
+        return songs
 
-        self.config_dir.mkdir(exist_ok=True)
-        playlist_file = self.config_dir / f"{playlist_name}.json"
-        with open(playlist_file, 'w') as f:
-            json.dump(songs, f, indent=4)
+    def save_playlist(self, playlist_id: str, playlist_name: str,
+                      progress: Optional[Callable[[int, int], None]] = None,
+                      snapshot_id: Optional[str] = None):
+        # Fetch all tracks from the playlist
+        songs = self.fetch_playlist_tracks(playlist_id, progress)
+        self.store.replace_playlist(playlist_name, songs, playlist_id, snapshot_id)
 
-    def refresh_all_playlists(self):
-        # Refreshes all playlists by fetching the latest data and saving it to JSON files.
-        playlists = self.fetch_playlists()
-        for playlist in playlists:
-            self.refresh_playlist(playlist['id'], playlist['name'])
+    def save_playlist_to_json(self, playlist_id: str, playlist_name: str, *args, **kwargs):
+        """Deprecated alias of `save_playlist`, playlists are saved to the store now"""
+        warnings.warn("save_playlist_to_json is deprecated, use save_playlist", DeprecationWarning, stacklevel=2)
+        return self.save_playlist(playlist_id, playlist_name, *args, **kwargs)
 
-    def refresh_playlist(self, playlist_id: str, playlist_name: str):
+    def refresh_all_playlists(self, max_workers: Optional[int] = None) -> dict:
         """
-        Refreshes a specific playlist by updating the JSON file with new data.
-        If the file already exists, it adds any new songs not already saved.
+        Refreshes all playlists by fetching the latest data and saving it to the store.
+
+        Playlists whose `snapshot_id` matches the stored one are skipped without
+        fetching their tracks, so a refresh where nothing changed costs only the
+        playlist listing. Changed playlists are refreshed concurrently on a
+        bounded thread pool; a failing playlist does not stop the others.
 
         Args:
-            playlist_id (str): The unique ID of the playlist.
-            playlist_name (str): The name of the playlist for the JSON file.
+            max_workers (int): Number of playlists refreshed at once,
+                defaults to `MAX_REFRESH_WORKERS`.
+
+        Returns:
+            dict: A summary of the run, keyed by Spotify playlist ID since
+                several playlists may share a name:
+                - 'refreshed': playlist ID -> {'name', 'diff' (see `diff_tracks`)}
+                - 'unchanged': playlist ID -> {'name'} of the skipped playlists
+                - 'failed': playlist ID -> {'name', 'error' (the error message)}
+                - 'timings': playlist ID -> seconds spent refreshing it
+                - 'total_seconds': wall-clock time of the whole run
+        """
+        start = time.perf_counter()
+        summary = {'refreshed': {}, 'unchanged': {}, 'failed': {}, 'timings': {}, 'total_seconds': 0.0}
+        snapshots = self.store.playlist_snapshots()
+
+        changed = []
+        for playlist in self.fetch_playlists():
+            stored = snapshots.get(playlist['id'], {})
+            unchanged = (
+                stored.get('snapshot_id') == playlist.get('snapshot_id')
+                and stored.get('name') == playlist['name']
+            )
+            if unchanged:
+                summary['unchanged'][playlist['id']] = {'name': playlist['name']}
+            else:
+                changed.append(playlist)
+
+        def refresh(playlist: dict):
+            playlist_start = time.perf_counter()
+            try:
+                return self.refresh_playlist(playlist['id'], playlist['name'], snapshot_id=playlist.get('snapshot_id'))
+            finally:
+                summary['timings'][playlist['id']] = time.perf_counter() - playlist_start
+
+        if changed:
+            with ThreadPoolExecutor(max_workers=max_workers or self.MAX_REFRESH_WORKERS) as executor:
+                futures = {executor.submit(refresh, playlist): playlist for playlist in changed}
+                for future in as_completed(futures):
+                    playlist = futures[future]
+                    try:
+                        summary['refreshed'][playlist['id']] = {'name': playlist['name'], 'diff': future.result()}
+                    except Exception as e:
+                        summary['failed'][playlist['id']] = {'name': playlist['name'], 'error': str(e)}
+
+        summary['total_seconds'] = time.perf_counter() - start
+        return summary
+
+    @staticmethod
+    def diff_tracks(old_ids: list, new_ids: list) -> dict:
         """
-        results = self.spotify.playlist_tracks(playlist_id)
-        tracks = results['items']
+        Diff two ordered lists of track IDs.
+
+        Returns:
+            dict: {'added': [...], 'removed': [...], 'moved': [...]} where `moved`
+                  lists the tracks kept in both versions that had to move, i.e.
+                  the ones outside the longest run of tracks kept in order.
+        """
+        old_set, new_set = set(old_ids), set(new_ids)
+        kept_old = [track_id for track_id in old_ids if track_id in new_set]
+        kept_new = [track_id for track_id in new_ids if track_id in old_set]
+        in_order = set()
+        for block in SequenceMatcher(None, kept_old, kept_new, autojunk=False).get_matching_blocks():
+            in_order.update(range(block.b, block.b + block.size))
+        return {
+            'added': [track_id for track_id in new_ids if track_id not in old_set],
+            'removed': [track_id for track_id in old_ids if track_id not in new_set],
+            'moved': [track_id for position, track_id in enumerate(kept_new) if position not in in_order],
+        }
+
+    def refresh_playlist(self, playlist_id: str, playlist_name: str,
+                         progress: Optional[Callable[[int, int], None]] = None,
+                         snapshot_id: Optional[str] = None) -> dict:
+        """
+        Refreshes a specific playlist so that the stored copy mirrors the playlist
+        on Spotify, in the same order. Tracks are matched by Spotify ID, so
+        additions, removals and reorders are all picked up.
+
+        Args:
+            playlist_id (str): The unique ID of the playlist.
+            playlist_name (str): The current name of the playlist, a playlist renamed
+                on Spotify is renamed in the store.
+            progress: Optional callback receiving (tracks fetched, total tracks).
+            snapshot_id (str): The playlist's current snapshot ID, stored so that
+                the next refresh can skip the playlist if it is unchanged.
 
+        Returns:
+            dict: The diff against the previously saved version (see `diff_tracks`).
+        """
         # Create a list of the latest songs
-        new_songs = []
-        for item in tracks:
-            track = item['track']
-            song_info = {
-                'name': track['name'],
-                'artist': track['artists'][0]['name']
-            }
-            new_songs.append(song_info)
+        new_songs = self.fetch_playlist_tracks(playlist_id, progress)
+
+        existing_songs = self.store.playlist_tracks(spotify_id=playlist_id)
 
-        # Where the playlist JSON file will be stored
-        playlist_file = self.config_dir / f"{playlist_name}.json"
-        if playlist_file.exists(): # If the file exists, load the current songs and only append new ones
-            with open(playlist_file, 'r') as f: 
-                existing_songs = json.load(f)
-            existing_song_names = {song['name'] for song in existing_songs}
-            for song in new_songs:
-                if song['name'] not in existing_song_names:
-                    existing_songs.append(song)
-            with open(playlist_file, 'w') as f: # Save the updated playlist data 
-                json.dump(existing_songs, f, indent=4)
-        else:
-            with open(playlist_file, 'w') as f: # If the file exists, load the current songs and only append new ones
-                json.dump(new_songs, f, indent=4)
+        # Tracks saved before they had Spotify IDs are simply replaced
+        diff = self.diff_tracks(
+            [song['id'] for song in existing_songs if song.get('id')],
+            [song['id'] for song in new_songs],
+        )
 
-       # print(f"Playlist '{playlist_name}' has been refreshed.")
+        self.store.replace_playlist(playlist_name, new_songs, playlist_id, snapshot_id) # Save the updated playlist data 
+        return diff
+
+    def shutdown(self):
+        """Stop the page fetching threads, the importer cannot fetch anything afterwards"""
+        self._page_pool.shutdown(wait=True, cancel_futures=True)
 
 
 
@@ -103,16 +284,28 @@ if __name__ == "__main__":
     redirect_uri = os.getenv("REDIRECT_URI") or "http://localhost:3000/"
 
     importer = SpotifyImporter(client_id, client_secret, redirect_uri)
-    playlists = importer.fetch_playlists()
+    try:
+        playlists = importer.fetch_playlists()
+
+        print("Available Playlists:")
+        for idx, playlist in enumerate(playlists):
+            print(f"{idx + 1}. {playlist['name']}")
 
-    print("Available Playlists:")
-    for idx, playlist in enumerate(playlists):
-        print(f"{idx + 1}. {playlist['name']}")
+        choice = int(input("Select a playlist to import: ")) - 1
+        selected_playlist = playlists[choice]
+        importer.save_playlist(
+            selected_playlist['id'],
+            selected_playlist['name'],
+            snapshot_id=selected_playlist['snapshot_id'],
+            progress=lambda done, total: print(f"Fetched {done}/{total} tracks", end="\r"),
+        )
 
-    choice = int(input("Select a playlist to import: ")) - 1
-    selected_playlist = playlists[choice]
-    importer.save_playlist_to_json(selected_playlist['id'], selected_playlist['name'])
+        print(f"Playlist '{selected_playlist['name']}' has been saved.")
 
-    print(f"Playlist '{selected_playlist['name']}' has been saved.")
-    
-    importer.refresh_all_playlists() # Refresh all playlists
+        summary = importer.refresh_all_playlists() # Refresh all playlists
+        print(
+            f"Refreshed {len(summary['refreshed'])}, unchanged {len(summary['unchanged'])}, "
+            f"failed {len(summary['failed'])} playlists in {summary['total_seconds']:.2f}s"
+        )
+    finally:
+        importer.shutdown()
@@ -0,0 +1,357 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from ethos.tools.helper import Format
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    artist TEXT NOT NULL DEFAULT '',
+    spotify_id TEXT,
+    last_played REAL
+);
+CREATE INDEX IF NOT EXISTS tracks_last_played ON tracks (last_played);
+-- Tracks with a Spotify ID are identified by it, the others by name and artist
+CREATE UNIQUE INDEX IF NOT EXISTS tracks_spotify_id ON tracks (spotify_id);
+CREATE UNIQUE INDEX IF NOT EXISTS tracks_name_artist ON tracks (name, artist) WHERE spotify_id IS NULL;
+CREATE TABLE IF NOT EXISTS playlists (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    imported INTEGER NOT NULL DEFAULT 0,  -- Imported from Spotify, spotify_id is NULL until its first refresh
+    spotify_id TEXT UNIQUE,
+    snapshot_id TEXT
+);
+-- Imported playlists are identified by their Spotify ID and may share a name, the others by name
+CREATE UNIQUE INDEX IF NOT EXISTS playlists_local_name ON playlists (name) WHERE NOT imported;
+CREATE INDEX IF NOT EXISTS playlists_name ON playlists (name);
+CREATE TABLE IF NOT EXISTS playlist_entries (
+    playlist_id INTEGER NOT NULL REFERENCES playlists (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    track_id INTEGER NOT NULL REFERENCES tracks (id),
+    PRIMARY KEY (playlist_id, position)
+);
+CREATE TABLE IF NOT EXISTS play_history (
+    id INTEGER PRIMARY KEY,
+    track_id INTEGER NOT NULL REFERENCES tracks (id),
+    played_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS play_history_played_at ON play_history (played_at);
+CREATE INDEX IF NOT EXISTS play_history_track ON play_history (track_id);
+CREATE TABLE IF NOT EXISTS listening_stats (
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    plays INTEGER NOT NULL DEFAULT 0,
+    seconds REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (period, bucket, kind, key)
+);
+CREATE INDEX IF NOT EXISTS listening_stats_top ON listening_stats (period, bucket, kind, plays);
+"""
+
+# Aggregation periods of the listening stats and how a timestamp maps to its bucket
+STATS_PERIODS = {
+    "day": "%Y-%m-%d",
+    "week": "%G-W%V",
+    "month": "%Y-%m",
+    "all": "all",
+}
+
+
+class UserStore:
+    """
+    Embedded SQLite store (WAL mode) for the user's data: tracks, playlists,
+    playlist entries and play history.
+
+    Every change is a small indexed insert/update instead of a full file rewrite,
+    e.g. prepending a track to a 10k-track playlist is a single row insert. On
+    first use the existing recents/playlist files under `~/.ethos` are migrated
+    into the database once; the old files are left in place.
+    """
+
+    def __init__(self, data_dir: Optional[Path] = None):
+        self.data_dir = data_dir or Path.home() / ".ethos"
+        self.db_file = self.data_dir / "ethos.db"
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._db is None:
+                self.data_dir.mkdir(parents=True, exist_ok=True)
+                db = sqlite3.connect(self.db_file, check_same_thread=False)
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                db.execute("PRAGMA foreign_keys=ON")
+                db.executescript(SCHEMA)
+                self._db = db
+                self._migrate()
+            return self._db
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    @staticmethod
+    def split_track(track: str) -> Tuple[str, str]:
+        """Split a "<song> by <artist>" string, tracks without an artist keep an empty one"""
+        try:
+            return Format.extract_song_and_artist(track.strip())
+        except ValueError:
+            return track.strip(), ""
+
+    @staticmethod
+    def format_track(name: str, artist: str) -> str:
+        return f"{name} by {artist}" if artist else name
+
+    def _track_id(self, name: str, artist: str, spotify_id: Optional[str] = None) -> int:
+        """
+        The row of a track, created if needed. A Spotify ID is matched on its own,
+        name and artist only identify tracks that have no ID.
+        """
+        db = self.db
+        db.execute("INSERT OR IGNORE INTO tracks (name, artist, spotify_id) VALUES (?, ?, ?)",
+                   (name, artist, spotify_id))
+        if spotify_id:
+            return db.execute("SELECT id FROM tracks WHERE spotify_id = ?", (spotify_id,)).fetchone()[0]
+        return db.execute(
+            "SELECT id FROM tracks WHERE name = ? AND artist = ? AND spotify_id IS NULL", (name, artist)
+        ).fetchone()[0]
+
+    def _playlist_id(self, name: str, spotify_id: Optional[str] = None, imported: bool = False) -> int:
+        """
+        The row of a playlist, created if needed. An imported playlist is matched
+        on its Spotify ID and takes the given name, renamed upstream or not.
+        One migrated from an importer file has no Spotify ID yet, the first
+        refresh of a playlist with its name adopts it.
+        """
+        db = self.db
+        if spotify_id:
+            db.execute(
+                "UPDATE playlists SET spotify_id = ? WHERE id = ("
+                "SELECT id FROM playlists WHERE name = ? AND imported AND spotify_id IS NULL ORDER BY id LIMIT 1"
+                ") AND NOT EXISTS (SELECT 1 FROM playlists WHERE spotify_id = ?)",
+                (spotify_id, name, spotify_id),
+            )
+            db.execute("INSERT OR IGNORE INTO playlists (name, imported, spotify_id) VALUES (?, 1, ?)", (name, spotify_id))
+            db.execute("UPDATE playlists SET name = ? WHERE spotify_id = ?", (name, spotify_id))
+            return db.execute("SELECT id FROM playlists WHERE spotify_id = ?", (spotify_id,)).fetchone()[0]
+        if imported:
+            return db.execute("INSERT INTO playlists (name, imported) VALUES (?, 1)", (name,)).lastrowid
+        db.execute("INSERT OR IGNORE INTO playlists (name) VALUES (?)", (name,))
+        return db.execute("SELECT id FROM playlists WHERE name = ? AND NOT imported", (name,)).fetchone()[0]
+
+    def _find_playlist(self, name: str) -> Optional[int]:
+        """The playlist a name refers to: the local one, or else the first imported one"""
+        row = self.db.execute(
+            "SELECT id FROM playlists WHERE name = ? ORDER BY imported, id LIMIT 1", (name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    # --- Play history --- #
+
+    def add_play(self, track: str, played_at: Optional[float] = None):
+        """Record that a track ("<song> by <artist>") was played"""
+        played_at = time.time() if played_at is None else played_at
+        with self._lock, self.db:
+            track_id = self._track_id(*self.split_track(track))
+            self.db.execute("INSERT INTO play_history (track_id, played_at) VALUES (?, ?)", (track_id, played_at))
+            self.db.execute("UPDATE tracks SET last_played = MAX(COALESCE(last_played, 0), ?) WHERE id = ?",
+                            (played_at, track_id))
+
+    def recent_tracks(self, limit: int = 10) -> List[str]:
+        """The most recently played distinct tracks, newest first"""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT name, artist FROM tracks WHERE last_played IS NOT NULL ORDER BY last_played DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [self.format_track(name, artist) for name, artist in rows]
+
+    # --- Listening stats --- #
+
+    @staticmethod
+    def stats_bucket(period: str, timestamp: float) -> str:
+        """The bucket of `period` ('day', 'week', 'month' or 'all') that a timestamp falls in"""
+        return time.strftime(STATS_PERIODS[period], time.localtime(timestamp))
+
+    def listen_keys(self, track: str, played_at: float) -> List[Tuple[str, str, str, str]]:
+        """The (period, bucket, kind, key) aggregates that a play of `track` counts towards"""
+        name, artist = self.split_track(track)
+        keys = []
+        for period in STATS_PERIODS:
+            bucket = self.stats_bucket(period, played_at)
+            keys.append((period, bucket, "total", ""))
+            keys.append((period, bucket, "track", self.format_track(name, artist)))
+            if artist:
+                keys.append((period, bucket, "artist", artist))
+        return keys
+
+    def add_listen(self, track: str, played_at: float, seconds: float):
+        """Count a play of `seconds` in the day/week/month/all-time aggregates"""
+        with self._lock, self.db:
+            self.db.executemany(
+                "INSERT INTO listening_stats (period, bucket, kind, key, plays, seconds) VALUES (?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT (period, bucket, kind, key) "
+                "DO UPDATE SET plays = plays + 1, seconds = seconds + excluded.seconds",
+                [(*key, seconds) for key in self.listen_keys(track, played_at)],
+            )
+
+    def top_listens(self, kind: str, period: str, bucket: str, limit: int = 10) -> List[Tuple[str, int]]:
+        """Most played tracks or artists (`kind`) of a bucket, as (key, plays) pairs"""
+        with self._lock:
+            return self.db.execute(
+                "SELECT key, plays FROM listening_stats WHERE period = ? AND bucket = ? AND kind = ? "
+                "ORDER BY plays DESC, seconds DESC LIMIT ?",
+                (period, bucket, kind, limit),
+            ).fetchall()
+
+    def listening_total(self, period: str, bucket: str) -> Tuple[int, float]:
+        """(plays, seconds listened) of a bucket"""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT plays, seconds FROM listening_stats WHERE period = ? AND bucket = ? AND kind = 'total'",
+                (period, bucket),
+            ).fetchone()
+        return row or (0, 0.0)
+
+    def replace_listening_stats(self, stats: dict, after: Optional[Dict[str, str]] = None):
+        """
+        Replace the aggregates in one transaction, `stats` maps (period, bucket, kind, key) to [plays, seconds].
+
+        With `after` ({period: bucket}) only the buckets of each period that come
+        after the given one are replaced, the earlier ones are kept as they are.
+        """
+        if after is not None:
+            stats = {key: totals for key, totals in stats.items() if key[1] > after[key[0]]}
+        with self._lock, self.db:
+            if after is None:
+                self.db.execute("DELETE FROM listening_stats")
+            else:
+                self.db.executemany(
+                    "DELETE FROM listening_stats WHERE period = ? AND bucket > ?", list(after.items())
+                )
+            self.db.executemany(
+                "INSERT INTO listening_stats (period, bucket, kind, key, plays, seconds) VALUES (?, ?, ?, ?, ?, ?)",
+                [(*key, plays, seconds) for key, (plays, seconds) in stats.items()],
+            )
+
+    # --- Playlists --- #
+
+    def playlist_names(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self.db.execute("SELECT name FROM playlists ORDER BY name, id")]
+
+    def playlist_tracks(self, playlist_name: Optional[str] = None, spotify_id: Optional[str] = None) -> List[dict]:
+        """
+        Tracks of a playlist in order, as {'id', 'name', 'artist'} dicts ('id' is the Spotify ID).
+
+        The playlist is looked up by its Spotify ID if one is given, otherwise by
+        name; a local playlist wins over imported ones of the same name, which
+        are taken in import order.
+        """
+        with self._lock:
+            if spotify_id:
+                row = self.db.execute("SELECT id FROM playlists WHERE spotify_id = ?", (spotify_id,)).fetchone()
+                playlist_id = row[0] if row else None
+            else:
+                playlist_id = self._find_playlist(playlist_name)
+            rows = self.db.execute(
+                "SELECT t.spotify_id, t.name, t.artist FROM playlist_entries e JOIN tracks t ON t.id = e.track_id "
+                "WHERE e.playlist_id = ? ORDER BY e.position",
+                (playlist_id,),
+            ).fetchall()
+        return [{'id': spotify_id, 'name': name, 'artist': artist} for spotify_id, name, artist in rows]
+
+    def add_to_playlist(self, playlist_name: str, name: str, artist: str, prepend: bool = True):
+        """Add a track at the top (or bottom) of a playlist, creating the playlist if needed"""
+        with self._lock, self.db:
+            playlist_id = self._find_playlist(playlist_name) or self._playlist_id(playlist_name)
+            track_id = self._track_id(name, artist)
+            bound = "MIN(position) - 1" if prepend else "MAX(position) + 1"
+            self.db.execute(
+                f"INSERT INTO playlist_entries (playlist_id, position, track_id) "
+                f"SELECT ?, COALESCE((SELECT {bound} FROM playlist_entries WHERE playlist_id = ?), 0), ?",
+                (playlist_id, playlist_id, track_id),
+            )
+
+    def replace_playlist(self, playlist_name: str, tracks: List[dict],
+                         spotify_id: Optional[str] = None, snapshot_id: Optional[str] = None):
+        """
+        Replace the content of a playlist in a single transaction. A playlist
+        imported from Spotify is identified by `spotify_id`, `playlist_name`
+        then only updates its name.
+        """
+        with self._lock, self.db:
+            self._replace_playlist(playlist_name, tracks, spotify_id, snapshot_id)
+
+    def _replace_playlist(self, playlist_name: str, tracks: List[dict],
+                          spotify_id: Optional[str], snapshot_id: Optional[str], imported: bool = False):
+        db = self.db
+        playlist_id = self._playlist_id(playlist_name, spotify_id, imported)
+        db.execute("UPDATE playlists SET snapshot_id = COALESCE(?, snapshot_id) WHERE id = ?", (snapshot_id, playlist_id))
+        db.execute("DELETE FROM playlist_entries WHERE playlist_id = ?", (playlist_id,))
+        db.executemany(
+            "INSERT INTO playlist_entries (playlist_id, position, track_id) VALUES (?, ?, ?)",
+            [
+                (playlist_id, position, self._track_id(track['name'], track['artist'], track.get('id')))
+                for position, track in enumerate(tracks)
+            ],
+        )
+
+    def playlist_snapshots(self) -> dict:
+        """{spotify playlist id: {'name', 'snapshot_id'}} of the imported playlists"""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT spotify_id, name, snapshot_id FROM playlists WHERE spotify_id IS NOT NULL"
+            ).fetchall()
+        return {spotify_id: {'name': name, 'snapshot_id': snapshot_id} for spotify_id, name, snapshot_id in rows}
+
+    # --- Migration --- #
+
+    def _migrate(self):
+        """Import the pre-database recents and playlist files, once"""
+        db = self._db
+        if db.execute("SELECT 1 FROM meta WHERE key = 'migrated_files'").fetchone():
+            return
+        try:
+            with db:
+                self._migrate_files()
+                db.execute("INSERT INTO meta (key, value) VALUES ('migrated_files', ?)", (str(time.time()),))
+        except (OSError, ValueError, KeyError, sqlite3.Error) as e:
+            print(f"Error migrating user files: {e}")
+
+    def _migrate_files(self):
+        db = self._db
+        recents_file = self.data_dir / "userfiles" / "recents.txt"
+        if recents_file.exists():
+            lines = [line.strip() for line in recents_file.read_text().splitlines() if line.strip()]
+            now = time.time()
+            # The file is newest first, keep that order in the history
+            for offset, track in enumerate(lines):
+                played_at = now - offset
+                track_id = self._track_id(*self.split_track(track))
+                db.execute("INSERT INTO play_history (track_id, played_at) VALUES (?, ?)", (track_id, played_at))
+                db.execute("UPDATE tracks SET last_played = MAX(COALESCE(last_played, 0), ?) WHERE id = ?",
+                           (played_at, track_id))
+
+        # Imported Spotify playlists live in ~/.ethos, user playlists in ~/.ethos/userfiles/playlists
+        for playlist_dir, imported in ((self.data_dir, True), (self.data_dir / "userfiles" / "playlists", False)):
+            if not playlist_dir.is_dir():
+                continue
+            for playlist_file in sorted(playlist_dir.glob("*.json")):
+                tracks = json.loads(playlist_file.read_text())
+                if not isinstance(tracks, list):
+                    continue
+                self._replace_playlist(playlist_file.stem, tracks, None, None, imported)
@@ -0,0 +1,107 @@
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+
+class StreamCache:
+    """
+    On-disk cache of resolved YouTube streams, keyed by normalized search query.
+
+    Each entry keeps the video ID, the stream URL and the HTTP headers it has to
+    be fetched with. Stream URLs carry an
+    `expire=` timestamp; once it has passed the URL is stale but the video ID is
+    still valid, so the caller can re-extract the stream without searching again.
+    """
+
+    EXPIRY_MARGIN = 300  # Treat URLs as stale 5 minutes before they actually expire
+    DEFAULT_TTL = 3600  # For stream URLs that don't carry an expire timestamp
+
+    def __init__(self, cache_file: Optional[Path] = None, max_entries: int = 1000):
+        self.cache_file = cache_file or Path.home() / ".ethos" / "cache" / "streams.json"
+        self.max_entries = max_entries
+        self._entries: Optional[dict] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Normalize a search query so that trivially different spellings share an entry"""
+        return re.sub(r"\s+", " ", query).strip().lower()
+
+    @classmethod
+    def url_expiry(cls, url: str) -> float:
+        """Return the unix timestamp after which a stream URL should no longer be used"""
+        expire = parse_qs(urlparse(url).query).get("expire")
+        if expire and expire[0].isdigit():
+            return int(expire[0]) - cls.EXPIRY_MARGIN
+        return time.time() + cls.DEFAULT_TTL
+
+    def get(self, query: str) -> Optional[dict]:
+        """
+        Look up a query.
+
+        Returns:
+        - dict: `{"video_id", "url", "expires", "fresh"}`, or None on a miss.
+                `fresh` is False when the stream URL has expired and has to be
+                re-extracted from `video_id`.
+        """
+        with self._lock:
+            entry = self._load().get(self.normalize(query))
+        if entry is None:
+            return None
+        return {**entry, "fresh": entry["expires"] > time.time()}
+
+    def get_url(self, query: str) -> Optional[str]:
+        """Return the cached stream URL of a query if it is still fresh"""
+        entry = self.get(query)
+        if entry and entry["fresh"]:
+            return entry["url"]
+        return None
+
+    def headers_for(self, url: str) -> dict:
+        """The HTTP headers a cached stream URL was resolved with, empty if unknown"""
+        with self._lock:
+            for entry in self._load().values():
+                if entry["url"] == url:
+                    return entry.get("headers") or {}
+        return {}
+
+    def put(self, query: str, video_id: str, url: str, headers: Optional[dict] = None):
+        """Store a resolved stream and persist the cache"""
+        with self._lock:
+            entries = self._load()
+            entries[self.normalize(query)] = {
+                "video_id": video_id,
+                "url": url,
+                "headers": headers or {},
+                "expires": self.url_expiry(url),
+                "resolved_at": time.time(),
+            }
+            if len(entries) > self.max_entries:
+                oldest = sorted(entries, key=lambda key: entries[key]["resolved_at"])
+                for key in oldest[:len(entries) - self.max_entries]:
+                    del entries[key]
+            self._save(entries)
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self.cache_file, "r") as file:
+                    self._entries = json.load(file)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self, entries: dict):
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.cache_file.with_suffix(".tmp")
+            with open(tmp_file, "w") as file:
+                json.dump(entries, file)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            print(f"Error writing stream cache: {e}")
@@ -35,6 +35,7 @@ class Format:
         Returns:
             str or int: The extracted value after the command
                 - For /play commands: returns the song name as string
+                - For /play-playlist commands: returns the playlist name as string
                 - For /volume commands: returns the volume level as integer
         """
         parts = command.split(maxsplit=1)
@@ -44,7 +45,7 @@ class Format:
         
         command_type, value = parts
     
-        if command_type == '/play' or command_type == '/queue-add' or command_type == '/queue-remove':
+        if command_type in ('/play', '/play-playlist', '/queue-add', '/queue-remove'):
             return value
         elif command_type == '/volume' or command_type == '/qp':
             try:
@@ -91,3 +92,9 @@ class Format:
         """Removes the entry number from the track name"""
         import re
         return re.sub(r'^(\d+\. )', r'', text)
+
+    @staticmethod
+    def strip_position(entry: str, position: int) -> str:
+        """Removes the "3. " prefix of the listed entry at `position`, a track named "1. Outside" keeps its name"""
+        prefix = f"{position}. "
+        return entry[len(prefix):] if entry.startswith(prefix) else entry
@@ -0,0 +1,379 @@
+"""
+Lightweight readers for the headers of local audio files.
+
+Each reader only looks at the container headers (plus the last 128 bytes of an mp3
+for ID3v1) using small bounded reads, so extracting duration and tags costs a few
+KB of I/O per file instead of a full libvlc parse.
+"""
+
+import os
+import struct
+from typing import BinaryIO, Callable, Dict, Optional
+
+# Upper bound for a single header read, tags holding cover art are skipped past
+MAX_READ = 64 * 1024
+
+FIELDS = ('duration_ms', 'bitrate', 'sample_rate', 'title', 'artist', 'album')
+
+
+def read_metadata(path: str) -> Optional[dict]:
+    """
+    Read duration and basic tags from the headers of an audio file.
+
+    Args:
+    - path (str): Path of a .mp3, .wav, .flac or .m4a file.
+
+    Returns:
+    - dict: 'duration_ms', 'bitrate' (kbps), 'sample_rate', 'title', 'artist' and
+            'album', any of which may be None. None if the file could not be parsed.
+    """
+    reader = READERS.get(os.path.splitext(path)[1].lower())
+    if reader is None:
+        return None
+
+    info = dict.fromkeys(FIELDS)
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if not reader(f, size, info):
+                return None
+    except (OSError, ValueError, IndexError, struct.error, UnicodeDecodeError):
+        return None
+
+    for key in ('title', 'artist', 'album'):
+        if info[key] is not None:
+            info[key] = info[key].strip() or None
+    return info
+
+
+def _bitrate(size: int, duration_ms: Optional[int]) -> Optional[int]:
+    """Average bitrate in kbps from a byte count and a duration"""
+    if not duration_ms:
+        return None
+    return round(size * 8 / duration_ms)
+
+
+# --- MP3 -----------------------------------------------------------------------
+
+MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+ID3_TEXT_FRAMES = {
+    b'TIT2': 'title', b'TPE1': 'artist', b'TALB': 'album',
+    b'TT2': 'title', b'TP1': 'artist', b'TAL': 'album',
+}
+
+
+def _synchsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _decode_id3_text(body: bytes) -> Optional[str]:
+    if not body:
+        return None
+    encoding, text = body[0], body[1:]
+    if encoding == 1:
+        value = text.decode('utf-16', 'replace')
+    elif encoding == 2:
+        value = text.decode('utf-16-be', 'replace')
+    elif encoding == 3:
+        value = text.decode('utf-8', 'replace')
+    else:
+        value = text.decode('latin-1')
+    return value.split('\x00')[0]
+
+
+def _read_id3v2(f: BinaryIO, info: dict) -> int:
+    """Read the text frames of a leading ID3v2 tag, returns the offset after it"""
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b'ID3':
+        return 0
+
+    version, flags = header[3], header[5]
+    end = 10 + _synchsafe(header[6:10]) + (10 if flags & 0x10 else 0)
+    position = 10
+    if flags & 0x40 and version >= 3:  # Extended header
+        extended = f.read(4)
+        position += _synchsafe(extended) if version == 4 else 4 + struct.unpack('>I', extended)[0]
+
+    id_size, header_size = (3, 6) if version == 2 else (4, 10)
+    while position + header_size <= end:
+        f.seek(position)
+        frame = f.read(header_size)
+        if len(frame) < header_size or frame[0] == 0:  # Padding
+            break
+        frame_id = frame[:id_size]
+        if version == 2:
+            frame_size = int.from_bytes(frame[3:6], 'big')
+        elif version == 4:
+            frame_size = _synchsafe(frame[4:8])
+        else:
+            frame_size = struct.unpack('>I', frame[4:8])[0]
+
+        key = ID3_TEXT_FRAMES.get(frame_id)
+        if key and info[key] is None and frame_size <= MAX_READ:
+            info[key] = _decode_id3_text(f.read(frame_size))
+        position += header_size + frame_size
+    return end
+
+
+def _read_id3v1(f: BinaryIO, size: int, info: dict) -> bool:
+    """Fill missing tags from a trailing ID3v1 tag, returns whether one exists"""
+    if size < 128:
+        return False
+    f.seek(size - 128)
+    tag = f.read(128)
+    if tag[:3] != b'TAG':
+        return False
+    for key, start in (('title', 3), ('artist', 33), ('album', 63)):
+        if info[key] is None:
+            info[key] = tag[start:start + 30].split(b'\x00')[0].decode('latin-1') or None
+    return True
+
+
+def _parse_mp3_frame(header: bytes) -> Optional[dict]:
+    """Decode a 4 byte MPEG audio frame header"""
+    if header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = {3: 1, 2: 2, 0: 2.5}.get((header[1] >> 3) & 3)
+    layer = 4 - ((header[1] >> 1) & 3)
+    bitrate_index, rate_index = header[2] >> 4, (header[2] >> 2) & 3
+    if version is None or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    bitrate = MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 1
+    if layer == 1:
+        samples, length = 384, (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 576 if layer == 3 and version != 1 else 1152
+        length = samples // 8 * bitrate // sample_rate + padding
+    return {
+        'version': version, 'layer': layer, 'bitrate': bitrate, 'sample_rate': sample_rate,
+        'samples': samples, 'length': length, 'mono': header[3] >> 6 == 3,
+    }
+
+
+def _read_mp3(f: BinaryIO, size: int, info: dict) -> bool:
+    audio_start = _read_id3v2(f, info)
+    audio_end = size - (128 if _read_id3v1(f, size, info) else 0)
+
+    f.seek(audio_start)
+    data = f.read(4096)
+    frame, offset = None, data.find(b'\xff')
+    while offset != -1 and offset + 4 <= len(data):
+        frame = _parse_mp3_frame(data[offset:offset + 4])
+        following = offset + frame['length'] if frame else -1
+        # Guard against false syncs by checking the next frame when it is in the buffer
+        if frame and (following + 4 > len(data) or _parse_mp3_frame(data[following:following + 4])):
+            break
+        frame, offset = None, data.find(b'\xff', offset + 1)
+    if frame is None:
+        return False
+
+    info['sample_rate'] = frame['sample_rate']
+    audio_bytes = audio_end - audio_start - offset
+    frames = None
+
+    if frame['version'] == 1:
+        side_info = 17 if frame['mono'] else 32
+    else:
+        side_info = 9 if frame['mono'] else 17
+    xing = offset + 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+        position = xing + 8
+        if flags & 1:
+            frames = struct.unpack('>I', data[position:position + 4])[0]
+            position += 4
+        if flags & 2:
+            audio_bytes = struct.unpack('>I', data[position:position + 4])[0]
+    elif data[offset + 36:offset + 40] == b'VBRI':
+        audio_bytes, frames = struct.unpack('>II', data[offset + 46:offset + 54])
+
+    if frames:
+        info['duration_ms'] = frames * frame['samples'] * 1000 // frame['sample_rate']
+        info['bitrate'] = _bitrate(audio_bytes, info['duration_ms'])
+    else:  # Constant bitrate
+        info['duration_ms'] = audio_bytes * 8 * 1000 // frame['bitrate']
+        info['bitrate'] = frame['bitrate'] // 1000
+    return True
+
+
+# --- WAV -----------------------------------------------------------------------
+
+WAV_INFO_TAGS = {b'INAM': 'title', b'IART': 'artist', b'IPRD': 'album'}
+
+
+def _read_wav(f: BinaryIO, size: int, info: dict) -> bool:
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+        return False
+
+    byte_rate = data_size = None
+    position = 12
+    while position + 8 <= size:
+        f.seek(position)
+        chunk_id, chunk_size = struct.unpack('<4sI', f.read(8))
+        body = position + 8
+        if chunk_id == b'fmt ':
+            fmt = f.read(16)
+            info['sample_rate'], byte_rate = struct.unpack('<II', fmt[4:12])
+        elif chunk_id == b'data':
+            data_size = min(chunk_size, size - body)
+        elif chunk_id == b'LIST' and chunk_size <= MAX_READ and f.read(4) == b'INFO':
+            _read_wav_info(f.read(chunk_size - 4), info)
+        position = body + chunk_size + (chunk_size & 1)
+
+    if not byte_rate or data_size is None:
+        return False
+    info['duration_ms'] = data_size * 1000 // byte_rate
+    info['bitrate'] = byte_rate * 8 // 1000
+    return True
+
+
+def _read_wav_info(data: bytes, info: dict):
+    position = 0
+    while position + 8 <= len(data):
+        tag, length = struct.unpack('<4sI', data[position:position + 8])
+        key = WAV_INFO_TAGS.get(tag)
+        if key:
+            value = data[position + 8:position + 8 + length].split(b'\x00')[0]
+            info[key] = value.decode('utf-8', 'replace')
+        position += 8 + length + (length & 1)
+
+
+# --- FLAC ----------------------------------------------------------------------
+
+VORBIS_TAGS = {'TITLE': 'title', 'ARTIST': 'artist', 'ALBUM': 'album'}
+
+
+def _read_flac(f: BinaryIO, size: int, info: dict) -> bool:
+    if f.read(4) != b'fLaC':
+        return False
+
+    streaminfo = False
+    while True:
+        header = f.read(4)
+        if len(header) < 4:
+            break
+        last, block_type = header[0] & 0x80, header[0] & 0x7F
+        length = int.from_bytes(header[1:4], 'big')
+        start = f.tell()
+
+        if block_type == 0:
+            packed = struct.unpack('>Q', f.read(18)[10:18])[0]
+            info['sample_rate'] = packed >> 44
+            total_samples = packed & 0xFFFFFFFFF
+            if info['sample_rate'] and total_samples:
+                info['duration_ms'] = total_samples * 1000 // info['sample_rate']
+            streaminfo = True
+        elif block_type == 4:
+            try:
+                _read_vorbis_comment(f.read(min(length, MAX_READ)), info)
+            except struct.error:
+                pass  # A damaged comment block, keep the stream info and the tags read so far
+
+        if last:
+            break
+        f.seek(start + length)
+
+    info['bitrate'] = _bitrate(size, info['duration_ms'])
+    return streaminfo
+
+
+def _read_vorbis_comment(data: bytes, info: dict):
+    vendor_length = struct.unpack('<I', data[:4])[0]
+    position = 4 + vendor_length
+    count = struct.unpack('<I', data[position:position + 4])[0]
+    position += 4
+    for _ in range(count):
+        if position + 4 > len(data):
+            break
+        length = struct.unpack('<I', data[position:position + 4])[0]
+        comment = data[position + 4:position + 4 + length].decode('utf-8', 'replace')
+        position += 4 + length
+        name, _, value = comment.partition('=')
+        key = VORBIS_TAGS.get(name.upper())
+        if key and info[key] is None:
+            info[key] = value
+
+
+# --- M4A -----------------------------------------------------------------------
+
+MP4_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'udta', b'meta', b'ilst'}
+MP4_TAGS = {b'\xa9nam': 'title', b'\xa9ART': 'artist', b'\xa9alb': 'album'}
+MP4_LEAVES = {b'mvhd', b'mdhd', b'stsd'} | set(MP4_TAGS)
+
+
+def _read_m4a(f: BinaryIO, size: int, info: dict) -> bool:
+    found = {}
+    _walk_atoms(f, 0, size, found)
+    if 'mvhd' not in found:
+        return False
+
+    timescale, duration = found['mvhd']
+    if timescale:
+        info['duration_ms'] = duration * 1000 // timescale
+    info['sample_rate'] = found.get('sample_rate') or found.get('mdhd')
+    for atom, key in MP4_TAGS.items():
+        info[key] = found.get(atom)
+    info['bitrate'] = _bitrate(size, info['duration_ms'])
+    return True
+
+
+def _walk_atoms(f: BinaryIO, start: int, end: int, found: dict):
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        atom_size, atom_type = struct.unpack('>I4s', f.read(8))
+        header = 8
+        if atom_size == 1:
+            atom_size = struct.unpack('>Q', f.read(8))[0]
+            header = 16
+        elif atom_size == 0:
+            atom_size = end - position
+        if atom_size < header:
+            break
+
+        body, atom_end = position + header, min(position + atom_size, end)
+        if atom_type in MP4_CONTAINERS:
+            if atom_type == b'meta' and f.read(8)[4:8] != b'hdlr':
+                body += 4  # Full box, skip version and flags
+            _walk_atoms(f, body, atom_end, found)
+        elif atom_type in MP4_LEAVES:
+            _read_atom(atom_type, f.read(min(atom_end - body, MAX_READ)), found)
+        position = atom_end
+
+
+def _read_atom(atom_type: bytes, data: bytes, found: dict):
+    if atom_type in (b'mvhd', b'mdhd'):
+        if data[0] == 1:
+            timescale, duration = struct.unpack('>IQ', data[20:32])
+        else:
+            timescale, duration = struct.unpack('>II', data[12:20])
+        if atom_type == b'mvhd':
+            found['mvhd'] = (timescale, duration)
+        else:
+            found.setdefault('mdhd', timescale)
+    elif atom_type == b'stsd':
+        # Full box + entry count, then a sound sample entry whose rate is 16.16 fixed point
+        if data[12:16] in (b'mp4a', b'alac') and 'sample_rate' not in found:
+            found['sample_rate'] = struct.unpack('>I', data[40:44])[0] >> 16
+    elif data[4:8] == b'data':
+        found.setdefault(atom_type, data[16:].decode('utf-8', 'replace'))
+
+
+READERS: Dict[str, Callable[[BinaryIO, int, dict], bool]] = {
+    '.mp3': _read_mp3,
+    '.wav': _read_wav,
+    '.flac': _read_flac,
+    '.m4a': _read_m4a,
+}
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+Lookup = Callable[[str], Optional[str]]
+
+
+@dataclass
+class Resolution:
+    track: str
+    source: str  # A local path or a stream URL, anything MusicPlayer.play accepts
+    tier: str
+    seconds: float
+    hit: Optional[str] = None  # "prefetch" or "speculative" if it was resolved before it was picked
+
+
+class TieredResolver:
+    """
+    Resolves a track name to a playable source by trying sources in order of cost.
+
+    Each tier is a `(name, lookup)` pair; the lookup returns a path or URL, or
+    None when it cannot serve the track. A tier that raises is treated as a miss
+    so a flaky source falls through to the next one. Plays are counted per tier
+    in `stats` (see `record`) to show how often the network is actually needed,
+    and how many of them were resolved ahead of time by prefetch or speculation.
+    """
+
+    def __init__(self, tiers: Optional[List[Tuple[str, Lookup]]] = None):
+        self.tiers: List[Tuple[str, Lookup]] = list(tiers or [])
+        self.stats: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def add_tier(self, name: str, lookup: Lookup, before: Optional[str] = None):
+        """Add a tier at the end, or in front of the tier called `before`"""
+        names = [tier for tier, _ in self.tiers]
+        index = names.index(before) if before in names else len(self.tiers)
+        self.tiers.insert(index, (name, lookup))
+
+    def resolve(self, track: str) -> Resolution:
+        """
+        Resolve a track through the first tier that can serve it.
+
+        Args:
+        - track (str): The track name, e.g. "Blinding Lights by The Weeknd".
+
+        Returns:
+        - Resolution: The source, the tier that served it and the time it took.
+
+        Raises:
+        - LookupError: If no tier could serve the track.
+        """
+        start = time.perf_counter()
+        error = None
+        for name, lookup in self.tiers:
+            try:
+                source = lookup(track)
+            except Exception as e:
+                error = e
+                continue
+            if source:
+                return Resolution(track, source, name, time.perf_counter() - start)
+        raise LookupError(f"Could not resolve {track!r}") from error
+
+    def record(self, resolution: Resolution):
+        """Count a resolution that was actually played"""
+        with self._lock:
+            stats = self.stats.setdefault(resolution.tier, {"plays": 0, "seconds": 0.0, "ahead": 0})
+            stats["plays"] += 1
+            stats["seconds"] += resolution.seconds
+            stats["ahead"] += resolution.hit is not None
+
+    def summary(self) -> List[str]:
+        """Plays, share of plays and average latency of each tier"""
+        with self._lock:
+            total = sum(stats["plays"] for stats in self.stats.values())
+            return [
+                f"{tier}: {stats['plays']} plays ({stats['plays'] * 100 // total}%), "
+                f"avg {stats['seconds'] * 1000 / stats['plays']:.0f} ms"
+                + (f", {stats['ahead']} resolved ahead" if stats["ahead"] else "")
+                for tier, stats in sorted(self.stats.items(), key=lambda item: -item[1]["plays"])
+            ]
+
+
+async def resolve_all(
+    resolver: TieredResolver, tracks: Iterable[str], concurrency: int = 4, lookahead: int = 4
+) -> AsyncIterator[Tuple[str, Optional[Resolution]]]:
+    """
+    Resolve many tracks with bounded concurrency, yielding results in track order.
+
+    At most `concurrency` resolves run at once (in threads), and at most
+    `concurrency * lookahead` tracks are scheduled ahead of the one being waited
+    for, so a slow track does not stall the others and a huge list does not
+    schedule everything up front. Closing the iterator cancels what is pending.
+
+    Yields:
+    - (track, Resolution or None if no tier could serve it)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve(track: str) -> Optional[Resolution]:
+        async with semaphore:
+            try:
+                return await asyncio.to_thread(resolver.resolve, track)
+            except Exception:
+                return None
+
+    remaining = iter(tracks)
+    window = deque()
+    try:
+        while True:
+            for track in remaining:
+                window.append((track, asyncio.ensure_future(resolve(track))))
+                if len(window) >= concurrency * lookahead:
+                    break
+            if not window:
+                return
+            track, task = window.popleft()
+            yield track, await task
+    finally:
+        for _, task in window:
+            task.cancel()
@@ -2,11 +2,21 @@ from textual.app import App, ComposeResult
 from textual.reactive import reactive
 from textual.widgets import Input
 from textual import work
+from textual.worker import Worker, get_current_worker
 from ethos.ui.rich_layout import RichLayout
 from ethos.player import MusicPlayer, TrackInfo
+from ethos.local_search import LocalSearch
+from ethos.track_resolver import Resolution, TieredResolver, resolve_all
+from ethos.prefetch import Prefetcher
+from ethos.speculation import SpeculativeResolver
 from ethos.tools import helper
-from ethos.utils import fetch_tracks_list, get_audio_url, fetch_recents, add_track_to_recents, fetch_tracks_from_playlist, add_track_to_playlist
+from ethos.utils import resolver_pool, spotify_client, stream_cache, audio_cache, fetch_tracks_list, get_audio_url, fetch_recents, add_track_to_recents, add_track_to_history, fetch_most_played, fetch_tracks_from_playlist, add_track_to_playlist
+import asyncio
+import dataclasses
+import itertools
 import random
+import threading
+import time
 
 class TextualApp(App):
     """Textual Application Class for ethos UI"""
@@ -36,6 +46,19 @@ class TextualApp(App):
     recents = reactive([])
     current_track_duration = reactive("")
     show_playlists = reactive(False)
+    now_playing = None  # (track name, source, start timestamp, Resolution) of the play being listened to
+    local_search = LocalSearch()
+    local_tracks = {}  # "<title> by <artist>" -> path, for local results currently displayed
+    online_tracks = set()  # Results of a "Search online instead", never served from the library
+    # Share of the query a library track must match to be listed above the online results
+    LOCAL_MATCH = 0.75
+    # Similarity a library track needs to stand in for a track picked online or queued
+    LOCAL_SAME_TRACK = 0.8
+    # Last entry of a search answered from the library, picking it runs the online search
+    SEARCH_ONLINE = "Search online instead"
+    online_query = None  # The search that SEARCH_ONLINE runs, while it is listed
+    # Playlist entries resolved at once by /play-playlist
+    PLAYLIST_CONCURRENCY = 4
 
     def compose(self) -> ComposeResult:
         """Composer function for textual app"""
@@ -48,6 +71,30 @@ class TextualApp(App):
         """Handle functions after mounting the app"""
 
         self.input = reactive("")
+        self.ui_loop = asyncio.get_running_loop()
+        self.ui_thread = threading.get_ident()
+        self.resolver = TieredResolver([
+            ("local", self.find_local_track),
+            ("stream-cache", lambda track: stream_cache.get_url(self.stream_query(track))),
+            ("yt-dlp", lambda track: get_audio_url(self.stream_query(track))),
+        ])
+        if audio_cache:
+            self.player.audio_cache = audio_cache
+            self.resolver.add_tier(
+                "offline", lambda track: audio_cache.path_for(track), before="stream-cache"
+            )
+        self.resolved = {}  # Queued track -> its Resolution, for playlist entries resolved up front
+        self.playlist_runs = itertools.count(1)
+        self.prefetcher = Prefetcher(self.player, self.resolver.resolve)
+        # Speculation must not hold up picks, prefetch or playlists on the shared resolver pool
+        self.speculator = SpeculativeResolver(TieredResolver(
+            [tier for tier in self.resolver.tiers if tier[0] != "yt-dlp"]
+            + [("yt-dlp", lambda track: get_audio_url(self.stream_query(track), background=True))]
+        ).resolve)
+        self.player.on_end_reached(lambda track: self.dispatch(self.handle_track_end))
+        self.player.on_error(lambda track: self.dispatch(self.handle_playback_error, track, True))
+        if self.player.library_path:
+            self.run_worker(self.watch_library, thread=True, group="library")
         self.recents = fetch_recents()
         layout_widget = self.query_one(RichLayout)
         try:
@@ -65,15 +112,41 @@ class TextualApp(App):
 
         self.input = event.value
         layout_widget = self.query_one(RichLayout)
-        
+
+        if not (event.value.isdigit() and not self.select_from_queue):
+            # Anything but picking a search result makes the speculative resolves useless
+            self.speculator.cancel()
+
         if event.value:
-            if event.value.startswith("/play"):
+            if event.value == "/play" or event.value.startswith("/play "):
                 try:
                     search_track = self.helper.parse_command(event.value)
-                    layout_widget.update_log("Searching for tracks")
-                    self.tracks_list = await fetch_tracks_list(search_track)
+                    local_hits = self.local_search.search(search_track, k=10, min_score=self.LOCAL_MATCH)
+                    self.local_tracks = {hit.display: hit.path for hit in local_hits}
+                    self.online_tracks = set()
+                    found = [hit.display for hit in local_hits]
+                    self.online_query = None
+                    title = "Type track no. to be played :-"
+                    if any(hit.similarity >= self.LOCAL_SAME_TRACK for hit in local_hits):
+                        # The track is on disk, the network is only used if the user asks for it
+                        title = "Type track no. to be played (from your library) :-"
+                        self.online_query = search_track
+                        found.append(self.SEARCH_ONLINE)
+                    else:
+                        if found:
+                            # Loose library matches show up right away, online results are appended below them
+                            title = "Type track no. to be played (library matches first) :-"
+                            self.tracks_list = [f"{i}. {name}" for i, name in enumerate(found, start=1)]
+                            layout_widget.update_dashboard(self.tracks_list, title)
+                        layout_widget.update_log("Searching for tracks")
+                        online = await fetch_tracks_list(search_track)
+                        found += [helper.Format.strip_position(track, i) for i, track in enumerate(online, start=1)]
+                    self.tracks_list = [f"{i}. {name}" for i, name in enumerate(found, start=1)]
+                    if not local_hits:
+                        # A listed library match is the likely pick, resolving online entries would waste yt-dlp runs
+                        self.speculator.speculate(found)
                     if self.tracks_list:
-                        layout_widget.update_dashboard(self.tracks_list, "Type track no. to be played :-")
+                        layout_widget.update_dashboard(self.tracks_list, title)
                         self.update_input()
                         self.select_from_queue = False
                 except ValueError:
@@ -81,13 +154,31 @@ class TextualApp(App):
                     pass
                     
 
+            if event.value.startswith("/play-playlist"):
+                try:
+                    playlist_name = self.helper.parse_command(event.value)
+                    tracks = fetch_tracks_from_playlist(playlist_name)
+                    if tracks:
+                        layout_widget.update_log(f"Loading playlist {playlist_name}")
+                        self.play_playlist(playlist_name, tracks)
+                    else:
+                        layout_widget.update_dashboard(f"Playlist {playlist_name} does not exist or is empty.", "")
+                    self.update_input()
+                except ValueError:
+                    layout_widget.update_dashboard("Please enter a playlist name. You can view the list of commands using /help", "")
+
             if event.value.isdigit() and not self.select_from_queue:
                 try:
                     self.should_play_queue = False
-                    self.track_to_play = self.tracks_list[int(event.value)-1]
-                    self.handle_play(self.track_to_play)
-                    layout_widget.update_log("Playing track from search")
-                    self.update_input()
+                    position = int(event.value)
+                    self.track_to_play = helper.Format.strip_position(self.tracks_list[position-1], position)
+                    if self.online_query and self.track_to_play == self.SEARCH_ONLINE:
+                        self.update_input()
+                        await self.search_online(self.online_query)
+                    else:
+                        self.handle_play(self.track_to_play, "search")
+                        layout_widget.update_log("Playing track from search")
+                        self.update_input()
                 except:
                     pass
 
@@ -116,8 +207,10 @@ class TextualApp(App):
             if event.value.isdigit() and self.select_from_queue:
                 try:
                     self.should_play_queue = True
-                    self.track_to_be_added_to_queue = self.queue_options[int(event.value)-1]
-                    self.queue[self.search_track] = helper.Format.clean_hashtag(self.track_to_be_added_to_queue)
+                    position = int(event.value)
+                    self.track_to_be_added_to_queue = self.queue_options[position-1]
+                    self.queue[self.search_track] = helper.Format.strip_position(self.track_to_be_added_to_queue, position)
+                    self.prefetcher.update(list(self.queue.values()))
                     self.update_input()
                     self.search_track=""
                 except:
@@ -146,13 +239,37 @@ class TextualApp(App):
                     queue = list(self.queue.values())
                     track = queue[ind-1]
                     del self.queue[key]
-                    self.handle_play(track)
+                    self.handle_play(track, "queue")
                     layout_widget.update_log("Playing track from current queue")
                     self.update_input()
                 except ValueError:
                     layout_widget.update_dashboard("Please enter the no. of track you want to play", "")
                     pass
             
+            if event.value == "/recents":
+                self.recents = fetch_recents()
+                if self.recents:
+                    layout_widget.update_dashboard(self.recents, "Recents :-")
+                else:
+                    layout_widget.update_dashboard("You have not played any tracks yet!", "")
+                self.update_input()
+
+            if event.value.startswith("/top"):
+                period = event.value.split(maxsplit=1)[1].strip() if " " in event.value else "week"
+                if period in ("day", "week", "month", "all"):
+                    most_played = fetch_most_played(period)
+                    layout_widget.update_dashboard(most_played or "No plays yet for this period!", f"Most played ({period}) :-")
+                else:
+                    layout_widget.update_dashboard("Period must be one of day, week, month or all", "")
+                self.update_input()
+
+            if event.value == "/sources":
+                summary = self.resolver.summary()
+                if summary:
+                    summary.append(self.speculator.summary())
+                layout_widget.update_dashboard(summary or "You have not played any tracks yet!", "Where tracks were played from :-")
+                self.update_input()
+
             if event.value == "/help":
                 try:
                     layout_widget.show_commands()
@@ -188,22 +305,165 @@ class TextualApp(App):
         layout_widget = self.query_one(RichLayout)
         layout_widget.update_volume(self.player.get_volume())
 
-    def handle_play(self, track_name: str):
-        """Function to handle the track playback"""
+    async def on_unmount(self):
+        """Stop background work and close network connections before the app exits"""
+        # Quitting mid-track is how most sessions end, the play still counts
+        self.finish_play(wait=True)
+        self.prefetcher.shutdown()
+        self.speculator.shutdown()
+        # A cold library scan runs on a worker thread the app joins on exit
+        self.player.library_index.cancel()
+        self.player.stop_watching_library()
+        if audio_cache:
+            audio_cache.shutdown()
+        resolver_pool.shutdown()
+        await spotify_client.aclose()
+
+    async def search_online(self, search_track: str) -> None:
+        """Function to list the online results of a search that the library answered"""
         layout_widget = self.query_one(RichLayout)
+        layout_widget.update_log("Searching for tracks")
+        self.online_query = None
+        self.tracks_list = await fetch_tracks_list(search_track)
+        # The user asked for the online versions, a library track of the same name must not stand in for them
+        self.local_tracks = {}
+        names = [helper.Format.strip_position(track, i) for i, track in enumerate(self.tracks_list, start=1)]
+        self.online_tracks = set(names)
+        self.speculator.speculate(names)
+        if self.tracks_list:
+            layout_widget.update_dashboard(self.tracks_list, "Type track no. to be played :-")
+
+    def watch_library(self) -> None:
+        """Worker that indexes the local library and keeps the local search index current"""
+        self.player.watch_library(self.apply_library_changes)
+        self.refresh_local_search()
+
+    def refresh_local_search(self) -> None:
+        """Bring the local search index in line with the library index, runs on a worker or watcher thread"""
+        self.local_search.update(self.player.library_index.tracks(self.player.library_path))
+
+    def apply_library_changes(self, changed: list, removed: list) -> None:
+        """Mirror a library update in the local search index, runs on the watcher thread"""
+        self.local_search.apply(self.player.library_index.tracks_at(changed), removed)
+
+    def find_local_track(self, track_name: str):
+        """Resolver tier serving a track from the local library, an exact pick or a close match"""
+        if track_name in self.online_tracks:
+            return None
+        if track_name in self.local_tracks:
+            return self.local_tracks[track_name]
+        hits = self.local_search.search(track_name.replace(" by ", " "), k=1)
+        if hits and hits[0].similarity >= self.LOCAL_SAME_TRACK:
+            return hits[0].path
+        return None
+
+    @staticmethod
+    def stream_query(track_name: str) -> str:
+        """The YouTube search query of a track"""
+        return track_name+" official audio"
+
+    def handle_play(self, track_name: str, source: str = "search"):
+        """Function to handle the track playback, the track is loaded in the background"""
+        layout_widget = self.query_one(RichLayout)
+        layout_widget.update_log(f"Loading {track_name}")
+        self.load_track(track_name, source)
+
+    @work(thread=True, exclusive=True, group="playback")
+    def load_track(self, track_name: str, source: str) -> None:
+        """Worker that resolves a track off the UI thread, picking a new track cancels the previous load"""
+        worker = get_current_worker()
+        start = time.perf_counter()
         try:
-            url = get_audio_url(track_name+" official audio")
-            self.track_url = url
+            resolution = self.resolved.pop(track_name, None)
+            if resolution and stream_cache.url_expiry(resolution.source) <= time.time():
+                resolution = None  # Sat in the queue until its stream URL expired
+            hit = None
+            if not resolution:
+                resolution, hit = self.prefetcher.take(track_name), "prefetch"
+            if not resolution:
+                resolution, hit = self.speculator.take(track_name), "speculative"
+            if resolution and hit:
+                # Played from the tier that resolved it, in the time the pick waited for it
+                resolution = dataclasses.replace(resolution, seconds=time.perf_counter() - start, hit=hit)
+            elif not resolution:
+                resolution = self.resolver.resolve(track_name)
+        except Exception:
+            self.dispatch(self.handle_playback_error, track_name)
+            return
+        if worker.is_cancelled:
+            return
+        self.dispatch(self.start_playback, worker, track_name, resolution, source)
+        add_track_to_recents(track_name)
+
+    @work(exclusive=True, group="playlist")
+    async def play_playlist(self, playlist_name: str, tracks: list) -> None:
+        """
+        Worker that resolves a whole playlist with bounded concurrency. Playback starts
+        as soon as the first entry resolves, the rest join the queue in playlist order.
+        """
+        worker = get_current_worker()
+        layout_widget = self.query_one(RichLayout)
+        started = False
+        position = 0
+        run = next(self.playlist_runs)  # Keeps the queue keys of a playlist played twice apart
+        resolutions = resolve_all(self.resolver, tracks, self.PLAYLIST_CONCURRENCY)
+        try:
+            async for track_name, resolution in resolutions:
+                position += 1
+                if worker.is_cancelled:
+                    return
+                if resolution is None:
+                    layout_widget.update_log(f"Could not play {track_name}, skipping")
+                    continue
+                if not started:
+                    started = True
+                    # A track still loading from an earlier pick must not replace the playlist
+                    self.workers.cancel_group(self, "playback")
+                    self.start_playback(worker, track_name, resolution, "playlist")
+                    self.run_worker(lambda track=track_name: add_track_to_recents(track), thread=True, group="recents")
+                else:
+                    self.queue[f"{playlist_name} #{position} ({run})"] = track_name
+                    self.resolved[track_name] = resolution
+                    # Only the head of the queue is prefetched, later entries don't change it
+                    if len(self.queue) <= self.prefetcher.depth:
+                        self.prefetcher.update(list(self.queue.values()))
+        finally:
+            await resolutions.aclose()
+        layout_widget.update_log(f"Playlist {playlist_name} loaded")
+
+    def start_playback(self, worker: Worker, track_name: str, resolution: Resolution, source: str) -> None:
+        """Function to start playing a resolved track, runs on the UI thread"""
+        if worker.is_cancelled:
+            return
+        layout_widget = self.query_one(RichLayout)
+        try:
+            self.finish_play()
+            self.track_url = resolution.source
             self.player.set_volume(50)
-            self.player.play(url)
-            add_track_to_recents(helper.Format.clean_hashtag(track_name))
+            self.player.play(resolution.source)
+            self.resolver.record(resolution)
+            self.now_playing = (track_name, source, time.time(), resolution)
+            if audio_cache:
+                headers = stream_cache.headers_for(resolution.source)
+                self.run_worker(lambda: audio_cache.record_play(track_name, resolution.source, headers), thread=True, group="audio-cache")
             layout_widget.update_track(track_name)
-            self.current_track_duration = TrackInfo.get_audio_duration(url)
-            layout_widget.update_total_track_time(TrackInfo.get_audio_duration(url))
             color_ind = random.randint(0,9)
             layout_widget.update_color(color_ind)
         except:
             pass
+        self.prefetcher.update(list(self.queue.values()))
+
+    def dispatch(self, callback, *args) -> None:
+        """
+        Run a callback on the UI thread.
+
+        Safe to call from libvlc event threads and worker threads: the callback is
+        scheduled on the event loop without blocking the calling thread.
+        """
+        if threading.get_ident() == self.ui_thread:
+            callback(*args)
+        else:
+            self.ui_loop.call_soon_threadsafe(callback, *args)
 
     def update_input(self) -> None:
         """Function to reset the data in input widget once user enters his input"""
@@ -216,21 +476,55 @@ class TextualApp(App):
         layout_widget = self.query_one(RichLayout)
         try:   
             layout_widget.update_music_progress(TrackInfo.get_current_time(self.player), int(TrackInfo.get_progress(self.player)))
+            # The duration is reported by the player itself once the stream is open, no separate probe needed
+            track_duration = self.helper.seconds_to_min_sec(self.player.playback_state.duration_ms // 1000)
+            if track_duration != self.current_track_duration:
+                self.current_track_duration = track_duration
+                layout_widget.update_total_track_time(track_duration)
         except:
             pass
 
-        if self.current_track_duration == TrackInfo.get_current_time(self.player):
-            if self.queue:
-                try:
-                    keys = list(self.queue.keys())
-                    tracks = list(self.queue.values())
-                    key = keys[0]
-                    track = tracks[0]
-                    del self.queue[key]
-                    self.handle_play(track)
-                    layout_widget.update_log("Currently playing from queue")
-                except:
-                    pass
+    def finish_play(self, wait: bool = False) -> None:
+        """
+        Function to log the play that is ending with how long it was listened to,
+        on a worker unless `wait` is set, e.g. when the app is exiting
+        """
+        if not self.now_playing:
+            return
+        track, source, started_at, resolution = self.now_playing
+        self.now_playing = None
+        listened = self.player.playback_state.position_ms / 1000
+
+        def record():
+            add_track_to_history(track, source, listened, started_at, resolution.tier, resolution.seconds)
+
+        if wait:
+            record()
+        else:
+            self.run_worker(record, thread=True, group="history")
+
+    def handle_track_end(self) -> None:
+        """Function called as soon as VLC reports the end of a track"""
+        self.finish_play()
+        self.play_next_from_queue()
+
+    def play_next_from_queue(self) -> None:
+        """Function to play the next queued track, called as soon as VLC reports the end of a track"""
+        if not self.queue:
+            return
+        layout_widget = self.query_one(RichLayout)
+        try:
+            key = next(iter(self.queue))
+            track = self.queue.pop(key)
+            self.handle_play(track, "queue")
+            layout_widget.update_log("Currently playing from queue")
+        except:
+            pass
 
-  
-    
\ No newline at end of file
+    def handle_playback_error(self, track: str, playback_ended: bool = False) -> None:
+        """Function to skip to the next queued track when a track can't be resolved or VLC fails to play it"""
+        layout_widget = self.query_one(RichLayout)
+        layout_widget.update_log("Could not play the track, skipping")
+        if playback_ended:
+            self.finish_play()
+        self.play_next_from_queue()
@@ -47,12 +47,15 @@ _/ __ \   __\  |  \ /  _ \/  ___/
 
     COMMANDS = {
         "/play <track name>": "to play a specific track",
+        "/play-playlist <playlist name>": "to play a playlist, the rest of it is added to the queue",
         "/pause": "to pause player",
         "/resume": "to resume player",
         "/volume <number>": "to set volume to a certain %",
         "/queue-add <track name>": "to add a track to current queue",
         "/show-queue": "to show current queue",
         "/recents": "to show recents",
+        "/top [day|week|month|all]": "to show your most played tracks",
+        "/sources": "to show where tracks were played from and how fast they loaded",
         "/qp <track number>": "to play the track at the given position in queue"
     }
 
@@ -1,44 +1,63 @@
-from yt_dlp import YoutubeDL
 import os
-import base64
 from dotenv import load_dotenv
 from time import time
-import httpx
 from pathlib import Path
-from tools.helper import Format
-import json
+from ethos.tools.helper import Format
+from ethos.stream_cache import StreamCache
+from ethos.resolver import ResolverPool
+from ethos.spotify_client import SpotifyClient, SpotifyError
+from ethos.search_cache import SearchCache
+from ethos.store import UserStore
+from ethos.history import ListeningHistory
+from ethos.audio_cache import AudioCache
 
 load_dotenv()
 
 
-def get_audio_url(query):
+stream_cache = StreamCache()
+resolver_pool = ResolverPool()
+spotify_client = SpotifyClient(token_file=Path.home() / ".ethos" / "cache" / "spotify_token.json")
+search_cache = SearchCache()
+user_store = UserStore()
+listening_history = ListeningHistory(user_store)
+# Offline copies of frequently played tracks, disabled unless AUDIO_CACHE_MB is set
+AUDIO_CACHE_MB = int(os.getenv("AUDIO_CACHE_MB") or 0)
+audio_cache = AudioCache(max_bytes=AUDIO_CACHE_MB * 1024 * 1024) if AUDIO_CACHE_MB > 0 else None
+
+
+def get_audio_url(query, background=False):
     """
-    Fetches the audio URL for a given search query using YoutubeDL. The function
-    utilizes specific configuration options to return the best available audio
-    source while ensuring no playlists are processed and only the top search
-    result is fetched. It does not download the file, only extracts the URL for
-    the audio stream.
+    Fetches the audio URL for a given search query using the shared yt-dlp
+    resolver pool. The pool's extractors are configured to return the best
+    available audio source while ensuring no playlists are processed and only the
+    top search result is fetched. It does not download the file, only extracts the
+    URL for the audio stream.
+
+    Resolved streams are kept in the on-disk stream cache. A fresh hit is returned
+    without touching the network, and an expired hit is re-extracted straight from
+    its video ID, skipping the search.
 
     :param query: A string representing the search query used to find the audio
         content on YouTube. It can include keywords or phrases to search for.
     :type query: str
 
+    :param background: Only extract on an idle resolver worker, raising
+        `PoolBusy` otherwise. Used for speculative resolves.
+    :type background: bool
+
     :return: The URL string of the best audio stream available based on the given
         search query.
     :rtype: str
     """
-    ydl_opts = {
-        'format': 'bestaudio/best',
-        'noplaylist': True,
-        'quiet': True,
-        'default_search': 'ytsearch1',
-    }
+    cached = stream_cache.get(query)
+    if cached and cached["fresh"]:
+        return cached["url"]
+
+    target = f"https://www.youtube.com/watch?v={cached['video_id']}" if cached else query
+    result = resolver_pool.extract(target, background=background)
 
-    with YoutubeDL(ydl_opts) as ydl:
-        result = ydl.extract_info(query, download=False)
-        if 'entries' in result:
-            result = result['entries'][0]
-        return result['url']
+    stream_cache.put(query, result['id'], result['url'], result.get('headers'))
+    return result['url']
 
 
 CLIENT_ID =  os.getenv("SPOTIFY_CLIENT_ID")
@@ -47,27 +66,15 @@ CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 
 async def get_spotify_token(client_id, client_secret):
     """
-    Fetches authorization token from spotify
+    Fetches authorization token from spotify, the token is cached until shortly
+    before it expires so most calls don't touch the network
     
     Args: client_id(str), client_secret(str)
     
     return: spotify authorization token
     """
 
-    url = "https://accounts.spotify.com/api/token"
-    headers = {
-        "Authorization": "Basic " + base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
-    }
-    data = {"grant_type": "client_credentials"}
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, headers=headers, data=data)
-        response_data = response.json()
-
-    if response.status_code != 200:
-        raise Exception(f"Failed to get token: {response_data}")
-    
-    return response_data["access_token"]
+    return await spotify_client.access_token(client_id, client_secret)
 
 
 async def search_tracks_from_spotify(track_name, token):
@@ -79,41 +86,44 @@ async def search_tracks_from_spotify(track_name, token):
     return: tracks(list)
     """
 
-    url = "https://api.spotify.com/v1/search"
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
     params = {
         "q": track_name,
         "type": "track",
         "limit": 10  
     }
     
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers, params=params)
-        response_data = response.json()
+    response = await spotify_client.get("/search", token, params=params)
+    response_data = response.json()
 
     if response.status_code != 200:
-        raise Exception(f"Failed to fetch tracks: {response_data}")
+        raise SpotifyError(f"Failed to fetch tracks: {response_data}", response.status_code)
     
     return response_data["tracks"]["items"]
 
 
 async def fetch_tracks_list(track_name: str) -> list:
     """
-    Returns a list of track name and artist name from tracks info
+    Returns a list of track name and artist name from tracks info, repeated
+    searches are served from the search cache
 
     Args: track_name(str)
 
     return: list
     """
 
-    fetched_tracks = []
-    try:
-        
-        start_time = time()
+    async def search():
         token = await get_spotify_token(CLIENT_ID, CLIENT_SECRET)
         tracks = await search_tracks_from_spotify(track_name, token)
+        # Only keep what is displayed so cached results stay small
+        return [
+            {"id": track["id"], "name": track["name"], "artists": [{"name": artist["name"]} for artist in track["artists"]]}
+            for track in tracks
+        ]
+
+    fetched_tracks = []
+    start_time = time()
+    try:
+        tracks = await search_cache.get_or_fetch(track_name, search)
         if tracks:
             print(f"\nTracks found for '{track_name}':")
             for idx, track in enumerate(tracks, start=1):
@@ -134,130 +144,107 @@ async def fetch_tracks_list(track_name: str) -> list:
 
 async def search_artist_id_from_spotify(artist_name, token):
     """Search for an artist on Spotify and return their ID."""
-    url = f"https://api.spotify.com/v1/search?q={artist_name}&type=artist&limit=1"
-    headers = {"Authorization": f"Bearer {token}"}
+    params = {"q": artist_name, "type": "artist", "limit": 1}
     
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers)
+    response = await spotify_client.get("/search", token, params=params)
     if response.status_code == 200:
         data = response.json()
         if data["artists"]["items"]:
             return data["artists"]["items"][0]["id"]
         else:
-            raise Exception("No artist found!")
+            raise SpotifyError("No artist found!")
     else:
-        raise Exception(f"Failed to search artist: {response.json()}")
+        raise SpotifyError(f"Failed to search artist: {response.json()}", response.status_code)
 
     
 
 async def search_song_id_from_spotify(song_name, token):
     """Search for a song on Spotify."""
-    url = f"https://api.spotify.com/v1/search?q={song_name}&type=track&limit=1"
-    headers = {"Authorization": f"Bearer {token}"}
+    params = {"q": song_name, "type": "track", "limit": 1}
     
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            if data["tracks"]["items"]:
-                return data["tracks"]["items"][0]["id"]
-            else:
-                raise Exception("No song found!")
+    response = await spotify_client.get("/search", token, params=params)
+    if response.status_code == 200:
+        data = response.json()
+        if data["tracks"]["items"]:
+            return data["tracks"]["items"][0]["id"]
         else:
-            raise Exception(f"Failed to search song: {response.json()}")
+            raise SpotifyError("No song found!")
+    else:
+        raise SpotifyError(f"Failed to search song: {response.json()}", response.status_code)
 
 
 async def fetch_top_tracks(artist_id, token, market="US"):
     """Fetch top tracks of an artist."""
-    url = f"https://api.spotify.com/v1/artists/{artist_id}/top-tracks?market={market}"
-    headers = {"Authorization": f"Bearer {token}"}
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers)
-        if response.status_code == 200:
-            data = response.json()
-            tracks = []
-            for track in data["tracks"]:
-                tracks.append({
-                    "name": track["name"],
-                    "artist": track["artists"][0]["name"]
-                })
-            print(tracks)
-            return tracks
-        else:
-            raise Exception(f"Failed to fetch top tracks: {response.json()}")
+    response = await spotify_client.get(f"/artists/{artist_id}/top-tracks", token, params={"market": market})
+    if response.status_code == 200:
+        data = response.json()
+        tracks = []
+        for track in data["tracks"]:
+            tracks.append({
+                "name": track["name"],
+                "artist": track["artists"][0]["name"]
+            })
+        print(tracks)
+        return tracks
+    else:
+        raise SpotifyError(f"Failed to fetch top tracks: {response.json()}", response.status_code)
         
 
 async def get_track_image(song_id, token):
     """Fetch the track's album image URL using the Spotify API."""
-    url = f"https://api.spotify.com/v1/tracks/{song_id}"
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
+    response = await spotify_client.get(f"/tracks/{song_id}", token)
+    response_data = response.json()
     
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers)
-        response_data = response.json()
-        
-        if response.status_code == 200:
-            album_images = response_data["album"]["images"]
-            if album_images:
-                # Return the highest resolution image (usually the first one)
-                return album_images[0]["url"]
-            else:
-                return "No album images found."
+    if response.status_code == 200:
+        album_images = response_data["album"]["images"]
+        if album_images:
+            # Return the highest resolution image (usually the first one)
+            return album_images[0]["url"]
         else:
-            raise Exception(f"Failed to get track data: {response_data}")
+            return "No album images found."
+    else:
+        raise SpotifyError(f"Failed to get track data: {response_data}", response.status_code)
     
 
 def fetch_recents() -> list[str]:
     """Fetches the recent tracks and returns it in a list"""
-
-    recents_file = Path.home() / ".ethos" / "userfiles" / "recents.txt"
-    recents = []
     try:
-        if os.path.exists(recents_file):
-            with open(recents_file, 'r') as file:
-                for line in file:
-                    recents.append(line.strip())
-    except:
+        return user_store.recent_tracks(10)
+    except Exception:
         return
-    return recents
 
 
 def add_track_to_recents(track: str):
-    """Writes a track to the recents file, keeping only the last 10 entries."""
-    recents_dir = Path.home() / ".ethos" / "userfiles"
-    recents_file = recents_dir / "recents.txt"
-    
-    recents_dir.mkdir(parents=True, exist_ok=True)
+    """Records a play of a track in the play history, recents are derived from it."""
+    try:
+        user_store.add_play(track)
+    except Exception as e:
+        return f"Error writing to play history: {e}"
 
-    lines = []
-    if recents_file.exists():
-        try:
-            with open(recents_file, "r") as file:
-                lines = file.readlines()
-        except Exception as e:
-            return f"Error reading recents file: {e}"
 
-    track = track.strip()
-    removed_track = track+"\n"
-    if track+"\n" in lines:
-        lines.remove(removed_track)
-    lines.insert(0, track + "\n")
+def add_track_to_history(track: str, source: str, listened_seconds: float, played_at: float,
+                         tier: str = None, resolve_seconds: float = None):
+    """Appends a finished play to the history log and updates the listening stats."""
+    try:
+        listening_history.record(track, source, listened_seconds, played_at, tier, resolve_seconds)
+    except Exception as e:
+        return f"Error writing to history log: {e}"
 
-    lines = lines[:10]
 
+def fetch_most_played(period: str = "week") -> list[str]:
+    """Returns the most played tracks of the current day, week, month or of all time"""
     try:
-        with open(recents_file, "w") as file:
-            file.writelines(lines)
-    except Exception as e:
-        return f"Error writing to recents file: {e}"
+        return [
+            f"{idx}. {track} ({plays} plays)"
+            for idx, (track, plays) in enumerate(listening_history.top_tracks(period), start=1)
+        ]
+    except Exception:
+        return []
 
 
 def fetch_tracks_from_playlist(playlist_name: str) -> list[str]:
         """
-        Function to fetch all songs from a playlist.json file.
+        Function to fetch all songs from a playlist.
 
         Args:
         - playlist_name (str): name of a playlist
@@ -265,58 +252,27 @@ def fetch_tracks_from_playlist(playlist_name: str) -> list[str]:
         Returns:
         - list: List of all songs in a particular playlist
         """
-        playlist_file = Path.home() / ".ethos" / "userfiles" / "playlists" / f"{playlist_name}.json"
-        tracks = []
         try:
-            if os.path.exists(playlist_file):
-                with open(playlist_file, 'r') as playlist:
-                    tracks_json = json.load(playlist)
-                    for track in tracks_json:
-                        name = track["name"]
-                        artist = track["artist"]
-                        tracks.append(f"{name} by {artist}")
-        except:
-            pass
-            return 
-        return tracks
+            return [f"{track['name']} by {track['artist']}" for track in user_store.playlist_tracks(playlist_name)]
+        except Exception:
+            return
 
 
 def add_track_to_playlist(playlist_name: str, track_name: str) -> None:
     """
-    Function to add tracks to a playlist
+    Function to add tracks to the top of a playlist
     
     Args:
     - playlist_name (str): name of a playlist
     """
-    playlist_dir = Path.home() / ".ethos" / "userfiles" / "playlists"
-    playlist_file = playlist_dir / f"{playlist_name}.json"
-
-    playlist_dir.mkdir(parents=True, exist_ok=True)
-    tracks = []
     track, artist = Format.extract_song_and_artist(track_name)
-    tracks.append({"name": track, "artist": artist})
     try:
-        if os.path.exists(playlist_file):
-            with open(playlist_file, 'r') as playlist:
-                tracks_json = json.load(playlist)
-                for track in tracks_json:
-                    tracks.append(track)
-
-        with open(playlist_file, 'w') as file:
-            json.dump(tracks, file, indent=4)
-    except:
+        user_store.add_to_playlist(playlist_name, track, artist)
+    except Exception:
         pass
 
 def fetch_playlists() -> list[str]:
     """
-    Function to fetch all playlists from playlist path
+    Function to fetch the names of all playlists
     """
-    playlists = []
-    playlist_dir = Path.home() / ".ethos" / "userfiles" / "playlists"
-    files = os.listdir(playlist_dir)
-    for f in files:
-        playlist = os.path.basename(playlist_dir / f).split('.')[0]
-        if playlist:
-            playlists.append(playlist)
-
-    return playlists
\ No newline at end of file
+    return user_store.playlist_names()
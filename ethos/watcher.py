@@ -0,0 +1,268 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Dict, Optional, Set
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_inotify():
+    """The libc handle if inotify is usable here, else None"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1, libc.inotify_add_watch, libc.inotify_rm_watch
+    except (OSError, AttributeError):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+class LibraryWatcher:
+    """
+    Background watcher reporting which directories of the library changed.
+
+    On Linux it blocks on inotify (through ctypes), so an idle library costs no
+    CPU. Subtrees that get no watch because the system ran out of them are
+    polled instead, comparing directory mtimes at an interval that grows with
+    their size. Elsewhere, or when inotify is unavailable, the whole tree is
+    polled every `poll_interval` seconds, comparing directory mtimes and the size
+    and mtime of every file. Events are debounced: `on_change` is called with the
+    set of changed directories once no event arrived for `debounce` seconds, and
+    at most `max_delay` seconds after the first one, so a long copy still shows
+    up progressively.
+    """
+
+    # Unwatched subtrees are polled at least this many `poll_interval`s apart, more per 1000 directories
+    FALLBACK_POLL_FACTOR = 6
+
+    def __init__(self, root: str, on_change: Callable[[Set[str]], None], debounce: float = 1.0,
+                 max_delay: float = 5.0, poll_interval: float = 5.0, use_inotify: Optional[bool] = None):
+        self.root = str(root).rstrip(os.sep) or os.sep
+        self.on_change = on_change
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._libc = _load_inotify() if use_inotify is not False else None
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._wake_r, self._wake_w = -1, -1
+        self._unwatched: Set[str] = set()  # Roots of the subtrees polled for lack of inotify watches
+
+    @property
+    def backend(self) -> str:
+        return "inotify" if self._libc else "poll"
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._ready.clear()
+        target = self._run_inotify if self._libc else self._run_poll
+        self._thread = threading.Thread(target=target, name="ethos-library-watcher", daemon=True)
+        self._thread.start()
+        # Changes made once this returns are guaranteed to be reported, however long the first snapshot takes
+        while not self._ready.wait(timeout=0.1):
+            if not self._thread.is_alive():
+                break
+
+    def stop(self):
+        self._stop.set()
+        try:
+            if self._wake_w != -1:
+                os.write(self._wake_w, b"x")
+        except OSError:
+            pass
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def _notify(self, dirs: Set[str]):
+        try:
+            self.on_change(dirs)
+        except Exception as e:
+            print(f"Error updating library: {e}")
+
+    # --- inotify ---------------------------------------------------------------
+
+    def _run_inotify(self):
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            self._libc = None
+            return self._run_poll()
+
+        self._wake_r, self._wake_w = os.pipe()
+        self._unwatched = set()
+        watches: Dict[int, str] = {}
+        try:
+            self._add_tree(fd, self.root, watches)
+            polled = self._snapshot_unwatched()
+            next_poll = time.monotonic() + self._fallback_interval(len(polled))
+            self._ready.set()
+            changed: Set[str] = set()
+            first = last = 0.0
+            while not self._stop.is_set():
+                deadlines = []
+                if changed:
+                    deadlines.append(min(last + self.debounce, first + self.max_delay))
+                if self._unwatched:
+                    deadlines.append(next_poll)
+                timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                readable, _, _ = select.select([fd, self._wake_r], [], [], timeout)
+
+                now = time.monotonic()
+                found = self._read_events(fd, watches) if fd in readable else set()
+                if self._unwatched and now >= next_poll:
+                    current = self._snapshot_unwatched()
+                    found |= {d for d in polled.keys() | current.keys() if polled.get(d) != current.get(d)}
+                    polled = current
+                    next_poll = now + self._fallback_interval(len(polled))
+
+                if found:
+                    if not changed:
+                        first = now
+                    last = now
+                    changed |= found
+                elif changed and now >= min(last + self.debounce, first + self.max_delay):
+                    # Quiet for long enough, or waited max_delay
+                    self._notify(changed)
+                    changed = set()
+        finally:
+            os.close(fd)
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self._wake_r, self._wake_w = -1, -1
+
+    def _fallback_interval(self, dirs: int) -> float:
+        return self.poll_interval * self.FALLBACK_POLL_FACTOR * max(1.0, dirs / 1000)
+
+    def _snapshot_unwatched(self) -> Dict[str, tuple]:
+        snapshot = {}
+        for top in list(self._unwatched):
+            snapshot.update(self._snapshot(top, files=False))
+        return snapshot
+
+    def _add_tree(self, fd: int, top: str, watches: Dict[int, str]):
+        stack = [top]
+        out_of_watches = False
+        while stack:
+            directory = stack.pop()
+            if out_of_watches:  # The rest of the stack would fail too, poll it from here
+                self._unwatched.add(directory)
+                continue
+            wd = self._libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error in (errno.ENOENT, errno.ENOTDIR):
+                    continue  # Vanished already
+                if error in (errno.ENOSPC, errno.ENOMEM):
+                    if not self._unwatched:
+                        print(f"Error watching {directory}: out of inotify watches "
+                              f"(see fs.inotify.max_user_watches), polling the unwatched directories instead")
+                    out_of_watches = True
+                    self._unwatched.add(directory)
+                else:
+                    print(f"Error watching {directory}: {os.strerror(error)}")
+                continue
+            watches[wd] = directory
+            try:
+                with os.scandir(directory) as entries:
+                    stack.extend(e.path for e in entries if e.is_dir(follow_symlinks=False))
+            except OSError:
+                pass
+
+    def _read_events(self, fd: int, watches: Dict[int, str]) -> Set[str]:
+        changed = set()
+        while True:
+            try:
+                data = os.read(fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += EVENT_HEADER.size + length
+
+                if mask & IN_Q_OVERFLOW:
+                    changed.update(watches.values())
+                    continue
+                directory = watches.get(wd)
+                if directory is None:
+                    continue
+                if mask & IN_IGNORED:
+                    del watches[wd]
+                    continue
+
+                changed.add(directory)
+                if mask & IN_MOVE_SELF:  # Moved away, its path in `watches` is stale now
+                    self._libc.inotify_rm_watch(fd, wd)
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(fd, os.path.join(directory, os.fsdecode(name)), watches)
+
+    # --- polling ---------------------------------------------------------------
+
+    def _run_poll(self):
+        snapshot = self._snapshot(self.root)
+        self._ready.set()
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot(self.root)
+            changed = {d for d in snapshot.keys() | current.keys() if snapshot.get(d) != current.get(d)}
+            snapshot = current
+            if changed:
+                self._notify(changed)
+
+    @staticmethod
+    def _snapshot(top: str, files: bool = True) -> Dict[str, tuple]:
+        """
+        State of every directory of a tree: its mtime and, with `files`, a hash of
+        the name, size and mtime of its files, since rewriting a file in place
+        leaves the directory's mtime alone.
+        """
+        snapshot = {}
+        stack = [top]
+        while stack:
+            directory = stack.pop()
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+                listing = []
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif files:
+                                stat = entry.stat(follow_symlinks=False)
+                                listing.append((entry.name, stat.st_size, stat.st_mtime_ns))
+                        except OSError:
+                            pass
+                snapshot[directory] = (mtime_ns, hash(frozenset(listing)))
+            except OSError:
+                pass
+        return snapshot
@@ -1,36 +1,83 @@
 import pytest
 import vlc
+from types import SimpleNamespace
 from pathlib import Path
-from ethos.player import MusicPlayer
+from ethos.player import MusicPlayer, MediaProbe
 
 # --- Dummy VLC Classes for Testing --- #
 
+class DummyEvent:
+    def __init__(self, event_type, **data):
+        self.type = event_type
+        self.u = SimpleNamespace(**data)
+
+class DummyEventManager:
+    def __init__(self):
+        self.callbacks = {}
+
+    def event_attach(self, event_type, callback, *args):
+        self.callbacks[event_type] = (callback, args)
+
+    def fire(self, event_type, **data):
+        if event_type in self.callbacks:
+            callback, args = self.callbacks[event_type]
+            callback(DummyEvent(event_type, **data), *args)
+
 class DummyMedia:
     def __init__(self, path):
         self.path = path
         self.duration = 10000  
+        self.parsed_status = vlc.MediaParsedStatus.done
+        self.parse_count = 0
+        self.options = []
+        self.events = DummyEventManager()
 
     def get_duration(self):
         return self.duration
 
+    def event_manager(self):
+        return self.events
+
+    def parse_with_options(self, parse_flag, timeout):
+        # Parses "instantly" and notifies listeners like libvlc would
+        self.parse_count += 1
+        self.events.fire(vlc.EventType.MediaParsedChanged)
+        return 0
+
+    def get_parsed_status(self):
+        return self.parsed_status
+
+    def add_option(self, option):
+        self.options.append(option)
+
 class DummyPlayer:
     def __init__(self):
         self.volume = 50
         self.time = 0
         self.media = None
+        self.events = DummyEventManager()
+
+    def event_manager(self):
+        return self.events
 
     def set_media(self, media):
         self.media = media
 
     def play(self):
-        
-        pass
+        self.events.fire(vlc.EventType.MediaPlayerPlaying)
 
     def pause(self):
-        pass
+        self.events.fire(vlc.EventType.MediaPlayerPaused)
 
     def stop(self):
         self.media = None
+        self.events.fire(vlc.EventType.MediaPlayerStopped)
+
+    def release(self):
+        self.released = True
+
+    def get_length(self):
+        return self.media.get_duration() if self.media else -1
 
     def audio_set_volume(self, volume):
         self.volume = volume
@@ -46,6 +93,7 @@ class DummyPlayer:
 
     def set_time(self, new_time):
         self.time = new_time
+        self.events.fire(vlc.EventType.MediaPlayerTimeChanged, new_time=new_time)
 
     def get_media(self):
         return self.media
@@ -65,5 +113,6 @@ def music_player(monkeypatch):
     Fixture that patches vlc.Instance to use DummyVLCInstance.
     """
     monkeypatch.setattr(vlc, "Instance", lambda: DummyVLCInstance())
+    monkeypatch.setattr(MediaProbe, "_shared", None)
     return MusicPlayer()
 
@@ -0,0 +1,54 @@
+import threading
+import pytest
+from ethos.spotify_importer import SpotifyImporter
+from ethos.store import UserStore
+
+
+class FakeSpotify:
+    """Paginated fake of the spotipy client"""
+
+    def __init__(self, playlists: dict):
+        self.playlists = playlists  # playlist id -> list of track names
+        self.snapshots = {playlist_id: "snap-1" for playlist_id in playlists}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _page(items, limit, offset):
+        return {"items": items[offset:offset + limit], "total": len(items)}
+
+    def current_user_playlists(self, limit=50, offset=0):
+        with self._lock:
+            self.calls.append(("current_user_playlists", offset))
+        items = [
+            {"id": playlist_id, "name": playlist_id, "snapshot_id": self.snapshots[playlist_id]}
+            for playlist_id in self.playlists
+        ]
+        return self._page(items, limit, offset)
+
+    def playlist_tracks(self, playlist_id, fields=None, limit=100, offset=0):
+        with self._lock:
+            self.calls.append(("playlist_tracks", playlist_id, offset))
+        items = [
+            {"track": {"id": f"id-{name}", "name": name, "artists": [{"name": "Artist"}]}}
+            for name in self.playlists[playlist_id]
+        ]
+        return self._page(items, limit, offset)
+
+    def update(self, playlist_id, tracks):
+        self.playlists[playlist_id] = tracks
+        self.snapshots[playlist_id] = f"snap-{int(self.snapshots[playlist_id].split('-')[1]) + 1}"
+
+
+@pytest.fixture
+def make_importer(monkeypatch, tmp_path):
+    importers = []
+
+    def make(playlists: dict) -> SpotifyImporter:
+        monkeypatch.setattr(SpotifyImporter, "_authenticate", lambda self: FakeSpotify(playlists))
+        importers.append(SpotifyImporter("id", "secret", "http://localhost:3000/", store=UserStore(tmp_path)))
+        return importers[-1]
+
+    yield make
+    for importer in importers:
+        importer.shutdown()
@@ -0,0 +1,25 @@
+def test_playlist_tracks_are_fully_paginated(make_importer):
+    importer = make_importer({"big": [f"song {i}" for i in range(250)]})
+    progress = []
+
+    importer.save_playlist("big", "big", progress=lambda done, total: progress.append((done, total)))
+
+    songs = importer.store.playlist_tracks("big")
+    assert [song["name"] for song in songs] == [f"song {i}" for i in range(250)]
+    assert sorted(call[2] for call in importer.spotify.calls) == [0, 100, 200]
+    assert progress[-1] == (250, 250)
+
+
+def test_all_playlists_are_listed(make_importer):
+    importer = make_importer({f"playlist {i}": [] for i in range(120)})
+    assert len(importer.fetch_playlists()) == 120
+
+
+def test_shutdown_stops_the_page_threads(make_importer):
+    importer = make_importer({"big": [f"song {i}" for i in range(250)]})
+    importer.fetch_playlist_tracks("big")
+    threads = list(importer._page_pool._threads)
+
+    importer.shutdown()
+
+    assert threads and not any(thread.is_alive() for thread in threads)
@@ -0,0 +1,63 @@
+import threading
+import time
+from spotipy import SpotifyException
+from ethos.spotify_client import RateLimiter
+
+
+def test_requests_in_flight_are_capped(make_importer):
+    importer = make_importer({f"playlist {i}": [f"song {j}" for j in range(1000)] for i in range(6)})
+    importer.limiter = RateLimiter(rate=10000, burst=100)
+    fetch = importer.spotify.playlist_tracks
+    lock = threading.Lock()
+    in_flight = [0, 0]  # current, highest
+    threads = set()
+
+    def slow(playlist_id, **kwargs):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+            threads.add(threading.get_ident())
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return fetch(playlist_id, **kwargs)
+
+    importer.spotify.playlist_tracks = slow
+    summary = importer.refresh_all_playlists()
+
+    assert summary["failed"] == {}
+    assert len(summary["refreshed"]) == 6
+    assert in_flight[1] <= importer.MAX_CONCURRENCY
+    assert len(threads) <= importer.MAX_REFRESH_WORKERS + importer.MAX_PAGE_WORKERS
+
+
+def test_request_rate_is_capped(make_importer):
+    importer = make_importer({"big": [f"song {i}" for i in range(2000)]})
+    importer.limiter = RateLimiter(rate=100, burst=5)
+
+    start = time.monotonic()
+    importer.save_playlist("big", "big")
+    elapsed = time.monotonic() - start
+
+    assert len(importer.spotify.calls) == 20
+    assert elapsed >= (20 - 5) / 100
+
+
+def test_throttled_requests_are_retried(make_importer, monkeypatch):
+    importer = make_importer({"one": ["a"]})
+    monkeypatch.setattr(importer, "backoff", lambda attempt: 0.0)
+    fetch = importer.spotify.playlist_tracks
+    failures = [
+        SpotifyException(429, -1, "rate limited", headers={"Retry-After": "0"}),
+        SpotifyException(503, -1, "unavailable"),
+    ]
+
+    def throttled(playlist_id, **kwargs):
+        if failures:
+            raise failures.pop(0)
+        return fetch(playlist_id, **kwargs)
+
+    importer.spotify.playlist_tracks = throttled
+    importer.save_playlist("one", "one")
+
+    assert [song["name"] for song in importer.store.playlist_tracks("one")] == ["a"]
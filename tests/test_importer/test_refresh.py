@@ -0,0 +1,101 @@
+import pytest
+from ethos.spotify_importer import SpotifyImporter
+
+
+def track_fetches(importer):
+    return [call for call in importer.spotify.calls if call[0] == "playlist_tracks"]
+
+
+def test_unchanged_playlists_are_skipped(make_importer):
+    importer = make_importer({"one": ["a", "b"], "two": ["c"]})
+    first = importer.refresh_all_playlists()
+    assert first["refreshed"]["one"]["diff"] == {"added": ["id-a", "id-b"], "removed": [], "moved": []}
+
+    importer.spotify.calls.clear()
+    second = importer.refresh_all_playlists()
+    assert second["refreshed"] == {}
+    assert second["unchanged"] == {"one": {"name": "one"}, "two": {"name": "two"}}
+    assert track_fetches(importer) == []
+
+
+def test_changed_playlist_is_diffed_by_id(make_importer):
+    importer = make_importer({"one": ["a", "b", "c"], "two": ["d"]})
+    importer.refresh_all_playlists()
+
+    importer.spotify.update("one", ["c", "a", "e"])
+    importer.spotify.calls.clear()
+    summary = importer.refresh_all_playlists()
+
+    assert list(summary["unchanged"]) == ["two"]
+    assert summary["refreshed"]["one"]["diff"] == {"added": ["id-e"], "removed": ["id-b"], "moved": ["id-c"]}
+    assert [call[1] for call in track_fetches(importer)] == ["one"]
+    saved = importer.store.playlist_tracks("one")
+    assert [song["name"] for song in saved] == ["c", "a", "e"]
+
+
+def test_diff_tracks():
+    assert SpotifyImporter.diff_tracks(["a", "b"], ["a", "b"]) == {"added": [], "removed": [], "moved": []}
+
+
+def test_diff_tracks_removal_does_not_move_the_rest():
+    old = [str(i) for i in range(10)]
+    new = old[:2] + old[3:]
+
+    assert SpotifyImporter.diff_tracks(old, new) == {"added": [], "removed": ["2"], "moved": []}
+    assert SpotifyImporter.diff_tracks(old, old[1:] + old[:1])["moved"] == ["0"]
+
+
+def test_failures_are_isolated(make_importer):
+    importer = make_importer({"good": ["a"], "bad": ["b"]})
+    fetch = importer.spotify.playlist_tracks
+
+    def flaky(playlist_id, **kwargs):
+        if playlist_id == "bad":
+            raise RuntimeError("boom")
+        return fetch(playlist_id, **kwargs)
+
+    importer.spotify.playlist_tracks = flaky
+    summary = importer.refresh_all_playlists(max_workers=2)
+
+    assert summary["failed"] == {"bad": {"name": "bad", "error": "boom"}}
+    assert list(summary["refreshed"]) == ["good"]
+    assert set(summary["timings"]) == {"good", "bad"}
+    assert importer.store.playlist_names() == ["good"]
+
+
+def test_save_playlist_to_json_is_a_deprecated_alias(make_importer):
+    importer = make_importer({"one": ["a"]})
+
+    with pytest.warns(DeprecationWarning):
+        importer.save_playlist_to_json("one", "one")
+
+    assert [song["name"] for song in importer.store.playlist_tracks("one")] == ["a"]
+
+
+def test_renamed_playlist_is_renamed_in_the_store(make_importer):
+    importer = make_importer({"one": ["a"]})
+    importer.refresh_all_playlists()
+
+    playlist = importer.spotify.current_user_playlists()["items"][0]
+    importer.spotify.current_user_playlists = lambda limit=50, offset=0: {
+        "items": [dict(playlist, name="renamed", snapshot_id="snap-2")][offset:], "total": 1,
+    }
+    summary = importer.refresh_all_playlists()
+
+    assert summary["refreshed"]["one"] == {"name": "renamed", "diff": {"added": [], "removed": [], "moved": []}}
+    assert importer.store.playlist_names() == ["renamed"]
+    assert [song["name"] for song in importer.store.playlist_tracks("renamed")] == ["a"]
+
+
+def test_playlists_sharing_a_name_are_summarized_apart(make_importer):
+    importer = make_importer({"id-1": ["a"], "id-2": ["b"]})
+    listing = importer.spotify.current_user_playlists
+    importer.spotify.current_user_playlists = lambda limit=50, offset=0: dict(
+        listing(limit, offset), items=[dict(item, name="Mix") for item in listing(limit, offset)["items"]]
+    )
+
+    summary = importer.refresh_all_playlists()
+
+    assert summary["refreshed"]["id-1"]["name"] == summary["refreshed"]["id-2"]["name"] == "Mix"
+    assert summary["refreshed"]["id-2"]["diff"]["added"] == ["id-b"]
+    assert set(summary["timings"]) == {"id-1", "id-2"}
@@ -0,0 +1,166 @@
+import os
+import time
+
+from ethos.library import LibraryIndex, _Scan
+
+
+def touch(path, data=b"x"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_cold_scan_indexes_audio_files_only(tmp_path):
+    music = tmp_path / "music"
+    song = touch(music / "a" / "song.mp3", b"abc")
+    touch(music / "a" / "cover.jpg")
+    other = touch(music / "b" / "c" / "other.FLAC")
+    index = LibraryIndex(tmp_path / "library.db")
+    calls = []
+
+    stats = index.scan(music, progress=lambda dirs, files: calls.append((dirs, files)))
+
+    assert index.songs(music) == sorted([song, other])
+    assert stats['added'] == 2
+    assert calls[-1] == (4, 2)
+    entry = index.get(song)
+    assert entry['size'] == 3 and entry['format'] == 'mp3'
+    assert index.get(other)['format'] == 'flac'
+
+
+def test_rescan_skips_unchanged_directories(tmp_path):
+    music = tmp_path / "music"
+    touch(music / "a" / "song.mp3")
+    touch(music / "b" / "deep" / "other.wav")
+    index = LibraryIndex(tmp_path / "library.db")
+    index.scan(music)
+
+    stats = index.scan(music)
+
+    assert stats['dirs_scanned'] == 0
+    assert stats['dirs_skipped'] == 4
+    assert stats['added'] == stats['updated'] == stats['removed'] == 0
+
+
+def test_rescan_sees_files_rewritten_in_place(tmp_path):
+    music = tmp_path / "music"
+    song = touch(music / "a" / "song.mp3", b"x")
+    index = LibraryIndex(tmp_path / "library.db")
+    index.scan(music)
+    mtime_ns = os.stat(music / "a").st_mtime_ns
+
+    touch(music / "a" / "song.mp3", b"retagged")
+    os.utime(music / "a", ns=(mtime_ns, mtime_ns))
+    stats = index.scan(music)
+
+    assert stats['dirs_skipped'] == 2
+    assert stats['updated'] == 1
+    assert index.get(song)['size'] == 8
+
+
+def test_rescan_picks_up_changes(tmp_path):
+    music = tmp_path / "music"
+    keep = touch(music / "a" / "keep.mp3")
+    gone = touch(music / "a" / "gone.mp3")
+    touch(music / "old" / "x.mp3")
+    index = LibraryIndex(tmp_path / "library.db")
+    index.scan(music)
+
+    os.remove(gone)
+    new = touch(music / "b" / "new.m4a")
+    os.remove(music / "old" / "x.mp3")
+    os.rmdir(music / "old")
+
+    stats = index.scan(music)
+
+    assert index.songs(music) == [keep, new]
+    assert stats['added'] == 1
+    assert stats['removed'] == 2
+
+
+def test_songs_are_scoped_to_root(tmp_path):
+    index = LibraryIndex(tmp_path / "library.db")
+    inside = touch(tmp_path / "music" / "a.mp3")
+    touch(tmp_path / "music2" / "b.mp3")
+    index.scan(tmp_path / "music")
+    index.scan(tmp_path / "music2")
+
+    assert index.songs(tmp_path / "music") == [inside]
+
+
+def test_update_lists_only_changed_directories(tmp_path):
+    music = tmp_path / "music"
+    keep = touch(music / "a" / "keep.mp3")
+    touch(music / "b" / "old" / "x.mp3")
+    index = LibraryIndex(tmp_path / "library.db")
+    index.scan(music)
+
+    other = touch(music / "c" / "other.mp3")  # Changed behind the watcher's back, not reported
+    new = touch(music / "a" / "new" / "deep" / "new.mp3")
+    os.remove(music / "b" / "old" / "x.mp3")
+    os.rmdir(music / "b" / "old")
+
+    stats = index.update(music, [str(music / "a"), str(music / "b"), str(music / "b" / "old")])
+
+    assert index.songs(music) == [keep, new]
+    assert stats['dirs_scanned'] == 4  # a, b and the two new directories
+    assert stats['added'] == 1 and stats['removed'] == 1
+    assert (stats['changed_paths'], stats['removed_paths']) == ([new], [str(music / "b" / "old" / "x.mp3")])
+    assert sorted(index.tracks_at([new, keep, other])) == sorted([(new, None, None), (keep, None, None)])
+    assert index.scan(music)['added'] == 1
+    assert other in index.songs(music)
+
+
+def make_library(root, dirs=6, files=5):
+    paths = []
+    for d in range(dirs):
+        for f in range(files):
+            paths.append(touch(root / f"artist{d}" / f"album{d}" / f"{f}.mp3"))
+    return sorted(paths)
+
+
+def test_cancelled_scan_resumes(tmp_path):
+    music = tmp_path / "music"
+    paths = make_library(music)
+    index = LibraryIndex(tmp_path / "library.db", workers=2, batch_size=3)
+    extracted = []
+
+    def extract(path):
+        extracted.append(path)
+        if len(extracted) == 5:
+            index.cancel()
+        return {'title': os.path.basename(path)}
+
+    index.extract = extract
+    first = index.scan(music)
+
+    assert first['cancelled']
+    assert len(index.songs(music)) < len(paths)
+
+    second = index.scan(music)
+
+    assert not second['cancelled']
+    assert index.songs(music) == paths
+    assert second['dirs_skipped'] > 0
+    assert first['added'] + second['added'] >= len(paths)
+    assert all(index.get(path)['title'] == os.path.basename(path) for path in paths)
+
+
+def test_backpressure_bounds_pending_work(tmp_path, monkeypatch):
+    music = tmp_path / "music"
+    paths = make_library(music, dirs=20, files=2)
+    index = LibraryIndex(tmp_path / "library.db", workers=1, batch_size=7)
+    index.extract = lambda path: time.sleep(0.001) or {}
+    sizes = []
+    queue = _Scan._queue
+
+    def recording_queue(self, op, payload):
+        queue(self, op, payload)
+        sizes.append(len(self.pending))
+
+    monkeypatch.setattr(_Scan, "_queue", recording_queue)
+    stats = index.scan(music)
+
+    assert stats['added'] == len(paths)
+    assert index.songs(music) == paths
+    assert max(sizes) <= 4
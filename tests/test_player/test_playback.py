@@ -1,4 +1,11 @@
+import time
 import pytest
+import vlc
+from ethos.track_resolver import Resolution
+
+
+def stream_resolution(track):
+    return Resolution(track, f"https://stream/{track}", "yt-dlp", 0.0)
 
 @pytest.mark.playback
 def test_play(music_player):
@@ -81,4 +88,127 @@ def test_track_info(music_player):
     music_player.player.set_time(5000)  
     
     from ethos.player import TrackInfo
-    assert TrackInfo.get_current_time(music_player) == "0:05"
\ No newline at end of file
+    assert TrackInfo.get_current_time(music_player) == "0:05"
+
+
+@pytest.mark.track_info
+def test_playback_state_from_events(music_player):
+    """Test progress is driven by VLC events, not by re-parsing the media"""
+    music_player.play("dummy_track.mp3")
+    music_player.player.events.fire(vlc.EventType.MediaPlayerLengthChanged, new_length=10000)
+    music_player.pause()
+    music_player.player.events.fire(vlc.EventType.MediaPlayerPositionChanged, new_position=0.25)
+
+    from ethos.player import TrackInfo
+    assert music_player.playback_state.duration_ms == 10000
+    assert TrackInfo.get_current_time_int(music_player) == 2
+    assert TrackInfo.get_progress(music_player) == 25.0
+
+    # Duration is captured once per track
+    music_player.player.events.fire(vlc.EventType.MediaPlayerLengthChanged, new_length=20000)
+    assert music_player.playback_state.duration_ms == 10000
+
+@pytest.mark.track_info
+def test_playback_state_interpolates_between_events(monkeypatch):
+    from ethos import player as player_module
+    from ethos.player import PlaybackState
+
+    clock = [100.0]
+    monkeypatch.setattr(player_module.time, "monotonic", lambda: clock[0])
+    state = PlaybackState()
+    state.reset("dummy_track.mp3")
+    state.set_duration(10000)
+    state.set_playing(True)
+    state.update_time(1000)
+
+    clock[0] += 1.5
+    assert state.position_ms == 2500
+
+    clock[0] += 60
+    assert state.position_ms == 10000  # Never runs past the end of the track
+
+@pytest.mark.playback
+def test_end_and_error_callbacks(music_player):
+    """Test end-of-track and error callbacks are driven by VLC events"""
+    finished, failed = [], []
+    music_player.on_end_reached(finished.append)
+    music_player.on_error(failed.append)
+
+    music_player.play("dummy_track.mp3")
+    music_player.player.events.fire(vlc.EventType.MediaPlayerEndReached)
+    assert finished == ["dummy_track.mp3"]
+    assert music_player.is_playing is False
+
+    music_player.play("broken_track.mp3")
+    music_player.player.events.fire(vlc.EventType.MediaPlayerEncounteredError)
+    assert failed == ["broken_track.mp3"]
+
+@pytest.mark.playback
+def test_preload_switches_to_standby_player(music_player):
+    """Test a preloaded track plays on the pre-buffered standby player"""
+    music_player.play("dummy_track.mp3")
+    music_player.set_volume(30)
+    first_player = music_player.player
+
+    assert music_player.preload("next_track.mp3") is True
+    standby = music_player._standby[1]
+    assert standby.media.options == [":start-paused"]
+
+    # Standby events must not leak into the current playback state
+    standby.set_time(4000)
+    assert music_player.playback_state.position_ms < 4000
+
+    music_player.play("next_track.mp3")
+    assert music_player.player is standby
+    assert first_player.released
+    assert music_player.get_volume() == 30
+    assert music_player.playback_state.duration_ms == 10000
+
+@pytest.mark.playback
+def test_prefetcher_resolves_queue_head(music_player):
+    from ethos.prefetch import Prefetcher
+
+    prefetcher = Prefetcher(music_player, stream_resolution)
+    prefetcher.update(["song a", "song b", "song c"])
+    assert prefetcher.take("song a").source == "https://stream/song a"
+    assert prefetcher.take("song c") is None
+    prefetcher.executor.shutdown(wait=True)
+    assert music_player._standby[0] == "https://stream/song a"
+
+@pytest.mark.playback
+def test_prefetcher_preloads_once_and_drops_expired_urls(music_player, monkeypatch):
+    from ethos.prefetch import Prefetcher
+
+    preloaded = []
+    preload = music_player.preload
+    monkeypatch.setattr(music_player, "preload", lambda url: preloaded.append(url) or preload(url))
+    expired = f"https://stream/old?expire={int(time.time()) - 10}"
+    prefetcher = Prefetcher(
+        music_player, lambda track: Resolution(track, expired, "stream-cache", 0.0) if track == "old" else stream_resolution(track)
+    )
+    for _ in range(3):
+        prefetcher.update(["song a", "old"])
+    prefetcher.executor.shutdown(wait=True)
+
+    assert preloaded == ["https://stream/song a"]
+    assert prefetcher.take("old") is None
+    assert prefetcher.take("song a").source == "https://stream/song a"
+
+
+@pytest.mark.playback
+def test_prefetcher_preloads_again_after_the_standby_is_discarded(music_player):
+    from ethos.prefetch import Prefetcher
+
+    prefetcher = Prefetcher(music_player, stream_resolution)
+    prefetcher.update(["song a"])
+    deadline = time.time() + 2
+    while music_player.standby_track() is None and time.time() < deadline:
+        time.sleep(0.01)  # The preload runs in a callback once the resolve finished
+    assert music_player.standby_track() == "https://stream/song a"
+
+    music_player.play("https://stream/picked by hand")  # Discards the standby player
+    assert music_player.standby_track() is None
+    prefetcher.update(["song a"])
+    prefetcher.executor.shutdown(wait=True)
+
+    assert music_player.standby_track() == "https://stream/song a"
@@ -0,0 +1,125 @@
+import pytest
+import vlc
+from ethos.player import MediaProbe, TrackInfo
+from tests.conftest import DummyVLCInstance, DummyMedia
+
+
+class CountingVLCInstance(DummyVLCInstance):
+    def __init__(self):
+        self.created = []
+
+    def media_new(self, path):
+        media = DummyMedia(path)
+        self.created.append(media)
+        return media
+
+
+class SilentMedia(DummyMedia):
+    """Media whose parse never finishes, like a dead URL"""
+
+    def parse_with_options(self, parse_flag, timeout):
+        return 0
+
+
+class FailedMedia(DummyMedia):
+    """Media that libvlc fails to parse"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.parsed_status = vlc.MediaParsedStatus.failed
+
+
+@pytest.mark.track_info
+def test_probe_caches_duration():
+    instance = CountingVLCInstance()
+    probe = MediaProbe(instance)
+
+    assert probe.probe("dummy_track.mp3").result(timeout=1) == 10000
+    assert probe.get_duration("dummy_track.mp3") == 10000
+    assert probe.cached("dummy_track.mp3") == 10000
+    assert len(instance.created) == 1
+
+
+@pytest.mark.track_info
+def test_probe_failed_parse_is_not_cached():
+    instance = DummyVLCInstance()
+    instance.media_new = lambda path: FailedMedia(path)
+    probe = MediaProbe(instance)
+
+    assert probe.get_duration("bad_url") == -1
+    assert probe.cached("bad_url") is None
+
+
+@pytest.mark.track_info
+def test_probe_times_out_without_blocking_forever():
+    instance = DummyVLCInstance()
+    instance.media_new = lambda path: SilentMedia(path)
+    probe = MediaProbe(instance, timeout=0.05)
+
+    assert probe.get_duration("never_parses") == -1
+
+
+@pytest.mark.track_info
+def test_probe_timeout_starts_a_new_probe():
+    instance = CountingVLCInstance()
+    instance.media_new = lambda path: instance.created.append(path) or SilentMedia(path)
+    probe = MediaProbe(instance, timeout=0.05)
+
+    assert probe.get_duration("slow_url") == -1
+    assert probe.get_duration("slow_url") == -1
+    assert len(instance.created) == 2
+
+
+@pytest.mark.track_info
+def test_probe_cache_is_bounded():
+    probe = MediaProbe(DummyVLCInstance(), cache_size=2)
+    for path in ("a.mp3", "b.mp3", "c.mp3"):
+        probe.get_duration(path)
+
+    assert probe.cached("a.mp3") is None
+    assert probe.cached("c.mp3") == 10000
+
+
+@pytest.mark.track_info
+def test_track_info_duration_uses_shared_probe(music_player):
+    assert TrackInfo.get_audio_duration("dummy_track.mp3") == "0:10"
+    assert TrackInfo.get_audio_duration_int("dummy_track.mp3") == 10
+
+
+class ReleasableMedia(SilentMedia):
+    released = False
+
+    def release(self):
+        self.released = True
+
+
+@pytest.mark.track_info
+def test_late_event_of_an_abandoned_probe_is_ignored():
+    instance = CountingVLCInstance()
+    instance.media_new = lambda path: instance.created.append(ReleasableMedia(path)) or instance.created[-1]
+    probe = MediaProbe(instance, timeout=0.05)
+
+    assert probe.get_duration("slow_url") == -1
+    abandoned = instance.created[0]
+    assert abandoned.released
+    retry = probe.probe("slow_url")
+
+    abandoned.events.fire(vlc.EventType.MediaParsedChanged)  # libvlc reports the old parse late
+
+    assert not retry.done()
+    assert probe.cached("slow_url") is None
+
+
+@pytest.mark.track_info
+def test_parsed_media_is_released():
+    instance = CountingVLCInstance()
+    media = ReleasableMedia("a.mp3")
+    instance.media_new = lambda path: media if path == "a.mp3" else ReleasableMedia(path)
+    probe = MediaProbe(instance)
+
+    future = probe.probe("a.mp3")
+    media.events.fire(vlc.EventType.MediaParsedChanged)
+    assert future.result(timeout=1) == 10000
+
+    probe.probe("b.mp3")  # Media parsed earlier is released by the next probe
+    assert media.released
@@ -0,0 +1,143 @@
+import ctypes
+import errno
+import threading
+import time
+
+import pytest
+
+from ethos.watcher import LibraryWatcher
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class Recorder:
+    def __init__(self):
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, dirs):
+        with self.lock:
+            self.batches.append(set(dirs))
+
+    @property
+    def changed(self):
+        with self.lock:
+            return set().union(*self.batches) if self.batches else set()
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_reports_changed_directories(tmp_path, use_inotify):
+    (tmp_path / "album").mkdir()
+    recorder = Recorder()
+    watcher = LibraryWatcher(tmp_path, recorder, debounce=0.05, poll_interval=0.05, use_inotify=use_inotify)
+    if use_inotify and watcher.backend != "inotify":
+        pytest.skip("inotify is not available")
+    watcher.start()
+    try:
+        time.sleep(0.1)
+        (tmp_path / "album" / "song.mp3").write_bytes(b"x")
+        (tmp_path / "new").mkdir()
+        assert wait_for(lambda: {str(tmp_path / "album"), str(tmp_path)} <= recorder.changed)
+
+        # Directories created after start are watched too
+        (tmp_path / "new" / "other.mp3").write_bytes(b"x")
+        assert wait_for(lambda: str(tmp_path / "new") in recorder.changed)
+    finally:
+        watcher.stop()
+
+
+def test_inotify_events_are_debounced(tmp_path):
+    recorder = Recorder()
+    watcher = LibraryWatcher(tmp_path, recorder, debounce=0.2, max_delay=5.0)
+    if watcher.backend != "inotify":
+        pytest.skip("inotify is not available")
+    watcher.start()
+    try:
+        time.sleep(0.05)
+        for i in range(20):
+            (tmp_path / f"{i}.mp3").write_bytes(b"x")
+        assert wait_for(lambda: recorder.batches)
+        time.sleep(0.3)
+        assert recorder.batches == [{str(tmp_path)}]
+    finally:
+        watcher.stop()
+
+
+def test_polling_sees_files_rewritten_in_place(tmp_path):
+    song = tmp_path / "song.mp3"
+    song.write_bytes(b"x")
+    recorder = Recorder()
+    watcher = LibraryWatcher(tmp_path, recorder, poll_interval=0.05, use_inotify=False)
+    watcher.start()
+    try:
+        song.write_bytes(b"retagged")
+        assert wait_for(lambda: str(tmp_path) in recorder.changed)
+    finally:
+        watcher.stop()
+
+
+class LimitedWatchesLibc:
+    """inotify with fs.inotify.max_user_watches exhausted after `limit` watches"""
+
+    def __init__(self, libc, limit):
+        self.libc = libc
+        self.limit = limit
+
+    def inotify_add_watch(self, fd, path, mask):
+        if self.limit <= 0:
+            ctypes.set_errno(errno.ENOSPC)
+            return -1
+        self.limit -= 1
+        return self.libc.inotify_add_watch(fd, path, mask)
+
+    def __getattr__(self, name):
+        return getattr(self.libc, name)
+
+
+def test_polls_only_the_subtrees_without_watches(tmp_path, capsys):
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+    recorder = Recorder()
+    watcher = LibraryWatcher(tmp_path, recorder, debounce=0.05, poll_interval=0.02)
+    if watcher.backend != "inotify":
+        pytest.skip("inotify is not available")
+    watcher._libc = LimitedWatchesLibc(watcher._libc, limit=2)
+    watcher.start()
+    try:
+        assert watcher.backend == "inotify"
+        assert len(watcher._unwatched) == 1
+        assert "max_user_watches" in capsys.readouterr().out
+        for name in ("a", "b"):
+            (tmp_path / name / "song.mp3").write_bytes(b"x")
+        assert wait_for(lambda: {str(tmp_path / "a"), str(tmp_path / "b")} <= recorder.changed)
+    finally:
+        watcher.stop()
+
+
+def test_music_player_picks_up_new_files(music_player, tmp_path):
+    music_player.library_index.db_file = tmp_path / "library.db"
+    library = tmp_path / "music"
+    library.mkdir()
+    (library / "old.mp3").write_bytes(b"x")
+    assert music_player.set_library(str(library))
+
+    updates = []
+    assert music_player.watch_library(lambda changed, removed: updates.append((changed, removed)))
+    music_player.library_watcher.debounce = 0.05
+    try:
+        assert music_player.get_library_songs() == [str(library / "old.mp3")]
+        (library / "new.mp3").write_bytes(b"x")
+        if music_player.library_watcher.backend == "poll":
+            pytest.skip("polling interval is too long for this test")
+        assert wait_for(lambda: str(library / "new.mp3") in music_player.get_library_songs())
+        assert wait_for(lambda: updates)
+        assert updates[0] == ([str(library / "new.mp3")], [])
+    finally:
+        music_player.stop_watching_library()
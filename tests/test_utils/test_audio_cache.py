@@ -0,0 +1,154 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from ethos.audio_cache import AudioCache
+
+AUDIO = b"\x00\x01" * 5000
+
+
+def make_cache(tmp_path, body=AUDIO, headers=None, **kwargs):
+    requests = []
+
+    def handler(request):
+        requests.append(request.url)
+        if request.headers.get("user-agent") == "blocked":
+            return httpx.Response(403)
+        return httpx.Response(200, content=body, headers=headers or {"content-type": "audio/webm"})
+
+    cache = AudioCache(tmp_path / "audio", transport=httpx.MockTransport(handler), **kwargs)
+    return cache, requests
+
+
+def test_downloads_after_enough_plays(tmp_path):
+    cache, requests = make_cache(tmp_path, min_plays=2)
+    url = "https://stream.example/a?expire=1"
+
+    assert cache.record_play("Song by X", url) is None
+    cache.record_play("Song by X", url).result()
+
+    path = cache.path_for("song by x")
+    assert path.endswith(".webm")
+    assert open(path, "rb").read() == AUDIO
+    assert cache.local_copy(url) == path
+    assert cache.record_play("Song by X", url) is None  # Already cached
+    assert len(requests) == 1
+    assert list((tmp_path / "audio").glob(".*.part")) == []
+
+
+def test_hits_from_concurrent_lookups_are_all_counted(tmp_path):
+    cache, _ = make_cache(tmp_path, min_plays=1)
+    cache.record_play("Song by X", "https://stream.example/a").result()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: cache.path_for("Song by X"), range(400)))
+
+    assert cache.stats["hits"] == 400
+
+
+def test_local_plays_are_counted_but_not_downloaded(tmp_path):
+    cache, requests = make_cache(tmp_path, min_plays=1)
+
+    assert cache.record_play("Song by X", "/music/song.mp3") is None
+    assert cache.path_for("Song by X") is None
+    assert cache.local_copy("/music/song.mp3") is None
+    assert requests == []
+
+
+def test_stream_headers_are_sent_and_failures_counted(tmp_path, capsys):
+    cache, _ = make_cache(tmp_path, min_plays=1)
+
+    cache.record_play("Song by X", "https://stream.example/a", {"User-Agent": "blocked"}).result()
+
+    assert cache.stats["failed"] == 1
+    assert "403" in capsys.readouterr().out
+    assert cache.path_for("Song by X") is None
+
+
+def test_shutdown_stops_a_running_download(tmp_path):
+    def slow_body():
+        for _ in range(100):
+            time.sleep(0.05)
+            yield b"\x00" * 64 * 1024
+
+    cache = AudioCache(tmp_path / "audio", min_plays=1, transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, content=slow_body(), headers={"content-type": "audio/webm"})
+    ))
+    download = cache.record_play("Song by X", "https://stream.example/a")
+    time.sleep(0.2)
+    start = time.monotonic()
+    cache.shutdown()
+    download.result(timeout=1)
+
+    assert time.monotonic() - start < 1
+    assert cache.stats["failed"] == 0
+    assert list((tmp_path / "audio").glob(".*.part")) == []
+
+
+def test_truncated_download_is_discarded(tmp_path):
+    cache, _ = make_cache(tmp_path, min_plays=1, headers={"content-length": str(len(AUDIO) + 10)})
+
+    cache.record_play("Song by X", "https://stream.example/a").result()
+
+    assert cache.path_for("Song by X") is None
+    assert cache.stats["failed"] == 1
+    assert list((tmp_path / "audio").iterdir()) == [tmp_path / "audio" / "index.db"]
+
+
+def test_corrupt_file_is_dropped(tmp_path):
+    cache, _ = make_cache(tmp_path, min_plays=1)
+    cache.record_play("Song by X", "https://stream.example/a").result()
+    path = cache.path_for("Song by X")
+
+    with open(path, "r+b") as f:
+        f.write(b"\xff\xff")  # Same size, different content
+
+    assert cache.path_for("Song by X") is None  # The mtime changed
+    assert cache.stats["corrupt"] == 1
+    assert cache.record_play("Song by X", "https://stream.example/a") is not None
+
+
+def test_corruption_behind_an_unchanged_mtime_is_caught_in_the_background(tmp_path):
+    cache, _ = make_cache(tmp_path, min_plays=1)
+    cache.record_play("Song by X", "https://stream.example/a").result()
+    path = cache.path_for("Song by X")
+
+    stat = os.stat(path)
+    with open(path, "r+b") as f:
+        f.write(b"\xff\xff")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    cache._verified.clear()  # A new session
+
+    assert cache.path_for("Song by X") == path  # Served right away, the hash runs behind it
+    cache._executor.submit(lambda: None).result()
+    assert cache.path_for("Song by X") is None
+    assert cache.stats["corrupt"] == 1
+
+
+@pytest.mark.parametrize("policy, evicted", [("lfu", "b"), ("lru", "a")])
+def test_eviction_keeps_within_budget(tmp_path, policy, evicted):
+    cache, _ = make_cache(tmp_path, min_plays=1, max_bytes=len(AUDIO) * 2, policy=policy)
+    cache.record_play("a", "https://stream.example/a").result()
+    cache.record_play("a", "https://stream.example/a")  # More frequent, but older
+    cache.record_play("b", "https://stream.example/b").result()
+    cache.record_play("c", "https://stream.example/c").result()
+
+    assert cache.total_bytes() <= cache.max_bytes
+    assert cache.path_for(evicted) is None
+    assert cache.path_for("c") is not None
+    assert cache.stats["evictions"] == 1
+
+
+def test_music_player_plays_cached_copy(music_player, tmp_path):
+    cache, _ = make_cache(tmp_path, min_plays=1)
+    url = "https://stream.example/a"
+    cache.record_play("Song by X", url).result()
+    music_player.audio_cache = cache
+
+    assert music_player.play(url)
+
+    assert music_player.current_track == url
+    assert music_player.player.media.path == cache.path_for("Song by X")
@@ -0,0 +1,85 @@
+import time
+from ethos.history import HistoryLog, ListeningHistory
+from ethos.store import UserStore
+
+NOW = time.mktime((2026, 10, 14, 12, 0, 0, 0, 0, -1))
+
+
+def test_aggregates_are_updated_incrementally(tmp_path):
+    history = ListeningHistory(UserStore(tmp_path))
+    history.record("A by X", "search", 200, played_at=NOW)
+    history.record("A by X", "queue", 100, played_at=NOW)
+    history.record("B by X", "queue", 50, played_at=NOW)
+    history.record("C by Y", "search", 30, played_at=NOW - 40 * 86400)
+
+    assert history.top_tracks("week", at=NOW) == [("A by X", 2), ("B by X", 1)]
+    assert history.top_artists("week", at=NOW) == [("X", 3)]
+    assert history.total_listening("day", at=NOW) == (3, 350.0)
+    assert history.total_listening("all") == (4, 380.0)
+
+
+def test_log_rotates_and_rebuilds_after_corruption(tmp_path):
+    store = UserStore(tmp_path)
+    history = ListeningHistory(store, HistoryLog(tmp_path / "history", max_bytes=200))
+    for i in range(10):
+        history.record(f"Song {i % 3} by X", "search", 60, played_at=NOW)
+    assert len(history.log.segments()) > 1
+
+    with open(history.log.log_file, "a") as file:
+        file.write('{"track": "half writ')  # Crash in the middle of a write
+    store.db.execute("UPDATE listening_stats SET plays = 0")
+
+    assert history.rebuild() == 10
+    assert history.top_tracks("all", limit=1) == [("Song 0 by X", 4)]
+    assert history.total_listening("all") == (10, 600.0)
+
+
+def test_resolver_tier_is_logged(tmp_path):
+    history = ListeningHistory(UserStore(tmp_path), HistoryLog(tmp_path / "history"))
+    history.record("A by X", "search", 200, played_at=NOW, tier="local", resolve_seconds=0.0042)
+    history.record("B by X", "queue", 100, played_at=NOW)
+
+    first, second = history.log.entries()
+    assert (first["tier"], first["resolve_ms"]) == ("local", 4)
+    assert "tier" not in second
+
+
+def test_play_after_truncated_line_survives_rebuild(tmp_path):
+    store = UserStore(tmp_path)
+    history = ListeningHistory(store, HistoryLog(tmp_path / "history"))
+    history.record("A by X", "search", 60, played_at=NOW)
+    with open(history.log.log_file, "r+") as file:
+        file.truncate(file.seek(0, 2) - 5)  # Crash in the middle of writing A
+    history.record("B by X", "search", 30, played_at=NOW)
+
+    assert history.rebuild() == 1
+    assert history.top_tracks("all") == [("B by X", 1)]
+
+
+def test_rotation_keeps_only_the_newest_segments(tmp_path):
+    log = HistoryLog(tmp_path, max_bytes=100, max_segments=3)
+    for i in range(20):
+        log.append({"track": f"Song {i} by X", "played_at": NOW, "listened": 60})
+
+    rotated = log.segments()[:-1]
+    assert len(rotated) == 3
+    assert [entry["track"] for entry in log.entries()][-1] == "Song 19 by X"
+    assert rotated[-1].name == f"plays.log.{int(rotated[0].suffix[1:]) + 2}"
+
+
+def test_rebuild_keeps_the_buckets_of_dropped_segments(tmp_path):
+    store = UserStore(tmp_path)
+    history = ListeningHistory(store, HistoryLog(tmp_path / "history", max_bytes=200, max_segments=1))
+    old = NOW - 60 * 86400
+    for i in range(10):
+        history.record("Old by X", "search", 60, played_at=old + i)
+    for i in range(3):
+        history.record("New by Y", "search", 30, played_at=NOW + i)
+    assert not history.log.complete()
+    assert [entry["track"] for entry in history.log.entries()][0] == "New by Y"
+
+    history.rebuild()
+
+    assert history.total_listening("all") == (13, 690.0)
+    assert history.total_listening("month", at=old) == (10, 600.0)
+    assert history.total_listening("day", at=NOW) == (3, 90.0)
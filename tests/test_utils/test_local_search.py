@@ -0,0 +1,143 @@
+import random
+import statistics
+import string
+import time
+from ethos.library import LibraryIndex
+from ethos.local_search import LocalSearch, normalize, trigrams
+
+
+TRACKS = [
+    ("/music/The Weeknd/After Hours/01 Blinding Lights.mp3", "Blinding Lights", "The Weeknd"),
+    ("/music/The Weeknd/After Hours/02 Save Your Tears.mp3", "Save Your Tears", "The Weeknd"),
+    ("/music/Beyoncé/Halo.flac", "Halo", "Beyoncé"),
+    ("/music/untagged/daft_punk-around_the_world.mp3", None, None),
+]
+
+
+def make_search():
+    search = LocalSearch()
+    search.rebuild(TRACKS)
+    return search
+
+
+def test_normalize_and_trigrams():
+    assert normalize("  Beyoncé -- HALO!! ") == "beyonce halo"
+    assert trigrams("ab") == {" ab", "ab "}
+    assert trigrams("") == set()
+
+
+def test_exact_and_fuzzy_matches():
+    search = make_search()
+
+    assert search.search("blinding lights")[0].display == "Blinding Lights by The Weeknd"
+    hit = search.search("blindng lihgts weeknd")[0]
+    assert hit.path == TRACKS[0][0]
+    assert 0 < hit.score < 1
+
+
+def test_matches_artist_accents_and_file_names():
+    search = make_search()
+
+    assert search.search("beyonce")[0].display == "Halo by Beyoncé"
+    hit = search.search("around the world daft punk")[0]
+    assert hit.display == "daft_punk-around_the_world"
+    assert hit.score == 1.0
+
+
+def test_limit_and_minimum_score():
+    search = make_search()
+
+    assert len(search.search("weeknd", k=1)) == 1
+    assert {hit.display for hit in search.search("the weeknd", min_score=0.9)} == {
+        "Blinding Lights by The Weeknd", "Save Your Tears by The Weeknd",
+    }
+    assert search.search("completely unrelated words", min_score=0.75) == []
+    assert LocalSearch().search("anything") == []
+
+
+def test_rebuild_from_library_index(tmp_path):
+    music = tmp_path / "music"
+    music.mkdir()
+    (music / "Some Artist - Some Song.mp3").write_bytes(b"not really audio")
+    index = LibraryIndex(tmp_path / "library.db")
+    index.scan(music)
+    search = LocalSearch()
+
+    search.rebuild(index.tracks(music))
+
+    assert len(search) == 1
+    assert search.search("some song")[0].path == str(music / "Some Artist - Some Song.mp3")
+
+
+def test_update_indexes_only_what_changed():
+    search = make_search()
+    added = ("/music/new/Levitating.mp3", "Levitating", "Dua Lipa")
+    retagged = (TRACKS[3][0], "Around the World", "Daft Punk")
+
+    search.update([TRACKS[0], TRACKS[2], retagged, added])
+
+    assert len(search) == 4
+    assert search.search("levitating")[0].path == added[0]
+    assert search.search("around the world")[0].display == "Around the World by Daft Punk"
+    assert search.search("save your tears", min_score=0.8) == []
+    assert search.search("blinding lights")[0].path == TRACKS[0][0]
+
+
+def test_search_does_not_wait_for_writers():
+    search = make_search()
+
+    with search._lock:  # A long update holds the writer lock
+        assert search.search("blinding lights")[0].path == TRACKS[0][0]
+
+
+def test_update_compacts_removed_tracks():
+    search = LocalSearch()
+    many = [(f"/music/filler/{i}.mp3", f"Filler {i}", "Nobody") for i in range(2000)]
+    search.rebuild(TRACKS + many)
+
+    search.update(TRACKS[:2])
+
+    assert len(search) == 2
+    assert len(search._index.docs) == 2  # Renumbered instead of keeping 2002 tombstones
+    assert search.search("filler nobody", min_score=0.5) == []
+    assert search.search("save your tears")[0].path == TRACKS[1][0]
+
+
+def test_apply_changes_only_the_given_tracks():
+    search = make_search()
+    retagged = (TRACKS[3][0], "Around the World", "Daft Punk")
+    added = ("/music/new/Levitating.mp3", "Levitating", "Dua Lipa")
+
+    search.apply([retagged, added, TRACKS[0]], removed=[TRACKS[1][0], "/music/never/indexed.mp3"])
+
+    assert len(search) == 4
+    assert search.search("levitating")[0].path == added[0]
+    assert search.search("around the world")[0].display == "Around the World by Daft Punk"
+    assert search.search("save your tears", min_score=0.8) == []
+    assert len(search._index.docs) == 6  # The unchanged track kept its doc
+
+
+def test_search_and_apply_latency_on_a_large_library():
+    rng = random.Random(1)
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))) for _ in range(20000)]
+
+    def name(n):
+        return " ".join(rng.choice(words) for _ in range(n))
+
+    tracks = [(f"/music/{name(1)}/{name(3)}.mp3", name(3).title(), name(2).title()) for _ in range(50000)]
+    search = LocalSearch()
+    search.rebuild(tracks)
+    queries = [(f"{title} {artist}", path) for path, title, artist in rng.sample(tracks, 50)]
+
+    timings = []
+    for query, path in queries:
+        start = time.perf_counter()
+        hits = search.search(query, k=10)
+        timings.append(time.perf_counter() - start)
+        assert hits[0].path == path
+    assert statistics.median(timings) < 0.005
+
+    start = time.perf_counter()
+    search.apply([("/music/new/Single File.mp3", "Single File", "Someone")], removed=[queries[0][1]])
+    assert time.perf_counter() - start < 0.05  # Independent of the library size
+    assert search.search("single file someone")[0].path == "/music/new/Single File.mp3"
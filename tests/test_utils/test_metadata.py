@@ -0,0 +1,153 @@
+import struct
+
+from ethos.library import LibraryIndex
+from ethos.tools.metadata import read_metadata
+
+
+def id3v2(**frames):
+    body = b""
+    for frame_id, text in frames.items():
+        data = b"\x03" + text.encode()
+        body += frame_id.encode() + struct.pack(">I", len(data)) + b"\x00\x00" + data
+    body += b"\x00" * 32  # Padding
+    size = len(body)
+    synchsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x03\x00\x00" + synchsafe + body
+
+
+def write_mp3(path, seconds=2, tag=b""):
+    # MPEG1 layer III, 128 kbps, 44.1 kHz, joint stereo: 417 byte frames of 1152 samples
+    frame = b"\xff\xfb\x90\x44" + b"\x00" * 413
+    frames = round(seconds * 44100 / 1152)
+    path.write_bytes(tag + frame * frames)
+    return frames
+
+
+def test_mp3_cbr_with_id3v2(tmp_path):
+    path = tmp_path / "song.mp3"
+    write_mp3(path, tag=id3v2(TIT2="Blinding Lights", TPE1="The Weeknd", TALB="After Hours"))
+
+    info = read_metadata(str(path))
+
+    assert abs(info['duration_ms'] - 2000) < 30
+    assert info['bitrate'] == 128
+    assert info['sample_rate'] == 44100
+    assert (info['title'], info['artist'], info['album']) == ("Blinding Lights", "The Weeknd", "After Hours")
+
+
+def test_mp3_xing_frame_count_and_id3v1(tmp_path):
+    path = tmp_path / "vbr.mp3"
+    xing = b"\xff\xfb\x90\x44" + b"\x00" * 32 + b"Xing" + struct.pack(">II", 3, 1000) + struct.pack(">I", 400000)
+    id3v1 = b"TAG" + b"Title".ljust(30, b"\x00") + b"Artist".ljust(30, b"\x00") + b"Album".ljust(30, b"\x00")
+    path.write_bytes(xing.ljust(417, b"\x00") + b"\xff\xfb\x90\x44" + b"\x00" * 1000 + id3v1.ljust(128, b"\x00"))
+
+    info = read_metadata(str(path))
+
+    assert info['duration_ms'] == 1000 * 1152 * 1000 // 44100
+    assert info['bitrate'] == round(400000 * 8 / info['duration_ms'])
+    assert (info['title'], info['artist'], info['album']) == ("Title", "Artist", "Album")
+
+
+def test_wav_with_info_chunk(tmp_path):
+    path = tmp_path / "song.wav"
+    fmt = struct.pack("<HHIIHH", 1, 2, 48000, 48000 * 4, 4, 16)
+    info_body = b"INFO" + b"INAM" + struct.pack("<I", 5) + b"Name\x00" + b"\x00"
+    data = b"\x00" * (48000 * 4 * 3)
+    chunks = (b"fmt " + struct.pack("<I", len(fmt)) + fmt
+              + b"LIST" + struct.pack("<I", len(info_body)) + info_body
+              + b"data" + struct.pack("<I", len(data)) + data)
+    path.write_bytes(b"RIFF" + struct.pack("<I", 4 + len(chunks)) + b"WAVE" + chunks)
+
+    info = read_metadata(str(path))
+
+    assert info['duration_ms'] == 3000
+    assert info['sample_rate'] == 48000
+    assert info['bitrate'] == 1536
+    assert info['title'] == "Name"
+
+
+def test_flac_streaminfo_and_vorbis_comment(tmp_path):
+    path = tmp_path / "song.flac"
+    packed = (44100 << 44) | (1 << 41) | (15 << 36) | (44100 * 4)
+    streaminfo = b"\x00" * 10 + struct.pack(">Q", packed) + b"\x00" * 16
+    comments = [b"ARTIST=Someone", b"title=Something"]
+    vorbis = struct.pack("<I", 3) + b"abc" + struct.pack("<I", len(comments))
+    vorbis += b"".join(struct.pack("<I", len(c)) + c for c in comments)
+    path.write_bytes(
+        b"fLaC"
+        + bytes([0]) + len(streaminfo).to_bytes(3, "big") + streaminfo
+        + bytes([0x84]) + len(vorbis).to_bytes(3, "big") + vorbis
+        + b"\x00" * 1000
+    )
+
+    info = read_metadata(str(path))
+
+    assert info['duration_ms'] == 4000
+    assert info['sample_rate'] == 44100
+    assert (info['title'], info['artist'], info['album']) == ("Something", "Someone", None)
+
+
+def test_flac_with_damaged_vorbis_comment(tmp_path):
+    path = tmp_path / "song.flac"
+    packed = (44100 << 44) | (1 << 41) | (15 << 36) | (44100 * 4)
+    streaminfo = b"\x00" * 10 + struct.pack(">Q", packed) + b"\x00" * 16
+    vorbis = struct.pack("<I", 0) + struct.pack("<I", 1) + struct.pack("<I", 14) + b"ARTIST=Someone"
+    damaged = struct.pack("<I", 1000) + b"vendor"  # Vendor length past the end of the block
+    path.write_bytes(
+        b"fLaC"
+        + bytes([0]) + len(streaminfo).to_bytes(3, "big") + streaminfo
+        + bytes([0x04]) + len(vorbis).to_bytes(3, "big") + vorbis
+        + bytes([0x84]) + len(damaged).to_bytes(3, "big") + damaged
+    )
+
+    info = read_metadata(str(path))
+
+    assert info['duration_ms'] == 4000
+    assert (info['title'], info['artist']) == (None, "Someone")
+
+
+def atom(kind, body):
+    return struct.pack(">I", 8 + len(body)) + kind + body
+
+
+def test_m4a_with_moov_after_mdat(tmp_path):
+    path = tmp_path / "song.m4a"
+    mvhd = atom(b"mvhd", b"\x00" * 12 + struct.pack(">II", 1000, 5500) + b"\x00" * 80)
+    entry = atom(b"mp4a", b"\x00" * 16 + b"\x00\x02\x00\x10\x00\x00\x00\x00" + struct.pack(">I", 44100 << 16))
+    stsd = atom(b"stsd", b"\x00" * 4 + struct.pack(">I", 1) + entry)
+    trak = atom(b"trak", atom(b"mdia", atom(b"minf", atom(b"stbl", stsd + atom(b"stco", b"\x00" * 8)))))
+    title = atom(b"\xa9nam", atom(b"data", b"\x00\x00\x00\x01\x00\x00\x00\x00" + b"Song"))
+    meta = atom(b"meta", b"\x00" * 4 + atom(b"hdlr", b"\x00" * 25) + atom(b"ilst", title))
+    moov = atom(b"moov", mvhd + trak + atom(b"udta", meta))
+    path.write_bytes(atom(b"ftyp", b"M4A \x00\x00\x00\x00") + atom(b"mdat", b"\x00" * 5000) + moov)
+
+    info = read_metadata(str(path))
+
+    assert info['duration_ms'] == 5500
+    assert info['sample_rate'] == 44100
+    assert info['title'] == "Song"
+
+
+def test_unparseable_files(tmp_path):
+    garbage = tmp_path / "broken.mp3"
+    garbage.write_bytes(b"not audio at all")
+    other = tmp_path / "notes.txt"
+    other.write_text("hello")
+
+    assert read_metadata(str(garbage)) is None
+    assert read_metadata(str(other)) is None
+    assert read_metadata(str(tmp_path / "missing.flac")) is None
+
+
+def test_library_index_stores_metadata(tmp_path):
+    music = tmp_path / "music"
+    music.mkdir()
+    path = music / "song.mp3"
+    write_mp3(path, tag=id3v2(TIT2="Title", TPE1="Artist"))
+    index = LibraryIndex(tmp_path / "library.db")
+
+    index.scan(music)
+    entry = index.get(str(path))
+
+    assert entry['title'] == "Title" and entry['artist'] == "Artist"
+    assert entry['bitrate'] == 128 and entry['duration_ms'] > 1900
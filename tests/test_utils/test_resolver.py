@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import CancelledError, TimeoutError
+import pytest
+from ethos import resolver
+from ethos.resolver import PoolBusy, ResolverPool
+
+
+class SlowYoutubeDL:
+    instances = 0
+    release = threading.Event()
+
+    def __init__(self, opts):
+        SlowYoutubeDL.instances += 1
+
+    def extract_info(self, target, download=False):
+        SlowYoutubeDL.release.wait(timeout=5)
+        return {"entries": [{"id": target, "url": f"https://stream/{target}", "http_headers": {"User-Agent": "yt"}}]}
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    SlowYoutubeDL.instances = 0
+    SlowYoutubeDL.release = threading.Event()
+    monkeypatch.setattr(resolver, "YoutubeDL", SlowYoutubeDL)
+    pool = ResolverPool(workers=1, timeout=0.05, processes=False)
+    yield pool
+    SlowYoutubeDL.release.set()
+    pool.shutdown()
+
+
+def test_extractor_is_reused(pool):
+    SlowYoutubeDL.release.set()
+    assert pool.extract("a", timeout=5) == {"id": "a", "url": "https://stream/a", "headers": {"User-Agent": "yt"}}
+    assert pool.extract("b", timeout=5)["url"] == "https://stream/b"
+    assert SlowYoutubeDL.instances == 1
+
+
+def test_shutdown_wakes_up_waiting_callers(pool):
+    errors = []
+
+    def extract():
+        try:
+            pool.extract("a", timeout=5)
+        except CancelledError as e:
+            errors.append(e)
+
+    waiter = threading.Thread(target=extract)
+    waiter.start()
+    time.sleep(0.05)
+    pool.shutdown()
+    waiter.join(timeout=1)
+
+    assert not waiter.is_alive()
+    assert errors
+
+
+def test_timeout_cancels_queued_request(pool):
+    running = pool.submit("busy")
+    with pytest.raises(TimeoutError):
+        pool.extract("queued")
+    queued = pool.submit("other")
+    assert queued.cancel()
+    SlowYoutubeDL.release.set()
+    assert running.result(timeout=5)["id"] == "busy"
+
+
+def test_extract_async(pool):
+    SlowYoutubeDL.release.set()
+    result = asyncio.run(pool.extract_async("a", timeout=5))
+    assert result["url"] == "https://stream/a"
+
+
+def test_background_requests_only_take_an_idle_worker(pool):
+    running = pool.submit("busy")
+    with pytest.raises(PoolBusy):
+        pool.extract("speculative", background=True)
+    SlowYoutubeDL.release.set()
+    running.result(timeout=5)
+    deadline = time.time() + 2
+    while pool._pending and time.time() < deadline:
+        time.sleep(0.01)  # The worker is released by a done callback, after the result is set
+    assert pool.extract("speculative", timeout=5, background=True)["id"] == "speculative"
+
+
+def test_background_requests_leave_a_worker_to_the_user(monkeypatch):
+    monkeypatch.setattr(resolver, "YoutubeDL", SlowYoutubeDL)
+    SlowYoutubeDL.release = threading.Event()
+    pool = ResolverPool(workers=2, timeout=5, processes=False)
+    try:
+        speculative = pool.submit("a", background=True)
+        with pytest.raises(PoolBusy):
+            pool.submit("b", background=True)
+        picked = pool.submit("c")
+        SlowYoutubeDL.release.set()
+        assert picked.result(timeout=5)["id"] == "c"
+        assert speculative.result(timeout=5)["id"] == "a"
+    finally:
+        SlowYoutubeDL.release.set()
+        pool.shutdown()
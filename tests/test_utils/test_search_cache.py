@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+from ethos.search_cache import SearchCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SearchCache(tmp_path / "search.db", memory_entries=2)
+
+
+def test_memory_and_disk_tiers(cache, tmp_path):
+    cache.put("After Hours", ["a"])
+    assert cache.get("after  hours") == ["a"]
+    assert cache.stats["memory_hits"] == 1
+
+    reloaded = SearchCache(tmp_path / "search.db")
+    assert reloaded.get("After Hours") == ["a"]
+    assert reloaded.get("After Hours") == ["a"]
+    assert reloaded.stats == {"memory_hits": 1, "disk_hits": 1, "misses": 0, "coalesced": 0}
+
+
+def test_lru_eviction_and_ttl(tmp_path):
+    cache = SearchCache(tmp_path / "search.db", memory_entries=2, ttl=-1)
+    cache.put("one", [1])
+    assert cache.get("one") is None
+    assert cache.stats["misses"] == 1
+
+    cache = SearchCache(tmp_path / "search.db", memory_entries=2)
+    for query in ("one", "two", "three"):
+        cache.put(query, [query])
+    assert list(cache._memory) == ["two", "three"]
+
+
+def test_in_flight_queries_are_coalesced(cache):
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return ["result"]
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_fetch("same query", fetch) for _ in range(3)))
+
+    assert asyncio.run(run()) == [["result"]] * 3
+    assert len(calls) == 1
+    assert cache.stats["coalesced"] == 2
@@ -0,0 +1,64 @@
+import threading
+
+from ethos.speculation import SpeculativeResolver
+from ethos.track_resolver import Resolution
+
+
+def resolved(track):
+    return Resolution(track, f"https://{track}", "yt-dlp", 0.0)
+
+
+def test_picked_result_is_handed_over():
+    calls = []
+    speculator = SpeculativeResolver(lambda track: calls.append(track) or resolved(track), depth=2)
+
+    speculator.speculate(["a", "b", "c"])
+    resolution = speculator.take("a")
+    speculator.executor.shutdown(wait=True)
+
+    assert resolution == resolved("a")
+    assert "a" in calls and "c" not in calls
+    assert speculator.stats["started"] == 2
+    assert speculator.stats["used"] == 1
+    assert speculator.stats["used"] + speculator.stats["wasted"] + speculator.stats["cancelled"] == 2
+
+
+def test_unspeculated_pick_returns_none():
+    speculator = SpeculativeResolver(resolved, depth=1)
+    speculator.speculate(["a", "b"])
+
+    assert speculator.take("b") is None
+
+
+def test_new_command_cancels_pending_work():
+    release = threading.Event()
+    started = threading.Event()
+
+    def resolve(track):
+        started.set()
+        release.wait(5)
+        return resolved(track)
+
+    speculator = SpeculativeResolver(resolve, depth=1)
+    speculator.speculate(["a"])
+    started.wait(5)
+    speculator.speculate(["b"])  # "b" queues behind the running "a"
+    speculator.cancel()
+    release.set()
+    speculator.executor.shutdown(wait=True)
+
+    assert speculator.stats == {"started": 2, "used": 0, "wasted": 1, "cancelled": 1}
+    assert speculator.wasted_ratio == 1.0
+
+
+def test_failed_speculation_counts_as_wasted():
+    def resolve(track):
+        raise RuntimeError("offline")
+
+    speculator = SpeculativeResolver(resolve, depth=1)
+    speculator.speculate(["a"])
+    speculator.executor.shutdown(wait=True)
+
+    assert speculator.take("a") is None
+    assert speculator.stats["wasted"] == 1
+    assert "1 wasted (100%)" in speculator.summary()
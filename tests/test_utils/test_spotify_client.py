@@ -0,0 +1,218 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import httpx
+import pytest
+from ethos import utils
+from ethos.spotify_client import RateLimiter, SpotifyClient, TokenCache
+
+
+def fake_spotify(requests):
+    """Mock transport answering like the Spotify API and recording every request"""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.url.path == "/api/token":
+            return httpx.Response(200, json={"access_token": "token", "expires_in": 3600})
+        if request.url.path == "/v1/search":
+            item = {"id": "id1", "name": request.url.params["q"], "artists": [{"name": "Artist"}]}
+            return httpx.Response(200, json={"tracks": {"items": [item]}, "artists": {"items": [item]}})
+        return httpx.Response(404, json={"error": "not found"})
+
+    return httpx.MockTransport(handler)
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    requests = []
+    monkeypatch.setattr(utils, "spotify_client", SpotifyClient(transport=fake_spotify(requests)))
+    return requests
+
+
+def test_helpers_share_one_client(requests):
+    async def run():
+        token = await utils.get_spotify_token("id", "secret")
+        client = utils.spotify_client.client
+        tracks = await utils.search_tracks_from_spotify("after hours", token)
+        song_id = await utils.search_song_id_from_spotify("after hours", token)
+        assert utils.spotify_client.client is client
+        await utils.spotify_client.aclose()
+        return token, tracks, song_id
+
+    token, tracks, song_id = asyncio.run(run())
+    assert token == "token"
+    assert tracks[0]["name"] == "after hours"
+    assert song_id == "id1"
+    assert requests[1].headers["Authorization"] == "Bearer token"
+    assert requests[2].url.params["limit"] == "1"
+
+
+def test_client_of_a_previous_loop_is_closed(requests):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    async def client():
+        return utils.spotify_client.client
+
+    try:
+        stale = asyncio.run_coroutine_threadsafe(client(), loop).result(timeout=5)
+        fresh = asyncio.run(client())
+        deadline = time.time() + 2
+        while not stale.is_closed and time.time() < deadline:
+            time.sleep(0.01)  # Closed on its own loop
+        assert fresh is not stale
+        assert stale.is_closed
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+
+
+def test_errors_are_raised(requests):
+    with pytest.raises(Exception, match="Failed to get track data"):
+        asyncio.run(utils.get_track_image("missing", "token"))
+
+
+def test_token_is_cached_and_refreshed_once(requests):
+    async def run():
+        tokens = await asyncio.gather(*(utils.get_spotify_token("id", "secret") for _ in range(5)))
+        await utils.get_spotify_token("id", "secret")
+        return tokens
+
+    assert asyncio.run(run()) == ["token"] * 5
+    assert [request.url.path for request in requests] == ["/api/token"]
+
+
+def test_token_refreshes_in_background_near_expiry():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return {"access_token": f"token{len(calls)}", "expires_in": 3600}
+
+    async def run():
+        cache = TokenCache(fetch, "id")
+        assert await cache.get() == "token1"
+        cache.expires_at = time.time() + 120  # Inside the background window
+        assert await cache.get() == "token1"
+        await asyncio.sleep(0)
+        assert await cache.get() == "token2"
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_token_persists_on_disk(tmp_path):
+    async def fetch():
+        return {"access_token": "disk-token", "expires_in": 3600}
+
+    async def fail():
+        raise AssertionError("should not fetch")
+
+    asyncio.run(TokenCache(fetch, "id", tmp_path / "token.json").get())
+    assert asyncio.run(TokenCache(fail, "id", tmp_path / "token.json").get()) == "disk-token"
+    assert TokenCache(fail, "other-id", tmp_path / "token.json").token is None
+
+
+class FlakySpotifyHandler(BaseHTTPRequestHandler):
+    """Local fake server that throttles and fails before answering"""
+    responses = []
+    hits = 0
+    tokens = 0
+    authorizations = []
+
+    def do_POST(self):
+        FlakySpotifyHandler.tokens += 1
+        body = json.dumps({"access_token": f"token{FlakySpotifyHandler.tokens}", "expires_in": 3600}).encode()
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        FlakySpotifyHandler.hits += 1
+        FlakySpotifyHandler.authorizations.append(self.headers["Authorization"])
+        status, headers = FlakySpotifyHandler.responses.pop(0) if FlakySpotifyHandler.responses else (200, {})
+        body = json.dumps({"tracks": {"items": []}}).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_server():
+    FlakySpotifyHandler.hits = FlakySpotifyHandler.tokens = 0
+    FlakySpotifyHandler.authorizations = []
+    server = HTTPServer(("127.0.0.1", 0), FlakySpotifyHandler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+
+
+def test_retries_throttled_and_transient_errors(fake_server):
+    FlakySpotifyHandler.responses = [(429, {"Retry-After": "0.05"}), (503, {}), (200, {})]
+    client = SpotifyClient(api_url=fake_server, backoff_base=0.01)
+
+    async def run():
+        start = time.monotonic()
+        response = await client.get("/search", "token", params={"q": "song"})
+        await client.aclose()
+        return response, time.monotonic() - start
+
+    response, elapsed = asyncio.run(run())
+    assert response.status_code == 200
+    assert FlakySpotifyHandler.hits == 3
+    assert elapsed >= 0.05  # Retry-After was honoured
+
+
+def test_gives_up_after_max_retries(fake_server):
+    FlakySpotifyHandler.responses = [(500, {})] * 3
+    client = SpotifyClient(api_url=fake_server, max_retries=2, backoff_base=0.01)
+
+    async def run():
+        response = await client.get("/search", "token")
+        await client.aclose()
+        return response
+
+    assert asyncio.run(run()).status_code == 500
+    assert FlakySpotifyHandler.hits == 3
+
+
+def test_rejected_token_is_refreshed_once(fake_server):
+    FlakySpotifyHandler.responses = [(401, {}), (200, {}), (401, {}), (401, {})]
+    client = SpotifyClient(api_url=fake_server, token_url=fake_server.replace("/v1", "/api/token"))
+
+    async def run():
+        token = await client.access_token("id", "secret")
+        first = await client.get("/search", token)
+        second = await client.get("/search", await client.access_token("id", "secret"))
+        await client.aclose()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first.status_code == 200
+    assert second.status_code == 401  # Retried once, then given up
+    assert FlakySpotifyHandler.authorizations == ["Bearer token1", "Bearer token2", "Bearer token2", "Bearer token3"]
+
+
+def test_rate_limiter_spaces_out_requests():
+    limiter = RateLimiter(rate=100, burst=2)
+
+    async def run():
+        start = time.monotonic()
+        for _ in range(6):
+            await limiter.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.035
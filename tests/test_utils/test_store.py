@@ -0,0 +1,92 @@
+import json
+from ethos.store import UserStore
+
+
+def test_recents_are_distinct_and_newest_first(tmp_path):
+    store = UserStore(tmp_path)
+    for track in ("A by X", "B by Y", "A by X", "Intro"):
+        store.add_play(track)
+    assert store.recent_tracks(10) == ["Intro", "A by X", "B by Y"]
+    assert store.db.execute("SELECT COUNT(*) FROM play_history").fetchone()[0] == 4
+
+
+def test_add_to_playlist_prepends(tmp_path):
+    store = UserStore(tmp_path)
+    store.add_to_playlist("mix", "First", "X")
+    store.add_to_playlist("mix", "Second", "Y")
+    store.add_to_playlist("mix", "Last", "Z", prepend=False)
+    assert [track["name"] for track in store.playlist_tracks("mix")] == ["Second", "First", "Last"]
+    assert store.db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_files_are_migrated_once(tmp_path):
+    userfiles = tmp_path / "userfiles"
+    (userfiles / "playlists").mkdir(parents=True)
+    (userfiles / "recents.txt").write_text("Newest by X\nOlder by Y\n")
+    (userfiles / "playlists" / "mine.json").write_text(json.dumps([{"name": "Song", "artist": "Z"}]))
+    (tmp_path / "Imported.json").write_text(json.dumps([{"id": "sp1", "name": "Hit", "artist": "W"}]))
+
+    store = UserStore(tmp_path)
+    assert store.recent_tracks() == ["Newest by X", "Older by Y"]
+    assert store.playlist_names() == ["Imported", "mine"]
+    assert store.playlist_tracks("Imported") == [{"id": "sp1", "name": "Hit", "artist": "W"}]
+    store.close()
+
+    assert UserStore(tmp_path).recent_tracks() == ["Newest by X", "Older by Y"]
+
+
+def test_tracks_are_identified_by_spotify_id(tmp_path):
+    store = UserStore(tmp_path)
+    store.replace_playlist("mix", [
+        {"id": "sp1", "name": "Intro", "artist": "X"},
+        {"id": "sp2", "name": "Intro", "artist": "X"},  # Same title on another album
+        {"id": "sp1", "name": "Intro (Remastered)", "artist": "X"},
+    ])
+    store.add_to_playlist("mix", "Intro", "X", prepend=False)
+
+    assert [track["id"] for track in store.playlist_tracks("mix")] == ["sp1", "sp2", "sp1", None]
+    assert store.db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0] == 3
+
+
+def test_imported_playlists_are_identified_by_spotify_id(tmp_path):
+    store = UserStore(tmp_path)
+    store.replace_playlist("Mix", [{"id": "sp1", "name": "A", "artist": "X"}], "pl1", "s1")
+    store.replace_playlist("Mix", [{"id": "sp2", "name": "B", "artist": "X"}], "pl2", "s1")
+    store.add_to_playlist("Mix", "Added", "Y", prepend=False)
+
+    assert store.playlist_names() == ["Mix", "Mix"]
+    assert [track["name"] for track in store.playlist_tracks(spotify_id="pl1")] == ["A", "Added"]
+    assert [track["name"] for track in store.playlist_tracks(spotify_id="pl2")] == ["B"]
+    assert [track["name"] for track in store.playlist_tracks("Mix")] == ["A", "Added"]
+
+    store.replace_playlist("Renamed", [{"id": "sp1", "name": "A", "artist": "X"}], "pl1", "s2")
+    assert store.playlist_snapshots() == {
+        "pl1": {"name": "Renamed", "snapshot_id": "s2"},
+        "pl2": {"name": "Mix", "snapshot_id": "s1"},
+    }
+    assert store.playlist_names() == ["Mix", "Renamed"]
+
+
+def test_migrated_importer_file_is_adopted_by_its_first_refresh(tmp_path):
+    (tmp_path / "Chill.json").write_text(json.dumps([{"name": "Old", "artist": "X"}]))
+    store = UserStore(tmp_path)
+
+    store.replace_playlist("Chill", [{"id": "sp1", "name": "New", "artist": "X"}], "PLID", "snap1")
+
+    assert store.playlist_names() == ["Chill"]
+    assert [track["name"] for track in store.playlist_tracks("Chill")] == ["New"]
+
+
+def test_refresh_does_not_adopt_a_user_playlist(tmp_path):
+    (tmp_path / "Chill.json").write_text(json.dumps([{"name": "Old", "artist": "X"}]))
+    (tmp_path / "userfiles" / "playlists").mkdir(parents=True)
+    (tmp_path / "userfiles" / "playlists" / "Chill.json").write_text(json.dumps([{"name": "Mine", "artist": "Y"}]))
+    store = UserStore(tmp_path)
+
+    store.replace_playlist("Chill", [{"id": "sp1", "name": "New", "artist": "X"}], "PLID", "snap1")
+
+    assert store.playlist_names() == ["Chill", "Chill"]  # The user's own playlist is left alone
+    assert store.playlist_snapshots() == {"PLID": {"name": "Chill", "snapshot_id": "snap1"}}
+    assert [track["name"] for track in store.playlist_tracks(spotify_id="PLID")] == ["New"]
+    assert [track["name"] for track in store.playlist_tracks("Chill")] == ["Mine"]
+    assert store.db.execute("SELECT COUNT(*) FROM playlists WHERE spotify_id IS NULL AND imported").fetchone()[0] == 0
@@ -0,0 +1,89 @@
+import time
+import pytest
+from ethos import utils, resolver
+from ethos.resolver import ResolverPool
+from ethos.stream_cache import StreamCache
+from ethos.tools.helper import Format
+
+
+class FakeYoutubeDL:
+    """Records which targets were extracted instead of talking to YouTube"""
+    calls = []
+    expire = 0
+
+    def __init__(self, opts):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def extract_info(self, target, download=False):
+        FakeYoutubeDL.calls.append(target)
+        info = {"id": "abc123", "url": f"https://rr1.googlevideo.com/videoplayback?expire={FakeYoutubeDL.expire}"}
+        if target.startswith("https://"):
+            return info
+        return {"entries": [info]}
+
+
+@pytest.fixture
+def fake_ytdl(monkeypatch, tmp_path):
+    FakeYoutubeDL.calls = []
+    FakeYoutubeDL.expire = int(time.time()) + 6 * 3600
+    monkeypatch.setattr(resolver, "YoutubeDL", FakeYoutubeDL)
+    monkeypatch.setattr(utils, "resolver_pool", ResolverPool(processes=False))
+    monkeypatch.setattr(utils, "stream_cache", StreamCache(tmp_path / "streams.json"))
+    return FakeYoutubeDL
+
+
+def test_normalize_and_expiry():
+    assert StreamCache.normalize("  After   Hours BY The Weeknd ") == "after hours by the weeknd"
+    url = "https://rr1.googlevideo.com/videoplayback?id=1&expire=2000000000&ip=1"
+    assert StreamCache.url_expiry(url) == 2000000000 - StreamCache.EXPIRY_MARGIN
+
+
+def test_cache_persists_across_instances(tmp_path):
+    cache = StreamCache(tmp_path / "streams.json")
+    cache.put("Song by Artist", "abc123", "https://example.com/audio?expire=4000000000")
+
+    reloaded = StreamCache(tmp_path / "streams.json")
+    assert reloaded.get_url("song  by artist") == "https://example.com/audio?expire=4000000000"
+    assert reloaded.get("unknown") is None
+
+
+def test_headers_are_kept_with_the_url(tmp_path):
+    cache = StreamCache(tmp_path / "streams.json")
+    cache.put("Song by Artist", "abc123", "https://example.com/audio?expire=4000000000", {"User-Agent": "yt"})
+
+    assert cache.headers_for("https://example.com/audio?expire=4000000000") == {"User-Agent": "yt"}
+    assert cache.headers_for("https://example.com/other") == {}
+
+
+def test_numbered_title_keeps_its_entry(tmp_path):
+    cache = StreamCache(tmp_path / "streams.json")
+    cache.put("1. Outside by Artist official audio", "abc123", "https://example.com/audio?expire=4000000000")
+
+    assert cache.get_url("1. Outside by Artist official audio") == "https://example.com/audio?expire=4000000000"
+    assert cache.get_url("Outside by Artist official audio") is None
+
+
+def test_picked_result_loses_only_its_position():
+    assert Format.strip_position("3. Song by Artist", 3) == "Song by Artist"
+    assert Format.strip_position("1. 1. Outside by Artist", 1) == "1. Outside by Artist"
+    assert Format.strip_position("1. Outside by Artist", 2) == "1. Outside by Artist"
+
+
+def test_get_audio_url_hits_cache(fake_ytdl):
+    first = utils.get_audio_url("Song by Artist official audio")
+    second = utils.get_audio_url("song by artist official audio")
+    assert first == second
+    assert fake_ytdl.calls == ["Song by Artist official audio"]
+
+
+def test_stale_entry_skips_search(fake_ytdl):
+    fake_ytdl.expire = int(time.time())  # Already expired
+    utils.get_audio_url("Song by Artist official audio")
+    utils.get_audio_url("Song by Artist official audio")
+    assert fake_ytdl.calls == ["Song by Artist official audio", "https://www.youtube.com/watch?v=abc123"]
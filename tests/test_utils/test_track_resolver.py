@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ethos.track_resolver import Resolution, TieredResolver, resolve_all
+
+
+def test_first_tier_that_serves_wins():
+    calls = []
+
+    def tier(name, result):
+        def lookup(track):
+            calls.append(name)
+            return result
+        return name, lookup
+
+    resolver = TieredResolver([tier("local", None), tier("cache", "https://cached"), tier("network", "https://fresh")])
+
+    resolution = resolver.resolve("Song by Artist")
+
+    assert (resolution.source, resolution.tier) == ("https://cached", "cache")
+    assert resolution.seconds >= 0
+    assert calls == ["local", "cache"]
+
+
+def test_failing_tier_falls_through():
+    def broken(track):
+        raise OSError("disk gone")
+
+    resolver = TieredResolver([("local", broken), ("network", lambda track: "https://fresh")])
+
+    assert resolver.resolve("Song").tier == "network"
+
+
+def test_nothing_resolves():
+    def broken(track):
+        raise RuntimeError("offline")
+
+    resolver = TieredResolver([("local", lambda track: None), ("network", broken)])
+
+    with pytest.raises(LookupError) as error:
+        resolver.resolve("Song")
+    assert isinstance(error.value.__cause__, RuntimeError)
+
+
+def test_add_tier_before_another():
+    resolver = TieredResolver([("local", lambda t: None), ("network", lambda t: None)])
+    resolver.add_tier("offline", lambda t: "/cache/song.m4a", before="network")
+    resolver.add_tier("last", lambda t: None)
+
+    assert [name for name, _ in resolver.tiers] == ["local", "offline", "network", "last"]
+    assert resolver.resolve("Song").tier == "offline"
+
+
+def test_recorded_plays_are_summarized():
+    resolver = TieredResolver()
+    resolver.record(Resolution("a", "/a.mp3", "local", 0.002))
+    resolver.record(Resolution("b", "/b.mp3", "local", 0.004))
+    resolver.record(Resolution("c", "https://c", "yt-dlp", 2.0))
+
+    assert resolver.stats["local"] == {"plays": 2, "seconds": pytest.approx(0.006), "ahead": 0}
+    assert resolver.summary() == ["local: 2 plays (66%), avg 3 ms", "yt-dlp: 1 plays (33%), avg 2000 ms"]
+
+
+def test_plays_resolved_ahead_keep_their_tier():
+    resolver = TieredResolver()
+    resolver.record(Resolution("a", "https://a", "stream-cache", 0.001, hit="prefetch"))
+    resolver.record(Resolution("b", "https://b", "stream-cache", 0.003))
+
+    assert resolver.stats["stream-cache"]["ahead"] == 1
+    assert resolver.summary() == ["stream-cache: 2 plays (100%), avg 2 ms, 1 resolved ahead"]
+
+
+def test_resolve_all_is_ordered_and_bounded():
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def lookup(track):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02 if track == "0" else 0.001)  # The first track is the slowest
+        with lock:
+            running[0] -= 1
+        return None if track == "3" else f"https://{track}"
+
+    resolver = TieredResolver([("network", lookup)])
+    tracks = [str(i) for i in range(20)]
+
+    async def collect():
+        return [item async for item in resolve_all(resolver, tracks, concurrency=3)]
+
+    results = asyncio.run(collect())
+
+    assert [track for track, _ in results] == tracks
+    assert results[3][1] is None
+    assert results[5][1].source == "https://5"
+    assert peak[0] <= 3
+
+
+def test_resolve_all_first_result_does_not_wait_for_the_rest():
+    release = threading.Event()
+
+    def lookup(track):
+        if track != "first":
+            release.wait(5)
+        return track
+
+    resolver = TieredResolver([("network", lookup)])
+
+    async def first():
+        results = resolve_all(resolver, ["first"] + [f"t{i}" for i in range(50)], concurrency=2)
+        track, resolution = await asyncio.wait_for(results.__anext__(), timeout=1)
+        await results.aclose()
+        release.set()
+        return resolution
+
+    assert asyncio.run(first()).source == "first"